@@ -133,3 +133,36 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Staging de archivos subidos: se guardan por hash y se parsean una sola vez
+UPLOAD_STAGING_DIR = MEDIA_ROOT / 'staging'
+UPLOAD_STAGING_TTL_HOURS = 24
+
+# Tareas en segundo plano (`python manage.py procesar_tareas`).
+# Con JOBS_ASYNC = False las tareas se ejecutan dentro del mismo request.
+JOBS_ASYNC = True
+JOBS_POLL_SECONDS = 2
+JOBS_STALE_HOURS = 6
+
+# Normalización: "keys" resuelve cada valor distinto una vez y escribe por
+# conjuntos; "rows" resuelve fila por fila; "sql" resuelve y escribe todo en la
+# base de datos (JOIN contra una tabla temporal de claves); "parallel" resuelve
+# en NORMALIZATION_WORKERS procesos (None = un proceso por CPU).
+NORMALIZATION_MODE = "keys"
+
+# Filas crudas por ventana (rango de pk); cada ventana se confirma por separado
+# y la memoria depende de este tamaño. None = una sola transacción.
+NORMALIZATION_CHUNK_SIZE = 20000
+NORMALIZATION_WORKERS = None
+
+# Horas que se guarda cada resumen/export del tablero normalizado (la
+# normalización y las limpiezas lo invalidan antes)
+TABLERO_CACHE_TIMEOUT_HOURS = 24
+
+# Cache compartido entre el servidor web y el worker (progreso de tareas, tablero)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+    }
+}
@@ -18,6 +18,7 @@ from .models import (
     MapeoSucursal,
     IgnorarCedis,
     IgnorarSucursal,
+    Tarea,
 )
 
 
@@ -140,7 +141,7 @@ class PlanificacionNormalizadaAdmin(admin.ModelAdmin):
 
 @admin.register(PlanningBatch)
 class PlanningBatchAdmin(admin.ModelAdmin):
-    list_display = ("plan_date", "sheet_name", "source_filename", "created_at")
+    list_display = ("plan_date", "sheet_name", "source_filename", "created_at", "synced_at")
     search_fields = ("sheet_name", "source_filename")
     list_filter = ("plan_date",)
     ordering = ("-plan_date", "-id")
@@ -200,7 +201,7 @@ class PlanificacionNormalizadaSeccionAdmin(admin.ModelAdmin):
 
 
 class PlanningBatchSeccionAdmin(admin.ModelAdmin):
-    list_display = ("plan_date", "sheet_name", "source_filename", "created_at")
+    list_display = ("plan_date", "sheet_name", "source_filename", "created_at", "synced_at")
     search_fields = ("sheet_name", "source_filename")
     list_filter = ("plan_date",)
     ordering = ("-plan_date", "-id")
@@ -312,6 +313,13 @@ class IgnorarSucursalAdmin(admin.ModelAdmin):
     ordering = ("nombre_crudo",)
 
 
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "processed", "total", "worker", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("created_at", "started_at", "finished_at", "updated_at")
+
+
 # =====================================================
 # CREAR ADMIN SITE PERSONALIZADO PARA SECCIONES
 # =====================================================
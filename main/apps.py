@@ -4,3 +4,39 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save, pre_save
+
+        from .models import Cendis, GerenteRegional, Planificacion, Product, Pvp, Salida, Sucursal
+        from .services import cache_tablero, precios
+        from .services.claves import asignar_claves_al_guardar
+        from .services.hechos import pvp_cambiado
+        from .services.renormalizacion import recordar_previas, registrar_cambio
+        from .services.resolver import SOURCE_MODELS, invalidate
+
+        # Claves de búsqueda de las filas crudas (las cargas masivas las asignan ellas mismas)
+        for model in (Planificacion, Salida):
+            pre_save.connect(asignar_claves_al_guardar, sender=model, dispatch_uid=f"claves_{model.__name__}")
+
+        # Cualquier cambio en maestros, mapeos o ignorados invalida las tablas de búsqueda
+        for model in SOURCE_MODELS:
+            post_save.connect(invalidate, sender=model, dispatch_uid=f"resolver_save_{model.__name__}")
+            post_delete.connect(invalidate, sender=model, dispatch_uid=f"resolver_delete_{model.__name__}")
+
+        # ...y re-normaliza solo las filas crudas cuyas claves tocó el cambio
+        for model in SOURCE_MODELS:
+            pre_save.connect(recordar_previas, sender=model, dispatch_uid=f"renormalizar_pre_{model.__name__}")
+            post_save.connect(registrar_cambio, sender=model, dispatch_uid=f"renormalizar_save_{model.__name__}")
+            post_delete.connect(registrar_cambio, sender=model, dispatch_uid=f"renormalizar_delete_{model.__name__}")
+
+        # Los USD de los hechos del tablero dependen del PVP (índice de precios primero)
+        post_save.connect(precios.invalidate, sender=Pvp, dispatch_uid="precios_pvp_save")
+        post_delete.connect(precios.invalidate, sender=Pvp, dispatch_uid="precios_pvp_delete")
+        post_save.connect(pvp_cambiado, sender=Pvp, dispatch_uid="hechos_pvp_save")
+        post_delete.connect(pvp_cambiado, sender=Pvp, dispatch_uid="hechos_pvp_delete")
+
+        # El tablero cacheado también lee nombres y atributos de estos maestros
+        for model in (Cendis, Sucursal, Product, GerenteRegional):
+            post_save.connect(cache_tablero.invalidar, sender=model, dispatch_uid=f"tablero_save_{model.__name__}")
+            post_delete.connect(cache_tablero.invalidar, sender=model, dispatch_uid=f"tablero_delete_{model.__name__}")
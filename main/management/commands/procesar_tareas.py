@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.services.tareas import fail_stale, work_forever
+
+
+class Command(BaseCommand):
+    help = "Ejecuta las importaciones y normalizaciones encoladas desde la web"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Procesa las tareas pendientes y termina")
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=getattr(settings, "JOBS_POLL_SECONDS", 2),
+            help="Segundos de espera entre consultas cuando no hay tareas",
+        )
+
+    def handle(self, *args, **options):
+        stale = fail_stale(timedelta(hours=getattr(settings, "JOBS_STALE_HOURS", 6)))
+        if stale:
+            self.stdout.write(self.style.WARNING(f"{stale} tarea(s) interrumpida(s) marcadas como fallidas"))
+        self.stdout.write("Esperando tareas… (Ctrl+C para salir)" if not options["once"] else "Procesando tareas pendientes…")
+        try:
+            work_forever(poll_seconds=options["poll"], once=options["once"], log=self.stdout.write)
+        except KeyboardInterrupt:
+            self.stdout.write("Worker detenido")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Planificacion, Salida
+from main.services.claves import recalcular_claves
+
+
+class Command(BaseCommand):
+    help = "Recalcula las columnas de clave (sucursal_key, origen_key, …) de Planificacion y Salida"
+
+    def handle(self, *args, **options):
+        for model in (Planificacion, Salida):
+            total = recalcular_claves(model.objects.all())
+            self.stdout.write(self.style.SUCCESS(f"✅ {model.__name__}: {total} filas"))
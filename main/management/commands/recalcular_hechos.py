@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.services.hechos import recalcular_todo
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de hechos del tablero (HechoCumplimiento) desde las normalizadas"
+
+    def handle(self, *args, **options):
+        total = recalcular_todo()
+        self.stdout.write(self.style.SUCCESS(f"✅ HechoCumplimiento: {total} filas"))
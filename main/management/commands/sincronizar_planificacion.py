@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from main.models import PlanningBatch
+from main.services.planificacion import sincronizar_lotes_pendientes
+
+
+class Command(BaseCommand):
+    help = "Vuelca a Planificacion los lotes de PlanningEntry sin marca de agua (synced_at)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Máximo de lotes a procesar")
+
+    def handle(self, *args, **options):
+        pendientes = PlanningBatch.objects.filter(synced_at__isnull=True).count()
+        if not pendientes:
+            self.stdout.write(self.style.SUCCESS("Todos los lotes están sincronizados"))
+            return
+        self.stdout.write(f"Lotes pendientes: {pendientes}")
+        totales = sincronizar_lotes_pendientes(limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {totales['batches']} lotes · {totales['created']} creadas · "
+            f"{totales['updated']} actualizadas · {totales['unchanged']} sin cambios"
+        ))
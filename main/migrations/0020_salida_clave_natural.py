@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def eliminar_duplicados(apps, schema_editor):
+    """Conserva la primera Salida (menor id) de cada (fecha_salida, sku, salida) antes de crear el índice único."""
+    Salida = apps.get_model("main", "Salida")
+    duplicados = (
+        Salida.objects.filter(fecha_salida__isnull=False)
+        .values("fecha_salida", "sku", "salida")
+        .annotate(total=Count("id"), min_id=Min("id"))
+        .filter(total__gt=1)
+    )
+    for dup in duplicados:
+        Salida.objects.filter(
+            fecha_salida=dup["fecha_salida"],
+            sku=dup["sku"],
+            salida=dup["salida"],
+        ).exclude(id=dup["min_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_add_ignorar_models'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='salida',
+            constraint=models.UniqueConstraint(fields=('fecha_salida', 'sku', 'salida'), name='salida_clave_natural'),
+        ),
+    ]
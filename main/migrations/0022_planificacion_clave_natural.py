@@ -0,0 +1,103 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:45
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+
+def fusionar_duplicados(apps, schema_editor):
+    """
+    Antes del índice único: las filas repetidas de (plan_month, item_code, sucursal)
+    se funden en la de menor id sumando a_despachar_total, y esa queda 'pending'.
+    """
+    Planificacion = apps.get_model("main", "Planificacion")
+    duplicados = (
+        Planificacion.objects.values("plan_month", "item_code", "sucursal")
+        .annotate(total=Count("id"), min_id=Min("id"), suma=Sum("a_despachar_total"))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for dup in duplicados:
+        Planificacion.objects.filter(id=dup["min_id"]).update(
+            a_despachar_total=dup["suma"],
+            normalize_status="pending",
+            normalize_notes="",
+            normalized_at=None,
+        )
+        Planificacion.objects.filter(
+            plan_month=dup["plan_month"],
+            item_code=dup["item_code"],
+            sucursal=dup["sucursal"],
+        ).exclude(id=dup["min_id"]).delete()
+
+
+def volcar_lotes_legacy(apps, schema_editor):
+    """
+    Reemplaza a `_sync_from_legacy`: por lote, un GROUP BY del detalle y un
+    bulk_create de las claves que faltan (como antes, no pisa las existentes).
+    Todos los lotes quedan con marca de agua.
+    """
+    Planificacion = apps.get_model("main", "Planificacion")
+    PlanningBatch = apps.get_model("main", "PlanningBatch")
+    PlanningEntry = apps.get_model("main", "PlanningEntry")
+    now = timezone.now()
+    for batch in PlanningBatch.objects.filter(synced_at__isnull=True).order_by("id"):
+        existentes = set(
+            Planificacion.objects.filter(plan_month=batch.plan_date).values_list("item_code", "sucursal")
+        )
+        agregados = (
+            PlanningEntry.objects.filter(batch=batch)
+            .values("item_code", "sucursal")
+            .annotate(
+                total=Sum("a_despachar_total"),
+                tipo=Max("tipo_carga"),
+                nombre=Max("item_name"),
+                origen=Max("cendis"),
+            )
+            .order_by()
+        )
+        nuevos = []
+        for row in agregados:
+            key = (row["item_code"] or "", row["sucursal"] or "")
+            if key in existentes:
+                continue
+            existentes.add(key)
+            nuevos.append(
+                Planificacion(
+                    plan_month=batch.plan_date,
+                    item_code=key[0],
+                    sucursal=key[1],
+                    tipo_carga=row["tipo"] or "",
+                    item_name=row["nombre"] or "",
+                    cendis=row["origen"] or "",
+                    a_despachar_total=row["total"],
+                    normalize_status="pending",
+                )
+            )
+        Planificacion.objects.bulk_create(nuevos, batch_size=1000)
+        PlanningBatch.objects.filter(id=batch.id).update(synced_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_tarea'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='planificacion',
+            name='main_planif_plan_mo_c425c6_idx',
+        ),
+        migrations.AddField(
+            model_name='planningbatch',
+            name='synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='planificacion',
+            constraint=models.UniqueConstraint(fields=('plan_month', 'item_code', 'sucursal'), name='planificacion_clave_natural'),
+        ),
+        migrations.RunPython(volcar_lotes_legacy, migrations.RunPython.noop),
+    ]
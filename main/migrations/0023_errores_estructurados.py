@@ -0,0 +1,52 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+def reencolar_errores(apps, schema_editor):
+    """
+    Los errores previos solo tienen la nota en texto: vuelven a 'pending' para que
+    la próxima normalización (que igual reprocesa los errores) escriba error_kind/error_key.
+    """
+    for nombre in ("Planificacion", "Salida"):
+        apps.get_model("main", nombre).objects.filter(normalize_status="error").update(
+            normalize_status="pending", normalize_notes="", normalized_at=None
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_planificacion_clave_natural'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planificacion',
+            name='error_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='planificacion',
+            name='error_kind',
+            field=models.CharField(blank=True, choices=[('sucursal', 'Sucursal'), ('cedis', 'CEDIS'), ('producto', 'Producto')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='salida',
+            name='error_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='salida',
+            name='error_kind',
+            field=models.CharField(blank=True, choices=[('sucursal', 'Sucursal'), ('cedis', 'CEDIS'), ('producto', 'Producto')], default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='planificacion',
+            index=models.Index(fields=['normalize_status', 'error_kind', 'error_key'], name='main_planif_normali_1dbacf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salida',
+            index=models.Index(fields=['normalize_status', 'error_kind', 'error_key'], name='main_salida_normali_79fdcb_idx'),
+        ),
+        migrations.RunPython(reencolar_errores, migrations.RunPython.noop),
+    ]
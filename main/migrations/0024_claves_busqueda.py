@@ -0,0 +1,99 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+# Misma regla y precedencia que services.claves (copiadas: la migración no depende del código vivo)
+FUENTES = {
+    "Planificacion": {
+        "sucursal_key": ("sucursal",),
+        "cendis_key": ("cendis",),
+        "item_key": ("item_code",),
+    },
+    "Salida": {
+        "origen_key": ("nombre_almacen_origen", "nombre_sucursal_origen"),
+        "destino_key": ("nombre_sucursal_destino", "sucursal_destino_propuesto", "nombre_almacen_destino"),
+        "sku_key": ("sku",),
+    },
+}
+
+
+def rellenar_claves(apps, schema_editor):
+    """Calcula las claves de las filas existentes por lotes (antes de crear los índices)."""
+    for nombre, fuentes in FUENTES.items():
+        model = apps.get_model("main", nombre)
+        columnas = sorted({c for cols in fuentes.values() for c in cols})
+        lote = []
+        for obj in model.objects.only("id", *columnas).order_by("id").iterator(chunk_size=2000):
+            for campo, cols in fuentes.items():
+                valor = next((v for v in (getattr(obj, c) for c in cols) if v), "")
+                setattr(obj, campo, str(valor).strip().lower())
+            lote.append(obj)
+            if len(lote) >= 2000:
+                model.objects.bulk_update(lote, list(fuentes))
+                lote = []
+        model.objects.bulk_update(lote, list(fuentes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_errores_estructurados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planificacion',
+            name='cendis_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='planificacion',
+            name='item_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='planificacion',
+            name='sucursal_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='salida',
+            name='destino_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='salida',
+            name='origen_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='salida',
+            name='sku_key',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(rellenar_claves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='planificacion',
+            index=models.Index(fields=['sucursal_key'], name='main_planif_sucursa_de3683_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planificacion',
+            index=models.Index(fields=['cendis_key'], name='main_planif_cendis__acedec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planificacion',
+            index=models.Index(fields=['item_key'], name='main_planif_item_ke_3c58b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salida',
+            index=models.Index(fields=['origen_key'], name='main_salida_origen__aafd71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salida',
+            index=models.Index(fields=['destino_key'], name='main_salida_destino_e2e5ca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salida',
+            index=models.Index(fields=['sku_key'], name='main_salida_sku_key_4c96f0_idx'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:05
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+# (modelo normalizado, partición, cedis, tienda, tipo de carga, sku, nombre, cantidad, campo qty, campo usd)
+# Mismas reglas que services.hechos (copiadas: la migración no depende del código vivo)
+LADOS = (
+    ("PlanificacionNormalizada", "plan_month", "cedis_origen_id", "sucursal_id", "tipo_carga",
+     "item_code", "item_name", "a_despachar_total", "plan_qty", "plan_usd"),
+    ("SalidaNormalizada", "fecha_salida", "cedis_origen_id", "sucursal_destino_id", None,
+     "sku", "descripcion", "cantidad", "salida_qty", "salida_usd"),
+)
+
+
+def _tipo(valor):
+    tipo = valor.strip() if valor else ""
+    if not tipo or tipo.upper() == "SIN TIPO":
+        return ""
+    return tipo.split(". ", 1)[-1] if ". " in tipo else tipo
+
+
+def rellenar_hechos(apps, schema_editor):
+    """Agrega las normalizadas existentes en la tabla de hechos."""
+    Hecho = apps.get_model("main", "HechoCumplimiento")
+    precio = {sku.lower(): price for sku, price in apps.get_model("main", "Pvp").objects.values_list("sku", "price")}
+    for nombre, particion, cedis, sucursal, tipo, sku, texto, cantidad, qty, usd in LADOS:
+        columnas = [particion, cedis, sucursal, sku, "product_id", "product__group", "product__category"]
+        if tipo:
+            columnas.append(tipo)
+        filas = (
+            apps.get_model("main", nombre).objects.filter(**{f"{particion}__isnull": False})
+            .order_by().values(*columnas)
+            .annotate(_cantidad=Sum(cantidad), _registros=Count("id"), _nombre=Max(texto))
+        )
+        hechos = {}
+        for fila in filas:
+            codigo = fila[sku] or ""
+            clave = (
+                fila[particion], fila[cedis], fila[sucursal], _tipo(fila[tipo]) if tipo else "",
+                fila["product__group"].strip() if fila["product__group"] else "SIN GRUPO",
+                fila["product__category"].strip() if fila["product__category"] else "SIN CATEGORÍA",
+                codigo,
+            )
+            if clave not in hechos:
+                hechos[clave] = Hecho(
+                    **{particion: clave[0]}, cedis_id=clave[1], sucursal_id=clave[2], tipo_carga=clave[3],
+                    grupo=clave[4], categoria=clave[5], sku=codigo, sku_key=codigo.lower(),
+                    product_id=fila["product_id"], nombre=fila["_nombre"] or "",
+                )
+            hecho = hechos[clave]
+            setattr(hecho, qty, getattr(hecho, qty) + (fila["_cantidad"] or Decimal("0")))
+            hecho.registros += fila["_registros"]
+        for hecho in hechos.values():
+            setattr(hecho, usd, getattr(hecho, qty) * precio.get(hecho.sku_key, Decimal("0")))
+        Hecho.objects.bulk_create(hechos.values(), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_claves_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HechoCumplimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plan_month', models.DateField(blank=True, null=True)),
+                ('fecha_salida', models.DateField(blank=True, null=True)),
+                ('tipo_carga', models.CharField(blank=True, default='', help_text='Vacío: sin tipo', max_length=100)),
+                ('grupo', models.CharField(blank=True, default='', max_length=255)),
+                ('categoria', models.CharField(blank=True, default='', max_length=255)),
+                ('sku', models.CharField(blank=True, default='', max_length=100)),
+                ('sku_key', models.CharField(blank=True, default='', max_length=100)),
+                ('nombre', models.CharField(blank=True, default='', max_length=255)),
+                ('plan_qty', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('plan_usd', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('salida_qty', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('salida_usd', models.DecimalField(decimal_places=4, default=0, max_digits=20)),
+                ('registros', models.PositiveIntegerField(default=0)),
+                ('cedis', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.cendis')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.product')),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Hecho de cumplimiento',
+                'verbose_name_plural': 'Hechos de cumplimiento',
+                'indexes': [models.Index(fields=['plan_month', 'cedis'], name='main_hechoc_plan_mo_063561_idx'), models.Index(fields=['fecha_salida', 'cedis'], name='main_hechoc_fecha_s_464cc3_idx'), models.Index(fields=['sku_key'], name='main_hechoc_sku_key_ad26a1_idx')],
+            },
+        ),
+        migrations.RunPython(rellenar_hechos, migrations.RunPython.noop),
+    ]
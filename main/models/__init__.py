@@ -11,8 +11,10 @@ from .region import Region
 from .sucursal import Sucursal
 from .salida import Salida
 from .salida_normalizada import SalidaNormalizada
+from .hecho_cumplimiento import HechoCumplimiento
 from .mapeos import MapeoCedis, MapeoSucursal
 from .ignorados import IgnorarCedis, IgnorarSucursal
+from .tarea import Tarea
 
 __all__ = [
 	"DataRecord",
@@ -29,8 +31,10 @@ __all__ = [
 	"Sucursal",
 	"Salida",
 	"SalidaNormalizada",
+	"HechoCumplimiento",
 	"MapeoCedis",
 	"MapeoSucursal",
 	"IgnorarCedis",
 	"IgnorarSucursal",
+	"Tarea",
 ]
@@ -0,0 +1,44 @@
+from django.db import models
+
+from .cendis import Cendis
+from .product import Product
+from .sucursal import Sucursal
+
+
+class HechoCumplimiento(models.Model):
+    """
+    Agregado del tablero de cumplimiento (ver services.hechos).
+
+    Cada fila es un lado: planificado (`plan_month`) o despachado
+    (`fecha_salida`), sumado por CEDIS, tienda, tipo de carga, grupo, categoría
+    y SKU. El cruce planificado/despachado se hace al leer, por CEDIS, tienda y
+    `sku_key`.
+    """
+    plan_month = models.DateField(null=True, blank=True)
+    fecha_salida = models.DateField(null=True, blank=True)
+    cedis = models.ForeignKey(Cendis, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    tipo_carga = models.CharField(max_length=100, blank=True, default="", help_text="Vacío: sin tipo")
+    grupo = models.CharField(max_length=255, blank=True, default="")
+    categoria = models.CharField(max_length=255, blank=True, default="")
+    sku = models.CharField(max_length=100, blank=True, default="")
+    sku_key = models.CharField(max_length=100, blank=True, default="")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    nombre = models.CharField(max_length=255, blank=True, default="")
+    plan_qty = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    plan_usd = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    salida_qty = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    salida_usd = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    registros = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Hecho de cumplimiento"
+        verbose_name_plural = "Hechos de cumplimiento"
+        indexes = [
+            models.Index(fields=["plan_month", "cedis"]),
+            models.Index(fields=["fecha_salida", "cedis"]),
+            models.Index(fields=["sku_key"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.plan_month or self.fecha_salida} - {self.sku}"
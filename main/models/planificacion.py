@@ -9,6 +9,10 @@ class Planificacion(models.Model):
     sucursal = models.CharField(max_length=255, blank=True, default="")
     cendis = models.CharField(max_length=255, blank=True, default="")
     a_despachar_total = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    # Claves de búsqueda (normalize_key) de los nombres crudos; ver services.claves
+    sucursal_key = models.CharField(max_length=255, blank=True, default="")
+    cendis_key = models.CharField(max_length=255, blank=True, default="")
+    item_key = models.CharField(max_length=100, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     normalize_status = models.CharField(
         max_length=20,
@@ -21,6 +25,18 @@ class Planificacion(models.Model):
         default="pending",
     )
     normalize_notes = models.TextField(blank=True, default="")
+    # Primera dimensión que no resolvió y su valor crudo (para agrupar errores sin parsear notas)
+    error_kind = models.CharField(
+        max_length=20,
+        choices=[
+            ("sucursal", "Sucursal"),
+            ("cedis", "CEDIS"),
+            ("producto", "Producto"),
+        ],
+        blank=True,
+        default="",
+    )
+    error_key = models.CharField(max_length=255, blank=True, default="")
     normalized_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
@@ -31,7 +47,14 @@ class Planificacion(models.Model):
             models.Index(fields=["normalize_status", "plan_month"]),
             models.Index(fields=["item_code"]),
             models.Index(fields=["sucursal"]),
-            models.Index(fields=["plan_month", "item_code", "sucursal"]),
+            models.Index(fields=["normalize_status", "error_kind", "error_key"]),
+            models.Index(fields=["sucursal_key"]),
+            models.Index(fields=["cendis_key"]),
+            models.Index(fields=["item_key"]),
+        ]
+        constraints = [
+            # Clave natural: la carga de planificación hace upsert sobre ella
+            models.UniqueConstraint(fields=["plan_month", "item_code", "sucursal"], name="planificacion_clave_natural"),
         ]
 
     def __str__(self) -> str:
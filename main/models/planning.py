@@ -6,6 +6,8 @@ class PlanningBatch(models.Model):
     sheet_name = models.CharField(max_length=255)
     source_filename = models.CharField(max_length=255, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Marca de agua: momento en que las filas del lote se volcaron a Planificacion
+    synced_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = "Planificacion"
@@ -15,6 +15,10 @@ class Salida(models.Model):
     nombre_sucursal_destino = models.CharField(max_length=255, blank=True, default="")
     nombre_almacen_destino = models.CharField(max_length=255, blank=True, default="")
     comments = models.CharField(max_length=500, blank=True, default="")
+    # Claves de búsqueda (normalize_key) del origen y destino efectivos y del SKU; ver services.claves
+    origen_key = models.CharField(max_length=255, blank=True, default="")
+    destino_key = models.CharField(max_length=255, blank=True, default="")
+    sku_key = models.CharField(max_length=100, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     normalize_status = models.CharField(
         max_length=20,
@@ -27,6 +31,18 @@ class Salida(models.Model):
         default="pending",
     )
     normalize_notes = models.TextField(blank=True, default="")
+    # Primera dimensión que no resolvió y su valor crudo (para agrupar errores sin parsear notas)
+    error_kind = models.CharField(
+        max_length=20,
+        choices=[
+            ("sucursal", "Sucursal"),
+            ("cedis", "CEDIS"),
+            ("producto", "Producto"),
+        ],
+        blank=True,
+        default="",
+    )
+    error_key = models.CharField(max_length=255, blank=True, default="")
     normalized_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
@@ -38,6 +54,14 @@ class Salida(models.Model):
             models.Index(fields=["sku"]),
             models.Index(fields=["nombre_sucursal_origen"]),
             models.Index(fields=["nombre_sucursal_destino"]),
+            models.Index(fields=["normalize_status", "error_kind", "error_key"]),
+            models.Index(fields=["origen_key"]),
+            models.Index(fields=["destino_key"]),
+            models.Index(fields=["sku_key"]),
+        ]
+        constraints = [
+            # Clave natural de una línea de despacho; fecha primero para filtrar por mes con el índice
+            models.UniqueConstraint(fields=["fecha_salida", "sku", "salida"], name="salida_clave_natural"),
         ]
 
     def __str__(self) -> str:
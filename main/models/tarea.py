@@ -0,0 +1,41 @@
+from django.db import models
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano (importación / normalización) ejecutado por `manage.py procesar_tareas`."""
+    kind = models.CharField(max_length=50, help_text="Tipo de tarea (ver services.tareas)")
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ("queued", "En cola"),
+            ("running", "En proceso"),
+            ("done", "Terminada"),
+            ("failed", "Fallida"),
+        ],
+        default="queued",
+    )
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    processed = models.IntegerField(default=0)
+    total = models.IntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Tarea en segundo plano"
+        verbose_name_plural = "Tareas en segundo plano"
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"#{self.id} {self.kind} ({self.status})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
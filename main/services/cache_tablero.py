@@ -0,0 +1,53 @@
+"""
+Cache de resultados del tablero normalizado.
+
+Los resúmenes del tablero, sus niveles y las filas de los exports solo
+cambian cuando cambian los hechos (normalización, reinicios, limpieza, PVP) o los
+maestros que se leen al armarlos (CEDIS, tiendas, productos, gerentes). Se
+guardan en el cache de Django bajo una clave con un número de versión de datos;
+quien modifica esos datos llama a `invalidar()` y la versión nueva deja
+huérfanas (hasta su timeout) todas las entradas anteriores. Con el
+FileBasedCache del proyecto la versión y las entradas se comparten entre el
+servidor web y el worker.
+"""
+import time
+from typing import Callable, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "tablero:version"
+
+T = TypeVar("T")
+
+
+def version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Primera vez o clave expulsada del cache: cualquier valor nuevo descarta lo anterior
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _renovar() -> None:
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidar(**kwargs) -> None:
+    """
+    Descarta todo lo cacheado del tablero. Usable directamente como receptor de señal.
+    La versión se renueva al confirmar la transacción para que nadie cachee datos aún sin commit.
+    """
+    transaction.on_commit(_renovar)
+
+
+def obtener(partes: tuple, construir: Callable[[], T]) -> T:
+    """Valor cacheado para `partes` en la versión vigente; si no está, lo construye y lo guarda."""
+    clave = ":".join(["tablero", str(version()), *(str(parte) for parte in partes)])
+    valor = cache.get(clave)
+    if valor is None:
+        valor = construir()
+        cache.set(clave, valor, timeout=int(getattr(settings, "TABLERO_CACHE_TIMEOUT_HOURS", 24)) * 3600)
+    return valor
@@ -0,0 +1,98 @@
+"""
+Columnas de clave persistidas en las tablas crudas.
+
+`Planificacion` y `Salida` guardan, junto a los nombres crudos, su clave de
+búsqueda: `normalize_key` (la misma regla con la que el resolver indexa maestros
+y mapeos) del primer valor no vacío de sus columnas fuente. Con esas columnas
+indexadas, la resolución en SQL, la re-normalización incremental y las
+correcciones filtran por igualdad sobre un índice en vez de comparar
+`strip().lower()` en Python o con `__iexact`.
+
+Se llenan en la carga (bulk_create/bulk_update llaman a `asignar_claves`), en
+cada `save()` (receptor pre_save, ver `MainConfig.ready`) y en las correcciones
+(`corregir`). `recalcular_claves` (comando `recalcular_claves`) las rellena
+para filas existentes.
+"""
+from typing import Dict, Tuple
+
+from .resolver import normalize_key
+from .tareas import sin_progreso
+
+BULK_BATCH_SIZE = 2000
+
+# Campo de clave -> columnas fuente en orden de precedencia (como origen_salida/destino_salida)
+FUENTES: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "Planificacion": {
+        "sucursal_key": ("sucursal",),
+        "cendis_key": ("cendis",),
+        "item_key": ("item_code",),
+    },
+    "Salida": {
+        "origen_key": ("nombre_almacen_origen", "nombre_sucursal_origen"),
+        "destino_key": ("nombre_sucursal_destino", "sucursal_destino_propuesto", "nombre_almacen_destino"),
+        "sku_key": ("sku",),
+    },
+}
+
+
+def campos_clave(model) -> list:
+    return list(FUENTES[model.__name__])
+
+
+def asignar_claves(obj):
+    """Calcula las claves de una instancia de Planificacion o Salida (sin guardar)."""
+    for campo, columnas in FUENTES[type(obj).__name__].items():
+        valor = next((v for v in (getattr(obj, c) for c in columnas) if v), "")
+        setattr(obj, campo, normalize_key(valor))
+    return obj
+
+
+def asignar_claves_al_guardar(sender, instance, raw=False, **kwargs) -> None:
+    """pre_save: mantiene las claves al día en cada save()."""
+    if not raw:
+        asignar_claves(instance)
+
+
+def recalcular_claves(queryset, progreso=sin_progreso) -> int:
+    """Recalcula y guarda las claves de `queryset` por lotes; devuelve las filas actualizadas."""
+    model = queryset.model
+    campos = campos_clave(model)
+    columnas = sorted({c for fuentes in FUENTES[model.__name__].values() for c in fuentes})
+    lote = []
+    total = 0
+    for obj in queryset.only("id", *columnas).order_by("id").iterator(chunk_size=BULK_BATCH_SIZE):
+        lote.append(asignar_claves(obj))
+        if len(lote) >= BULK_BATCH_SIZE:
+            model.objects.bulk_update(lote, campos)
+            total += len(lote)
+            lote = []
+            progreso(total)
+    model.objects.bulk_update(lote, campos)
+    return total + len(lote)
+
+
+def corregir(model, campo: str, clave: str, valor: str) -> Dict[str, int]:
+    """
+    Reescribe a `valor` el nombre crudo de las filas cuya clave `campo` es `clave`.
+    Se corrige la columna de la que sale la clave (la primera no vacía), así que
+    el resultado es el mismo que leería la normalización. Las filas vuelven a
+    pending. Devuelve las filas actualizadas por columna.
+    """
+    columnas = FUENTES[model.__name__][campo]
+    if not clave:
+        return {c: 0 for c in columnas}
+    filas = model.objects.filter(**{campo: clave})
+    actualizadas = {}
+    for i, columna in enumerate(columnas):
+        # Las columnas anteriores vacías: esta es la que define la clave
+        actualizadas[columna] = (
+            filas.filter(**{c: "" for c in columnas[:i]})
+            .exclude(**{columna: ""})
+            .update(
+                **{columna: valor, campo: normalize_key(valor)},
+                normalize_status="pending",
+                normalize_notes="",
+                normalized_at=None,
+            )
+        )
+    return actualizadas
@@ -0,0 +1,209 @@
+"""
+Mantenimiento de la tabla de hechos del tablero (HechoCumplimiento).
+
+El tablero ya no suma filas normalizadas: lee un agregado por mes de
+planificación (lado "plan") y por fecha de salida (lado "salida"), con la
+granularidad que necesita su jerarquía más fina (CEDIS, tienda, tipo de carga,
+grupo, categoría y SKU). Las reglas de agrupación del tablero (tipo de carga sin
+prefijo, "SIN GRUPO", SKU en minúsculas para cruzar con el PVP) se aplican aquí,
+una vez, al escribir.
+
+Mantenimiento incremental por partición: cada pasada de normalización
+recalcula solo los meses o fechas de las filas que procesó (un GROUP BY sobre la
+normalizada de esa partición). Los USD (cantidad × PVP, del índice de
+services.precios) y el grupo/categoría
+del producto se actualizan en sitio cuando cambian el PVP o el maestro.
+`recalcular_todo` (comando `recalcular_hechos`) reconstruye la tabla completa.
+Toda escritura invalida el cache del tablero (ver services.cache_tablero).
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Sum, Value
+
+from ..models import HechoCumplimiento, PlanificacionNormalizada, Product, SalidaNormalizada
+from . import cache_tablero
+from .precios import IndicePrecios, get_precios
+
+BULK_BATCH_SIZE = 2000
+# Tope de valores por `__in` (SQLite admite 32766 parámetros por consulta)
+MAX_VALORES = 2000
+
+SIN_TIPO = ""
+CERO = Decimal("0")
+
+
+class Lado(NamedTuple):
+    """Columnas de la tabla normalizada de la que sale un lado del hecho."""
+    modelo: type
+    particion: str  # Campo de fecha, con el mismo nombre en la normalizada y en el hecho
+    cedis: str
+    sucursal: str
+    tipo_carga: Optional[str]
+    sku: str
+    nombre: str
+    cantidad: str
+    qty: str  # Campo de cantidad del hecho
+    usd: str  # Campo de USD del hecho
+
+
+PLAN = Lado(
+    modelo=PlanificacionNormalizada,
+    particion="plan_month",
+    cedis="cedis_origen_id",
+    sucursal="sucursal_id",
+    tipo_carga="tipo_carga",
+    sku="item_code",
+    nombre="item_name",
+    cantidad="a_despachar_total",
+    qty="plan_qty",
+    usd="plan_usd",
+)
+
+SALIDA = Lado(
+    modelo=SalidaNormalizada,
+    particion="fecha_salida",
+    cedis="cedis_origen_id",
+    sucursal="sucursal_destino_id",
+    tipo_carga=None,  # Se toma de la planificación al leer
+    sku="sku",
+    nombre="descripcion",
+    cantidad="cantidad",
+    qty="salida_qty",
+    usd="salida_usd",
+)
+
+
+def tipo_carga(valor: Optional[str]) -> str:
+    """Tipo de carga como lo agrupa el tablero: sin prefijo "1. ", vacío si no hay o es "SIN TIPO"."""
+    tipo = valor.strip() if valor else ""
+    if not tipo or tipo.upper() == "SIN TIPO":
+        return SIN_TIPO
+    return tipo.split(". ", 1)[-1] if ". " in tipo else tipo
+
+
+def grupo(valor: Optional[str]) -> str:
+    return valor.strip() if valor else "SIN GRUPO"
+
+
+def categoria(valor: Optional[str]) -> str:
+    return valor.strip() if valor else "SIN CATEGORÍA"
+
+
+def _recalcular_particion(lado: Lado, particion, precios: IndicePrecios) -> int:
+    HechoCumplimiento.objects.filter(**{lado.particion: particion}).delete()
+    columnas = [lado.cedis, lado.sucursal, lado.sku, "product_id", "product__group", "product__category"]
+    if lado.tipo_carga:
+        columnas.append(lado.tipo_carga)
+    filas = (
+        lado.modelo.objects.filter(**{lado.particion: particion})
+        .order_by()
+        .values(*columnas)
+        .annotate(_cantidad=Sum(lado.cantidad), _registros=Count("id"), _nombre=Max(lado.nombre))
+    )
+    hechos: Dict[tuple, HechoCumplimiento] = {}
+    for fila in filas:
+        tipo = tipo_carga(fila[lado.tipo_carga]) if lado.tipo_carga else SIN_TIPO
+        sku = fila[lado.sku] or ""
+        clave = (
+            fila[lado.cedis], fila[lado.sucursal], tipo,
+            grupo(fila["product__group"]), categoria(fila["product__category"]), sku,
+        )
+        hecho = hechos.get(clave)
+        if hecho is None:
+            hecho = hechos[clave] = HechoCumplimiento(
+                **{lado.particion: particion},
+                cedis_id=clave[0],
+                sucursal_id=clave[1],
+                tipo_carga=tipo,
+                grupo=clave[3],
+                categoria=clave[4],
+                sku=sku,
+                sku_key=sku.lower(),
+                product_id=fila["product_id"],
+                nombre=fila["_nombre"] or "",
+            )
+        setattr(hecho, lado.qty, getattr(hecho, lado.qty) + (fila["_cantidad"] or CERO))
+        hecho.registros += fila["_registros"]
+    for hecho in hechos.values():
+        setattr(hecho, lado.usd, getattr(hecho, lado.qty) * precios.precio(hecho.sku_key))
+    HechoCumplimiento.objects.bulk_create(hechos.values(), batch_size=BULK_BATCH_SIZE)
+    return len(hechos)
+
+
+def recalcular(lado: Lado, particiones: Iterable) -> int:
+    """Reconstruye los hechos de `lado` para cada mes/fecha de `particiones`; devuelve cuántos escribió."""
+    particiones = sorted({p for p in particiones if p is not None})
+    if not particiones:
+        return 0
+    precios = get_precios()
+    total = 0
+    for particion in particiones:
+        with transaction.atomic():
+            total += _recalcular_particion(lado, particion, precios)
+            cache_tablero.invalidar()
+    return total
+
+
+def recalcular_planificacion(meses: Iterable) -> int:
+    return recalcular(PLAN, meses)
+
+
+def recalcular_salidas(fechas: Iterable) -> int:
+    return recalcular(SALIDA, fechas)
+
+
+def recalcular_todo() -> int:
+    """Reconstruye la tabla completa a partir de las normalizadas."""
+    with transaction.atomic():
+        HechoCumplimiento.objects.all().delete()
+        cache_tablero.invalidar()
+        total = 0
+        for lado in (PLAN, SALIDA):
+            particiones = lado.modelo.objects.order_by().values_list(lado.particion, flat=True).distinct()
+            total += recalcular(lado, list(particiones))
+    return total
+
+
+def actualizar_precios(skus: Iterable[str]) -> int:
+    """Recalcula los USD de los hechos de `skus` con el PVP vigente (un UPDATE por precio distinto)."""
+    claves = sorted({sku.lower() for sku in skus if sku})
+    if not claves:
+        return 0
+    precios = get_precios()
+    por_precio = defaultdict(list)
+    for clave in claves:
+        por_precio[precios.precio(clave)].append(clave)
+    actualizados = 0
+    for valor, lote in por_precio.items():
+        factor = Value(valor, output_field=DecimalField(max_digits=10, decimal_places=2))
+        for start in range(0, len(lote), MAX_VALORES):
+            actualizados += HechoCumplimiento.objects.filter(sku_key__in=lote[start:start + MAX_VALORES]).update(
+                plan_usd=F("plan_qty") * factor,
+                salida_usd=F("salida_qty") * factor,
+            )
+    cache_tablero.invalidar()
+    return actualizados
+
+
+def pvp_cambiado(sender, instance, raw=False, **kwargs) -> None:
+    """post_save/post_delete de Pvp: recalcula los USD de ese SKU al confirmar."""
+    if not raw:
+        transaction.on_commit(partial(actualizar_precios, [instance.sku]), robust=True)
+
+
+def actualizar_productos(ids: Iterable[int]) -> int:
+    """Copia a los hechos el grupo y la categoría actuales de los productos `ids`."""
+    ids = sorted(set(ids))
+    actualizados = 0
+    for start in range(0, len(ids), MAX_VALORES):
+        productos = Product.objects.filter(id__in=ids[start:start + MAX_VALORES]).values_list("id", "group", "category")
+        for pk, group, category in productos:
+            actualizados += HechoCumplimiento.objects.filter(product_id=pk).update(
+                grupo=grupo(group), categoria=categoria(category)
+            )
+    cache_tablero.invalidar()
+    return actualizados
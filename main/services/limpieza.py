@@ -0,0 +1,120 @@
+"""
+Limpieza rápida de las tablas de Planificación y Salida.
+
+`QuerySet.delete()` pasa por el colector de Django: trae a memoria cada fila y
+sus cascadas (la normalizada de cada crudo) antes de borrar, lo que en una tabla
+de un millón de salidas son minutos y mucha RAM. Aquí se borra con SQL directo,
+sin señales ni colector:
+
+- `vaciar`: tablas completas, en orden de dependencias (hijas primero). En
+  Postgres es un único TRUNCATE de todas.
+- `borrar`: DELETE … WHERE con el filtro de un queryset (los de fecha o mes
+  aprovechan los índices por fecha).
+- `reiniciar_estado`: devuelve filas crudas a pending con un solo UPDATE.
+
+Encima de eso, los reinicios de normalización (todo, por mes, por fecha) que
+usan las vistas de normalización y `LimpiarTodoView`. Junto con las
+normalizadas se borran los hechos del tablero del mismo lado (y se invalida su
+cache).
+"""
+import datetime
+from typing import Dict, Tuple
+
+from django.db import connection, transaction
+
+from ..models import (
+    HechoCumplimiento, Planificacion, PlanificacionNormalizada, PlanningBatch, PlanningEntry,
+    Salida, SalidaNormalizada,
+)
+from . import cache_tablero
+
+# Tablas de cada área, hijas antes que padres
+PLANIFICACION_TABLAS = (PlanificacionNormalizada, Planificacion, PlanningEntry, PlanningBatch)
+SALIDA_TABLAS = (SalidaNormalizada, Salida)
+
+# Hechos del tablero de cada lado (ver services.hechos)
+HECHOS_PLANIFICACION = HechoCumplimiento.objects.filter(plan_month__isnull=False)
+HECHOS_SALIDA = HechoCumplimiento.objects.filter(fecha_salida__isnull=False)
+
+# Estados que un reinicio devuelve a pending (las pendientes no se tocan)
+ESTADOS_PROCESADOS = ["ok", "error", "ignored"]
+
+
+def _q(nombre: str) -> str:
+    return connection.ops.quote_name(nombre)
+
+
+def vaciar(*modelos) -> Dict[type, int]:
+    """Vacía las tablas de `modelos` (en ese orden) y devuelve las filas borradas de cada una."""
+    counts: Dict[type, int] = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # TRUNCATE no informa filas: se cuentan antes, dentro de la misma transacción
+            for modelo in modelos:
+                counts[modelo] = modelo.objects.count()
+            cursor.execute(f"TRUNCATE {', '.join(_q(m._meta.db_table) for m in modelos)}")
+        else:
+            for modelo in modelos:
+                cursor.execute(f"DELETE FROM {_q(modelo._meta.db_table)}")
+                counts[modelo] = cursor.rowcount
+    return counts
+
+
+def borrar(queryset) -> int:
+    """DELETE de las filas de `queryset` sin traerlas ni seguir cascadas; devuelve cuántas."""
+    meta = queryset.model._meta
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {_q(meta.db_table)} WHERE {_q(meta.pk.column)} IN ({sql})", params)
+        return cursor.rowcount
+
+
+def reiniciar_estado(queryset) -> int:
+    """Devuelve a pending las filas crudas de `queryset` (un solo UPDATE)."""
+    return queryset.update(
+        normalize_status="pending",
+        normalize_notes="",
+        error_kind="",
+        error_key="",
+        normalized_at=None,
+    )
+
+
+# -----------------------------------------------------
+# Reinicios de normalización
+# -----------------------------------------------------
+
+def reiniciar_planificacion(plan_month: datetime.date = None) -> Tuple[int, int]:
+    """
+    Borra las planificaciones normalizadas (todas o las de `plan_month`) y deja
+    sus crudas en pending. Devuelve (crudas reiniciadas, normalizadas borradas).
+    """
+    with transaction.atomic():
+        if plan_month is None:
+            borradas = vaciar(PlanificacionNormalizada)[PlanificacionNormalizada]
+            borrar(HECHOS_PLANIFICACION)
+            crudas = Planificacion.objects.filter(normalize_status__in=ESTADOS_PROCESADOS)
+        else:
+            borradas = borrar(PlanificacionNormalizada.objects.filter(plan_month=plan_month))
+            borrar(HECHOS_PLANIFICACION.filter(plan_month=plan_month))
+            crudas = Planificacion.objects.filter(normalize_status__in=ESTADOS_PROCESADOS, plan_month=plan_month)
+        cache_tablero.invalidar()
+        return reiniciar_estado(crudas), borradas
+
+
+def reiniciar_salidas(fecha_salida: datetime.date = None) -> Tuple[int, int]:
+    """
+    Borra las salidas normalizadas (todas o las de `fecha_salida`) y deja sus
+    crudas en pending. Devuelve (crudas reiniciadas, normalizadas borradas).
+    """
+    with transaction.atomic():
+        if fecha_salida is None:
+            borradas = vaciar(SalidaNormalizada)[SalidaNormalizada]
+            borrar(HECHOS_SALIDA)
+            crudas = Salida.objects.filter(normalize_status__in=ESTADOS_PROCESADOS)
+        else:
+            borradas = borrar(SalidaNormalizada.objects.filter(fecha_salida=fecha_salida))
+            borrar(HECHOS_SALIDA.filter(fecha_salida=fecha_salida))
+            crudas = Salida.objects.filter(normalize_status__in=ESTADOS_PROCESADOS, fecha_salida=fecha_salida)
+        cache_tablero.invalidar()
+        return reiniciar_estado(crudas), borradas
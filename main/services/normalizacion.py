@@ -0,0 +1,579 @@
+"""
+Normalización de Planificacion -> PlanificacionNormalizada y Salida -> SalidaNormalizada.
+
+Única implementación usada por las vistas de normalización y por "Normalizar todo".
+Las reglas de resolución dependen solo de los nombres crudos de la fila, así que
+se expresan como funciones puras sobre un `Resolver` (ver services.resolver).
+
+Cuatro modos, según `settings.NORMALIZATION_MODE`:
+- "keys" (por defecto): un GROUP BY por columna clave (sucursal, CEDIS, producto)
+  trae los valores distintos, cada uno se resuelve una sola vez y el estado de las
+  filas crudas se escribe por bloques de ids.
+- "rows": resuelve fila por fila (implementación original, útil para comparar).
+- "sql": todo en la base de datos (ver services.normalizacion_sql).
+- "parallel": resuelve por tramos de id en varios procesos y escribe desde uno
+  solo (ver services.normalizacion_paralela).
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable, Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+
+from ..models import Planificacion, PlanificacionNormalizada, Salida, SalidaNormalizada
+from . import normalizacion_paralela, normalizacion_sql
+from .hechos import recalcular_planificacion, recalcular_salidas
+from .resolver import Resolver, get_resolver
+from .tareas import sin_progreso
+
+BULK_BATCH_SIZE = 500
+PROGRESS_EVERY = 500
+
+PLANIFICACION_FIELDS = [
+    "tipo_carga", "item_name", "product", "cendis", "cedis_origen",
+    "a_despachar_total", "plan_month", "item_code", "sucursal",
+]
+SALIDA_FIELDS = [
+    "salida", "fecha_salida", "sku", "descripcion", "cantidad",
+    "cedis_origen", "sucursal_destino", "product",
+    "origen_nombre", "destino_nombre", "entrada",
+    "fecha_entrada", "comments",
+]
+# Campos que reescribe el upsert sobre una normalizada existente: todos menos la
+# clave natural del crudo (mes / salida y fecha), que no cambia para un mismo `raw`
+PLANIFICACION_ACTUALIZABLES = [f for f in PLANIFICACION_FIELDS if f != "plan_month"] + ["updated_at"]
+SALIDA_ACTUALIZABLES = [f for f in SALIDA_FIELDS if f not in ("salida", "fecha_salida")] + ["updated_at"]
+RAW_STATUS_FIELDS = ["normalize_status", "normalize_notes", "error_kind", "error_key", "normalized_at"]
+
+IGNORADO_NOTA = "Ignorado por configuración"
+
+# Filas que recoge una pasada completa
+PENDIENTES = Q(normalize_status__in=["pending", "error"])
+
+
+class Resultado(NamedTuple):
+    status: str  # "ok" | "error" | "ignored"
+    notes: str = ""
+    sucursal_id: Optional[int] = None
+    cedis_id: Optional[int] = None
+    product_id: Optional[int] = None
+    # Primera dimensión con error (`Dimension.tipo`) y su valor crudo
+    error_kind: str = ""
+    error_key: str = ""
+
+
+class Clase(NamedTuple):
+    """Resolución de un único valor crudo de una columna clave."""
+    ignorado: bool = False
+    id: Optional[int] = None
+    issue: str = ""
+    valor: str = ""  # Valor crudo, si hubo issue
+
+
+def _vacio(valor) -> bool:
+    return not (valor and valor.strip())
+
+
+class Dimension(NamedTuple):
+    """
+    Columna clave de la fila cruda. `tipo` elige la tabla de búsqueda y la lista
+    de ignorados del resolver; los textos forman la nota de error.
+    """
+    columna: str  # Columna (o anotación) del modelo crudo
+    campo: str  # Campo de `Resultado` que recibe el id
+    tipo: str  # "sucursal" | "cedis" | "producto"
+    no_encontrado: str
+    sin_valor: str = ""  # Nota si viene vacía; "" = columna opcional
+    clave: str = ""  # Columna con la clave persistida (services.claves)
+
+    def clasificar(self, r: Resolver, valor: str) -> Clase:
+        if (self.tipo == "sucursal" and r.sucursal_ignorada(valor)) or (
+            self.tipo == "cedis" and r.cedis_ignorado(valor)
+        ):
+            return Clase(ignorado=True)
+        if _vacio(valor):
+            return Clase(issue=self.sin_valor)
+        buscar = {"sucursal": r.sucursal, "cedis": r.cendis, "producto": r.producto}[self.tipo]
+        pk = buscar(valor)
+        return Clase(id=pk) if pk else Clase(issue=f"{self.no_encontrado}: {valor}", valor=valor)
+
+
+# -----------------------------------------------------
+# Reglas de resolución
+# -----------------------------------------------------
+
+# Sucursal (tienda) obligatoria; CEDIS (almacén) opcional; producto si viene código.
+PLANIFICACION_DIMENSIONES = (
+    Dimension(
+        "sucursal", "sucursal_id", "sucursal",
+        no_encontrado="Sucursal (tienda) destino no encontrada", sin_valor="Sin sucursal (tienda) destino",
+        clave="sucursal_key",
+    ),
+    Dimension(
+        "cendis", "cedis_id", "cedis", no_encontrado="CEDIS (almacén) origen no encontrado", clave="cendis_key",
+    ),
+    Dimension("item_code", "product_id", "producto", no_encontrado="Producto no encontrado", clave="item_key"),
+)
+
+# Origen obligatorio y debe ser un CEDIS (aunque esté en Sucursales); destino
+# opcional pero, si viene, debe existir.
+SALIDA_DIMENSIONES = (
+    Dimension(
+        "origen", "cedis_id", "cedis",
+        no_encontrado="Origen NO es un almacén CEDIS", sin_valor="Sin origen especificado",
+        clave="origen_key",
+    ),
+    Dimension(
+        "destino", "sucursal_id", "sucursal", no_encontrado="Sucursal/tienda destino no encontrada",
+        clave="destino_key",
+    ),
+    Dimension("sku", "product_id", "producto", no_encontrado="Producto no encontrado", clave="sku_key"),
+)
+
+# Mismas reglas que origen_salida/destino_salida, en SQL
+SALIDA_ANOTACIONES = {
+    "origen": Coalesce(
+        NullIf("nombre_almacen_origen", Value("")),
+        NullIf("nombre_sucursal_origen", Value("")),
+        Value(""),
+    ),
+    "destino": Coalesce(
+        NullIf("nombre_sucursal_destino", Value("")),
+        NullIf("sucursal_destino_propuesto", Value("")),
+        NullIf("nombre_almacen_destino", Value("")),
+        Value(""),
+    ),
+}
+
+
+def _combinar(dimensiones, clases) -> Resultado:
+    """Los ignorados mandan sobre los errores; los errores se listan en orden de columna."""
+    if any(c.ignorado for c in clases):
+        return Resultado("ignored", IGNORADO_NOTA)
+    issues = [(d, c) for d, c in zip(dimensiones, clases) if c.issue]
+    if issues:
+        primera, clase = issues[0]
+        return Resultado(
+            "error", "; ".join(c.issue for _, c in issues), error_kind=primera.tipo, error_key=clase.valor
+        )
+    return Resultado("ok", "", **{d.campo: c.id for d, c in zip(dimensiones, clases)})
+
+
+def resolver_planificacion(r: Resolver, sucursal: str, cendis: str, item_code: str) -> Resultado:
+    valores = (sucursal, cendis, item_code)
+    return _combinar(
+        PLANIFICACION_DIMENSIONES,
+        [d.clasificar(r, v) for d, v in zip(PLANIFICACION_DIMENSIONES, valores)],
+    )
+
+
+def origen_salida(raw) -> str:
+    """Almacén origen de la salida (el campo de almacén manda; la sucursal origen es respaldo)."""
+    return raw.nombre_almacen_origen or raw.nombre_sucursal_origen or ""
+
+
+def destino_salida(raw) -> str:
+    """Tienda destino de la salida, con los campos de respaldo del Excel."""
+    return raw.nombre_sucursal_destino or raw.sucursal_destino_propuesto or raw.nombre_almacen_destino or ""
+
+
+def resolver_salida(r: Resolver, origen: str, destino: str, sku: str) -> Resultado:
+    valores = (origen, destino, sku)
+    return _combinar(
+        SALIDA_DIMENSIONES,
+        [d.clasificar(r, v) for d, v in zip(SALIDA_DIMENSIONES, valores)],
+    )
+
+
+def _valores_planificacion(raw: dict, resultado: Resultado) -> dict:
+    return {
+        "plan_month": raw["plan_month"],
+        "tipo_carga": raw["tipo_carga"],
+        "item_code": raw["item_code"],
+        "item_name": raw["item_name"],
+        "sucursal_id": resultado.sucursal_id,
+        "cedis_origen_id": resultado.cedis_id,
+        "product_id": resultado.product_id,
+        "cendis": raw["cendis"],
+        "a_despachar_total": raw["a_despachar_total"],
+    }
+
+
+def _valores_salida(raw: dict, resultado: Resultado) -> dict:
+    return {
+        "salida": raw["salida"] or "",
+        "fecha_salida": raw["fecha_salida"],
+        "sku": raw["sku"] or "",
+        "descripcion": raw["descripcion"] or "",
+        "cantidad": raw["cantidad"],
+        "cedis_origen_id": resultado.cedis_id,
+        "sucursal_destino_id": resultado.sucursal_id,
+        "product_id": resultado.product_id,
+        "origen_nombre": raw["origen"],
+        "destino_nombre": raw["destino"],
+        "entrada": raw["entrada"] or "",
+        "fecha_entrada": raw["fecha_entrada"],
+        "comments": raw["comments"] or "",
+    }
+
+
+class Objetivo(NamedTuple):
+    """Todo lo que distingue normalizar Planificacion de normalizar Salida."""
+    nombre: str
+    modelo_crudo: type
+    modelo: type  # Tabla normalizada
+    dimensiones: tuple
+    anotaciones: dict  # Columnas derivadas del crudo (se aplican antes de filtrar)
+    columnas: list  # Columnas crudas que lee `construir`
+    actualizables: list  # Campos que reescribe el upsert (ON CONFLICT (raw) DO UPDATE)
+    construir: Callable[[dict, Resultado], dict]
+    # Backend SQL: campo normalizado -> "src.<columna cruda>" o "res.<campo de Resultado>"
+    sql: dict
+    particion: str  # Fecha por la que se mantienen los hechos del tablero (igual en crudo y normalizada)
+    recalcular_hechos: Callable[[list], int]
+
+
+PLANIFICACION = Objetivo(
+    nombre="PLANIFICACIÓN",
+    modelo_crudo=Planificacion,
+    modelo=PlanificacionNormalizada,
+    dimensiones=PLANIFICACION_DIMENSIONES,
+    anotaciones={},
+    columnas=["plan_month", "tipo_carga", "item_code", "item_name", "sucursal", "cendis", "a_despachar_total"],
+    actualizables=PLANIFICACION_ACTUALIZABLES,
+    construir=_valores_planificacion,
+    sql={
+        "plan_month": "src.plan_month",
+        "tipo_carga": "src.tipo_carga",
+        "item_code": "src.item_code",
+        "item_name": "src.item_name",
+        "sucursal_id": "res.sucursal_id",
+        "cedis_origen_id": "res.cedis_id",
+        "product_id": "res.product_id",
+        "cendis": "src.cendis",
+        "a_despachar_total": "src.a_despachar_total",
+    },
+    particion="plan_month",
+    recalcular_hechos=recalcular_planificacion,
+)
+
+SALIDA = Objetivo(
+    nombre="SALIDAS",
+    modelo_crudo=Salida,
+    modelo=SalidaNormalizada,
+    dimensiones=SALIDA_DIMENSIONES,
+    anotaciones=SALIDA_ANOTACIONES,
+    columnas=[
+        "salida", "fecha_salida", "sku", "descripcion", "cantidad",
+        "entrada", "fecha_entrada", "comments", "origen", "destino",
+    ],
+    actualizables=SALIDA_ACTUALIZABLES,
+    construir=_valores_salida,
+    sql={
+        "salida": "src.salida",
+        "fecha_salida": "src.fecha_salida",
+        "sku": "src.sku",
+        "descripcion": "src.descripcion",
+        "cantidad": "src.cantidad",
+        "cedis_origen_id": "res.cedis_id",
+        "sucursal_destino_id": "res.sucursal_id",
+        "product_id": "res.product_id",
+        "origen_nombre": "src.origen",
+        "destino_nombre": "src.destino",
+        "entrada": "src.entrada",
+        "fecha_entrada": "src.fecha_entrada",
+        "comments": "src.comments",
+    },
+    particion="fecha_salida",
+    recalcular_hechos=recalcular_salidas,
+)
+
+
+# -----------------------------------------------------
+# Ejecución
+# -----------------------------------------------------
+
+def _modo() -> str:
+    modo = getattr(settings, "NORMALIZATION_MODE", "keys")
+    if modo not in ("keys", "rows", "sql", "parallel"):
+        raise ValueError(f"NORMALIZATION_MODE desconocido: {modo}")
+    return modo
+
+
+def _marcar(raw, resultado: Resultado, now) -> None:
+    raw.normalize_status = resultado.status
+    raw.normalize_notes = resultado.notes
+    raw.error_kind = resultado.error_kind
+    raw.error_key = resultado.error_key
+    raw.normalized_at = now if resultado.status == "ok" else None
+
+
+def _upsert(objetivo: Objetivo, objs: list) -> None:
+    """
+    Inserta o reescribe normalizadas en una sola sentencia por lote
+    (INSERT … ON CONFLICT (raw_id) DO UPDATE), sin leer antes las existentes.
+    """
+    objetivo.modelo.objects.bulk_create(
+        objs,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["raw"],
+        update_fields=objetivo.actualizables,
+    )
+
+
+def _quitar_normalizadas(modelo, raw_ids: list) -> int:
+    """Borra las normalizadas de filas que ya no resuelven; devuelve cuántas había."""
+    removed = 0
+    for start in range(0, len(raw_ids), BULK_BATCH_SIZE):
+        removed += modelo.objects.filter(raw_id__in=raw_ids[start:start + BULK_BATCH_SIZE]).delete()[0]
+    return removed
+
+
+def _por_filas(queryset, objetivo: Objetivo, progreso, r: Resolver) -> dict:
+    """Resuelve cada fila por separado y escribe todo con upserts y bulk_update."""
+    dimensiones, modelo = objetivo.dimensiones, objetivo.modelo
+    existentes = modelo.objects.filter(raw__in=queryset).count()
+    counts = {"created": 0, "updated": 0, "errors": 0, "ignored": 0, "removed": 0}
+    to_upsert = []
+    to_update_raw = []
+    sin_resolver = []
+    now = timezone.now()
+
+    for record_count, raw in enumerate(queryset.iterator(chunk_size=BULK_BATCH_SIZE), start=1):
+        if record_count % PROGRESS_EVERY == 0:
+            progreso(record_count)
+
+        fila = vars(raw)
+        resultado = _combinar(dimensiones, [d.clasificar(r, fila[d.columna]) for d in dimensiones])
+        _marcar(raw, resultado, now)
+        to_update_raw.append(raw)
+        if resultado.status != "ok":
+            counts["errors" if resultado.status == "error" else "ignored"] += 1
+            sin_resolver.append(raw.id)
+            continue
+        to_upsert.append(modelo(raw=raw, **objetivo.construir(fila, resultado)))
+
+    print(f"\n💾 Ejecutando operaciones bulk...")
+    # Ya no resuelven (p. ej. nueva regla de ignorado): su normalizada sobra
+    counts["removed"] = _quitar_normalizadas(modelo, sin_resolver)
+    counts["updated"] = existentes - counts["removed"]
+    counts["created"] = len(to_upsert) - counts["updated"]
+    _upsert(objetivo, to_upsert)
+    queryset.model.objects.bulk_update(to_update_raw, RAW_STATUS_FIELDS, batch_size=BULK_BATCH_SIZE)
+    return counts
+
+
+def _por_claves(queryset, objetivo: Objetivo, progreso, r: Resolver) -> dict:
+    """
+    Resuelve cada valor distinto de cada columna clave una sola vez; por fila solo
+    se combinan clases ya resueltas. El estado crudo se escribe por bloques de ids,
+    agrupados por combinación de estado, nota y error (ver `_escribir_estados`).
+    """
+    dimensiones, modelo = objetivo.dimensiones, objetivo.modelo
+    clases: Dict[str, Dict[str, Clase]] = {
+        d.columna: {
+            valor: d.clasificar(r, valor)
+            for valor in queryset.values_list(d.columna, flat=True).distinct().order_by()
+        }
+        for d in dimensiones
+    }
+    print("🔑 Claves distintas: " + ", ".join(f"{d.columna}={len(clases[d.columna])}" for d in dimensiones))
+
+    counts = {"created": 0, "updated": 0, "errors": 0, "ignored": 0, "removed": 0}
+    existentes = modelo.objects.filter(raw__in=queryset).count()
+
+    por_estado = defaultdict(list)  # (status, notes, error_kind, error_key) -> ids crudos
+    sin_resolver = []
+    to_upsert = []
+    written = 0
+    for fila in queryset.order_by().values("id", *objetivo.columnas).iterator(chunk_size=BULK_BATCH_SIZE):
+        resultado = _combinar(dimensiones, [clases[d.columna][fila[d.columna]] for d in dimensiones])
+        por_estado[(resultado.status, resultado.notes, resultado.error_kind, resultado.error_key)].append(fila["id"])
+        if resultado.status != "ok":
+            counts["errors" if resultado.status == "error" else "ignored"] += 1
+            sin_resolver.append(fila["id"])
+            continue
+        to_upsert.append(modelo(raw_id=fila["id"], **objetivo.construir(fila, resultado)))
+        if len(to_upsert) >= BULK_BATCH_SIZE:
+            _upsert(objetivo, to_upsert)
+            written += len(to_upsert)
+            to_upsert = []
+            progreso(written)
+    _upsert(objetivo, to_upsert)
+
+    # Filas que ya no resuelven (p. ej. nueva regla de ignorado): su normalizada sobra
+    counts["removed"] = _quitar_normalizadas(modelo, sin_resolver)
+    counts["updated"] = existentes - counts["removed"]
+    counts["created"] = written + len(to_upsert) - counts["updated"]
+    _escribir_estados(queryset.model, por_estado, timezone.now())
+    return counts
+
+
+def _escribir_estados(modelo_crudo, por_estado: dict, now) -> None:
+    """Estado de las filas crudas: un UPDATE por bloque de ids de cada (status, notes, error_kind, error_key)."""
+    for (status, notes, error_kind, error_key), ids in por_estado.items():
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            modelo_crudo.objects.filter(id__in=ids[start:start + BULK_BATCH_SIZE]).update(
+                normalize_status=status,
+                normalize_notes=notes,
+                error_kind=error_kind,
+                error_key=error_key,
+                normalized_at=now if status == "ok" else None,
+            )
+
+
+def _tamano_ventana() -> Optional[int]:
+    tamano = getattr(settings, "NORMALIZATION_CHUNK_SIZE", None)
+    return tamano if tamano and tamano > 0 else None
+
+
+def _ventanas(queryset, tamano: Optional[int]):
+    """
+    Parte `queryset` en ventanas consecutivas de a lo sumo `tamano` filas por
+    rango de pk. Cada límite sale de una búsqueda por índice (OFFSET sobre el pk
+    a partir del anterior), así que nunca se trae la lista de ids completa y las
+    filas ya escritas por ventanas previas no cambian las siguientes.
+    """
+    if tamano is None:
+        yield queryset
+        return
+    desde = None
+    while True:
+        resto = queryset if desde is None else queryset.filter(id__gt=desde)
+        limite = list(resto.order_by("id").values_list("id", flat=True)[tamano - 1:tamano])
+        if not limite:
+            if resto.exists():
+                yield resto
+            return
+        yield resto.filter(id__lte=limite[0])
+        desde = limite[0]
+
+
+def _resolver_tramo(objetivo: Objetivo, r: Resolver, filas: list) -> list:
+    """Trabajo de un proceso del pool: (id, resultado, valores normalizados o None) por fila."""
+    dimensiones = objetivo.dimensiones
+    salida = []
+    for fila in filas:
+        resultado = _combinar(dimensiones, [d.clasificar(r, fila[d.columna]) for d in dimensiones])
+        valores = objetivo.construir(fila, resultado) if resultado.status == "ok" else None
+        salida.append((fila["id"], resultado, valores))
+    return salida
+
+
+def _en_paralelo(queryset, objetivo: Objetivo, progreso, repartir) -> dict:
+    """
+    Los procesos resuelven; aquí solo se escribe: upsert de las normalizadas y
+    el estado crudo por bloques de ids (ver `_escribir_estados`).
+    """
+    modelo = objetivo.modelo
+    counts = {"created": 0, "updated": 0, "errors": 0, "ignored": 0, "removed": 0}
+    now = timezone.now()
+
+    existentes = modelo.objects.filter(raw__in=queryset).count()
+
+    por_estado = defaultdict(list)  # (status, notes, error_kind, error_key) -> ids crudos
+    to_upsert = []
+    sin_resolver = []
+    record_count = 0
+    filas = queryset.order_by("id").values("id", *objetivo.columnas).iterator(chunk_size=BULK_BATCH_SIZE)
+    for tramo in repartir(filas):
+        for raw_id, resultado, valores in tramo:
+            por_estado[(resultado.status, resultado.notes, resultado.error_kind, resultado.error_key)].append(raw_id)
+            if resultado.status == "ok":
+                to_upsert.append(modelo(raw_id=raw_id, **valores))
+                continue
+            counts["errors" if resultado.status == "error" else "ignored"] += 1
+            sin_resolver.append(raw_id)
+        record_count += len(tramo)
+        progreso(record_count)
+
+    counts["removed"] = _quitar_normalizadas(modelo, sin_resolver)
+    counts["updated"] = existentes - counts["removed"]
+    counts["created"] = len(to_upsert) - counts["updated"]
+    _upsert(objetivo, to_upsert)
+    _escribir_estados(queryset.model, por_estado, now)
+    return counts
+
+
+def _normalizar(objetivo: Objetivo, filtro: Optional[Q], progreso) -> dict:
+    r = get_resolver()
+    queryset = objetivo.modelo_crudo.objects.annotate(**objetivo.anotaciones).filter(
+        filtro if filtro is not None else PENDIENTES
+    )
+    total = queryset.count()
+    print(f"\n🔄 INICIANDO NORMALIZACIÓN DE {objetivo.nombre}")
+    print(f"📊 Total de registros a procesar: {total}")
+    progreso(0, total, force=True)
+    # Antes de escribir: después las filas ya no cumplen el filtro de pendientes
+    particiones = list(queryset.order_by().values_list(objetivo.particion, flat=True).distinct())
+
+    modo = _modo()
+    tamano = _tamano_ventana()
+    counts = {"processed": 0, "created": 0, "updated": 0, "errors": 0, "ignored": 0, "removed": 0}
+    # Con NORMALIZATION_CHUNK_SIZE cada ventana se confirma por separado: la
+    # memoria (y el tamaño de la transacción) depende de la ventana, no de la tabla.
+    # En modo "parallel" el pool vive toda la pasada y hereda el resolver al crearse.
+    pool = (
+        normalizacion_paralela.procesos(partial(_resolver_tramo, objetivo, r))
+        if modo == "parallel" else nullcontext()
+    )
+    with pool as repartir:
+        for ventana in _ventanas(queryset, tamano):
+            hechos = counts["processed"]
+            progreso_ventana = lambda n, total=None, force=False: progreso(hechos + n, force=force)
+            with transaction.atomic():
+                filas = ventana.count() if tamano else total
+                if modo == "rows":
+                    parcial = _por_filas(ventana, objetivo, progreso_ventana, r)
+                elif modo == "sql":
+                    parcial = normalizacion_sql.normalizar(ventana, objetivo, r, nota_ignorado=IGNORADO_NOTA)
+                elif modo == "parallel":
+                    parcial = _en_paralelo(ventana, objetivo, progreso_ventana, repartir)
+                else:
+                    parcial = _por_claves(ventana, objetivo, progreso_ventana, r)
+            for key, value in parcial.items():
+                counts[key] += value
+            counts["processed"] += filas
+            if tamano:
+                progreso(counts["processed"], force=True)
+
+    # Hechos del tablero: solo los meses/fechas que tocó esta pasada
+    counts["hechos"] = objetivo.recalcular_hechos(particiones)
+
+    _log_resumen(objetivo.nombre, counts)
+    progreso(total, total, force=True)
+    return counts
+
+
+def normalizar_planificaciones(progreso=sin_progreso, filtro: Optional[Q] = None) -> dict:
+    """
+    Normaliza todas las Planificaciones pendientes o con error (todos los meses).
+    Con `filtro` procesa exactamente esas filas, cualquiera sea su estado.
+    """
+    return _normalizar(PLANIFICACION, filtro, progreso)
+
+
+def normalizar_salidas(progreso=sin_progreso, filtro: Optional[Q] = None) -> dict:
+    """
+    Normaliza todas las Salidas pendientes o con error (todas las fechas).
+    Con `filtro` procesa exactamente esas filas; puede usar las anotaciones
+    `origen` y `destino`.
+    """
+    return _normalizar(SALIDA, filtro, progreso)
+
+
+def _log_resumen(nombre: str, counts: dict) -> None:
+    print(f"\n✅ NORMALIZACIÓN DE {nombre} COMPLETADA")
+    print(f"   📊 Procesados: {counts['processed']}")
+    print(f"   ➕ Creados: {counts['created']}")
+    print(f"   ♻️ Actualizados: {counts['updated']}")
+    print(f"   ❌ Errores: {counts['errors']}")
+    print(f"   🚫 Ignorados: {counts['ignored']}")
+    if counts.get("removed"):
+        print(f"   🗑️ Normalizadas eliminadas: {counts['removed']}")
@@ -0,0 +1,66 @@
+"""
+Backend multiproceso de la normalización (`NORMALIZATION_MODE = "parallel"`).
+
+El proceso principal lee las filas crudas de cada ventana y las reparte, en
+tramos consecutivos de id, entre un pool de procesos. Cada proceso resuelve y
+arma los valores normalizados de su tramo contra una copia de solo lectura del
+resolver: el pool se crea con fork después de fijar el trabajo, así que los
+mapas se heredan sin serializarlos. Los procesos no tocan la base de datos;
+escribe solo el proceso principal (un único escritor, como pide SQLite).
+
+Sin fork (Windows) o con un solo worker, el mismo trabajo corre en el proceso
+principal.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+
+# Filas por tramo enviado a un proceso
+TRAMO = 2000
+
+_trabajo: Optional[Callable[[list], list]] = None
+
+
+def _ejecutar(tramo: list) -> list:
+    return _trabajo(tramo)
+
+
+def _tramos(filas: Iterable, tamano: int) -> Iterator[list]:
+    tramo: List = []
+    for fila in filas:
+        tramo.append(fila)
+        if len(tramo) >= tamano:
+            yield tramo
+            tramo = []
+    if tramo:
+        yield tramo
+
+
+def cantidad_workers() -> int:
+    workers = getattr(settings, "NORMALIZATION_WORKERS", None)
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+
+@contextmanager
+def procesos(trabajo: Callable[[list], list], workers: Optional[int] = None):
+    """
+    Abre el pool para `trabajo` (función de lista de filas -> lista de
+    resultados) y entrega `repartir(filas)`, que devuelve los resultados de cada
+    tramo en orden de id.
+    """
+    global _trabajo
+    workers = workers or cantidad_workers()
+    _trabajo = trabajo
+    try:
+        if workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            contexto = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+                yield lambda filas: pool.map(_ejecutar, _tramos(filas, TRAMO))
+        else:
+            yield lambda filas: map(_ejecutar, _tramos(filas, TRAMO))
+    finally:
+        _trabajo = None
@@ -0,0 +1,213 @@
+"""
+Backend SQL de la normalización (`NORMALIZATION_MODE = "sql"`).
+
+Las filas crudas no pasan por Python: la resolución es un JOIN contra una tabla
+temporal de claves y la escritura son sentencias INSERT … SELECT / UPDATE … FROM.
+
+1. `norm_claves (dimension, clave, target_id)`: las tablas del `Resolver`
+   (nombres oficiales, ids, códigos y alias `nombre_crudo`, con la misma
+   precedencia) más las listas de ignorados (target_id NULL).
+2. `norm_resultado`: un INSERT … SELECT con LEFT JOIN por dimensión deja estado,
+   nota e ids de cada fila procesada.
+3. Un DELETE de las normalizadas de filas que ya no resuelven, un upsert
+   (INSERT … SELECT … ON CONFLICT (raw_id) DO UPDATE) a la tabla normalizada y
+   un UPDATE … FROM del estado crudo.
+
+La clave cruda sale de las columnas persistidas (`sucursal_key`, `origen_key`,
+…; ver services.claves), calculadas con el mismo `normalize_key` que las claves
+del resolver. Funciona en SQLite (>= 3.33, por UPDATE … FROM) y Postgres.
+"""
+from typing import Dict, List, Tuple
+
+from django.db import connection
+from django.utils import timezone
+
+from .resolver import Resolver
+
+CLAVES = "norm_claves"
+RESULTADO = "norm_resultado"
+
+INSERT_BATCH_SIZE = 2000
+
+
+def _q(nombre: str) -> str:
+    return connection.ops.quote_name(nombre)
+
+
+def _preparar(cursor, r: Resolver) -> None:
+    """Crea (o vacía) las tablas temporales y carga las claves del resolver."""
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {CLAVES} ("
+        "dimension VARCHAR(20) NOT NULL, clave TEXT NOT NULL, target_id BIGINT NULL, "
+        "PRIMARY KEY (dimension, clave))"
+    )
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {RESULTADO} ("
+        "raw_id BIGINT PRIMARY KEY, status VARCHAR(20) NOT NULL, notes TEXT NOT NULL, "
+        "error_kind VARCHAR(20) NOT NULL, error_key TEXT NOT NULL, "
+        "sucursal_id BIGINT NULL, cedis_id BIGINT NULL, product_id BIGINT NULL)"
+    )
+    cursor.execute(f"DELETE FROM {CLAVES}")
+    cursor.execute(f"DELETE FROM {RESULTADO}")
+
+    filas: List[Tuple[str, str, object]] = []
+    for dimension, mapa in (("sucursal", r.sucursales), ("cedis", r.cedis), ("producto", r.productos)):
+        filas.extend((dimension, clave, pk) for clave, pk in mapa.items() if clave)
+    for dimension, claves in (("ignorar_sucursal", r.ignorar_sucursales), ("ignorar_cedis", r.ignorar_cedis)):
+        filas.extend((dimension, clave, None) for clave in claves if clave)
+    for start in range(0, len(filas), INSERT_BATCH_SIZE):
+        cursor.executemany(
+            f"INSERT INTO {CLAVES} (dimension, clave, target_id) VALUES (%s, %s, %s)",
+            filas[start:start + INSERT_BATCH_SIZE],
+        )
+
+
+def _limpiar(cursor) -> None:
+    cursor.execute(f"DROP TABLE IF EXISTS {RESULTADO}")
+    cursor.execute(f"DROP TABLE IF EXISTS {CLAVES}")
+
+
+def _resolver(cursor, queryset, objetivo, nota_ignorado: str) -> None:
+    """Un INSERT … SELECT: estado, nota e ids de cada fila de `queryset`."""
+    dimensiones = objetivo.dimensiones
+    base_sql, base_params = (
+        queryset.order_by().values("id", *(d.columna for d in dimensiones), *(d.clave for d in dimensiones))
+        .query.sql_with_params()
+    )
+
+    claves = ", ".join(f"b.{_q(d.clave)} AS k{i}" for i, d in enumerate(dimensiones))
+    joins: List[str] = []
+    join_params: List[object] = []
+    ignorados: List[str] = []
+    for i, d in enumerate(dimensiones):
+        joins.append(f"LEFT JOIN {CLAVES} j{i} ON j{i}.dimension = %s AND j{i}.clave = src.k{i}")
+        join_params.append(d.tipo)
+        if d.tipo in ("sucursal", "cedis"):
+            joins.append(f"LEFT JOIN {CLAVES} i{i} ON i{i}.dimension = %s AND i{i}.clave = src.k{i}")
+            join_params.append(f"ignorar_{d.tipo}")
+            ignorados.append(f"i{i}.clave IS NOT NULL")
+
+    # Cada problema aporta "; <nota>"; al final se quita el primer separador
+    partes: List[str] = []
+    partes_params: List[object] = []
+    # error_kind / error_key: la primera dimensión que falla, como en `_combinar`
+    fallas: List[str] = []
+    fallas_params: List[object] = []
+    claves_error: List[str] = []
+    for i, d in enumerate(dimensiones):
+        columna = f"src.{_q(d.columna)}"
+        vacio = "%s" if d.sin_valor else "''"
+        partes.append(
+            f"(CASE WHEN src.k{i} = '' THEN {vacio} "
+            f"WHEN j{i}.target_id IS NULL THEN %s || {columna} ELSE '' END)"
+        )
+        if d.sin_valor:
+            partes_params.append(f"; {d.sin_valor}")
+        partes_params.append(f"; {d.no_encontrado}: ")
+        falla = f"(src.k{i} <> '' AND j{i}.target_id IS NULL)"
+        if d.sin_valor:
+            falla = f"(src.k{i} = '' OR {falla})"
+        fallas.append(f"WHEN {falla} THEN %s")
+        fallas_params.append(d.tipo)
+        claves_error.append(f"WHEN {falla} THEN (CASE WHEN src.k{i} = '' THEN '' ELSE {columna} END)")
+
+    ids = ", ".join(f"j{i}.target_id AS {d.campo}" for i, d in enumerate(dimensiones))
+    ignorado = " OR ".join(ignorados) or "1 = 0"
+    sql = (
+        f"INSERT INTO {RESULTADO} (raw_id, status, notes, error_kind, error_key, "
+        f"{', '.join(d.campo for d in dimensiones)}) "
+        "SELECT x.id, "
+        "CASE WHEN x.ignorado = 1 THEN 'ignored' WHEN x.issues <> '' THEN 'error' ELSE 'ok' END, "
+        "CASE WHEN x.ignorado = 1 THEN %s WHEN x.issues <> '' THEN SUBSTR(x.issues, 3) ELSE '' END, "
+        "CASE WHEN x.ignorado = 1 THEN '' ELSE x.error_kind END, "
+        "CASE WHEN x.ignorado = 1 THEN '' ELSE x.error_key END, "
+        f"{', '.join('x.' + d.campo for d in dimensiones)} "
+        "FROM ("
+        f"SELECT src.id, CASE WHEN {ignorado} THEN 1 ELSE 0 END AS ignorado, "
+        f"({' || '.join(partes)}) AS issues, "
+        f"(CASE {' '.join(fallas)} ELSE '' END) AS error_kind, "
+        f"(CASE {' '.join(claves_error)} ELSE '' END) AS error_key, {ids} "
+        f"FROM (SELECT b.*, {claves} FROM ({base_sql}) b) src "
+        f"{' '.join(joins)}"
+        ") x"
+    )
+    cursor.execute(sql, [nota_ignorado, *partes_params, *fallas_params, *base_params, *join_params])
+
+
+def _escribir(cursor, queryset, objetivo, now) -> Dict[str, int]:
+    modelo = objetivo.modelo
+    tabla = _q(modelo._meta.db_table)
+    raw_columna = _q(modelo._meta.get_field("raw").column)
+    counts: Dict[str, int] = {}
+
+    cursor.execute(
+        f"DELETE FROM {tabla} WHERE {raw_columna} IN (SELECT raw_id FROM {RESULTADO} WHERE status <> 'ok')"
+    )
+    counts["removed"] = cursor.rowcount
+    cursor.execute(
+        f"SELECT COUNT(*) FROM {tabla} WHERE {raw_columna} IN (SELECT raw_id FROM {RESULTADO} WHERE status = 'ok')"
+    )
+    counts["updated"] = cursor.fetchone()[0]
+
+    # INSERT … SELECT a la tabla normalizada, leyendo el crudo con las mismas anotaciones
+    columnas_src = sorted({ref.split(".", 1)[1] for ref in objetivo.sql.values() if ref.startswith("src.")})
+    base_sql, base_params = queryset.order_by().values("id", *columnas_src).query.sql_with_params()
+    destino = [raw_columna, _q(modelo._meta.get_field("created_at").column), _q(modelo._meta.get_field("updated_at").column)]
+    origen = ["src.id", "%s", "%s"]
+    for campo, ref in objetivo.sql.items():
+        alias, columna = ref.split(".", 1)
+        destino.append(_q(modelo._meta.get_field(campo).column))
+        origen.append(f"{alias}.{_q(columna) if alias == 'src' else columna}")
+    # Solo se reescriben los campos actualizables (no la clave natural ni created_at)
+    asignaciones = ", ".join(
+        f"{columna} = EXCLUDED.{columna}"
+        for columna in (_q(modelo._meta.get_field(campo).column) for campo in objetivo.actualizables)
+    )
+    fecha = connection.ops.adapt_datetimefield_value(now)
+    # El WHERE de la consulta también evita la ambigüedad de ON CONFLICT tras un JOIN en SQLite
+    cursor.execute(
+        f"INSERT INTO {tabla} ({', '.join(destino)}) "
+        f"SELECT {', '.join(origen)} FROM ({base_sql}) src "
+        f"JOIN {RESULTADO} res ON res.raw_id = src.id WHERE res.status = 'ok' "
+        f"ON CONFLICT ({raw_columna}) DO UPDATE SET {asignaciones}",
+        [fecha, fecha, *base_params],
+    )
+
+    # Estado crudo
+    crudo = objetivo.modelo_crudo._meta
+    cursor.execute(
+        f"UPDATE {_q(crudo.db_table)} SET "
+        f"{_q(crudo.get_field('normalize_status').column)} = res.status, "
+        f"{_q(crudo.get_field('normalize_notes').column)} = res.notes, "
+        f"{_q(crudo.get_field('error_kind').column)} = res.error_kind, "
+        f"{_q(crudo.get_field('error_key').column)} = res.error_key, "
+        f"{_q(crudo.get_field('normalized_at').column)} = CASE WHEN res.status = 'ok' THEN %s ELSE NULL END "
+        f"FROM {RESULTADO} res WHERE {_q(crudo.db_table)}.{_q(crudo.pk.column)} = res.raw_id",
+        [fecha],
+    )
+
+    cursor.execute(f"SELECT status, COUNT(*) FROM {RESULTADO} GROUP BY status")
+    por_estado = dict(cursor.fetchall())
+    counts["created"] = por_estado.get("ok", 0) - counts["updated"]
+    counts["errors"] = por_estado.get("error", 0)
+    counts["ignored"] = por_estado.get("ignored", 0)
+    return counts
+
+
+def normalizar(queryset, objetivo, r: Resolver, nota_ignorado: str) -> Dict[str, int]:
+    """Normaliza las filas de `queryset` en la base de datos. Debe correr dentro de una transacción."""
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        _preparar(cursor, r)
+        try:
+            _resolver(cursor, queryset, objetivo, nota_ignorado)
+            counts = _escribir(cursor, queryset, objetivo, now)
+        finally:
+            _limpiar(cursor)
+    return {
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "errors": counts["errors"],
+        "ignored": counts["ignored"],
+        "removed": counts["removed"],
+    }
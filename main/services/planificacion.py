@@ -0,0 +1,140 @@
+"""
+Volcado de la carga de planificación a `Planificacion`.
+
+La subida escribe el detalle en `PlanningEntry` y, en la misma transacción,
+`sincronizar_lote` agrega en SQL el detalle del lote por la clave natural
+(plan_month, item_code, sucursal) y hace upsert en `Planificacion` por bloques:
+ni el detalle ni las planificaciones del mes se cargan completos en memoria.
+`PlanningBatch.synced_at` es la marca de agua: los lotes sin ella (cargados antes
+de este cambio) se vuelcan con `sincronizar_lotes_pendientes`.
+"""
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from ..models import Planificacion, PlanningBatch, PlanningEntry
+from .claves import asignar_claves, campos_clave
+from .tareas import sin_progreso
+
+BULK_BATCH_SIZE = 1000
+
+# Columnas que trae la carga; el resto de Planificacion es estado de normalización
+DATA_FIELDS = ["tipo_carga", "item_name", "cendis", "a_despachar_total"]
+
+Clave = Tuple[str, str]
+
+
+def upsert_planificaciones(plan_month, filas: Iterable[Tuple[Clave, dict]]) -> Dict[str, int]:
+    """
+    Upsert de `filas` ((item_code, sucursal), valores) en bloques de BULK_BATCH_SIZE:
+    cada bloque se compara contra las Planificaciones del mes con esos códigos y
+    solo se escriben las nuevas o las que cambiaron. Las que cambian vuelven a
+    'pending' para que la normalización las recoja.
+    """
+    totales = {"created": 0, "updated": 0, "unchanged": 0}
+    filas = iter(filas)
+    while True:
+        bloque = list(islice(filas, BULK_BATCH_SIZE))
+        if not bloque:
+            return totales
+        for key, value in _upsert_bloque(plan_month, bloque).items():
+            totales[key] += value
+
+
+def _upsert_bloque(plan_month, bloque) -> Dict[str, int]:
+    claves = {clave for clave, _ in bloque}
+    existing = {
+        (row[1], row[2]): (row[0], row[3:])
+        for row in Planificacion.objects.filter(
+            plan_month=plan_month, item_code__in={item_code for item_code, _ in claves}
+        ).values_list("id", "item_code", "sucursal", *DATA_FIELDS)
+        if (row[1], row[2]) in claves
+    }
+    to_create = []
+    to_update = []
+    unchanged = 0
+    for (item_code, sucursal), values in bloque:
+        current = existing.get((item_code, sucursal))
+        if current is None:
+            to_create.append(asignar_claves(
+                Planificacion(plan_month=plan_month, item_code=item_code, sucursal=sucursal, **values)
+            ))
+            continue
+        pk, old_values = current
+        if tuple(old_values) == tuple(values[f] for f in DATA_FIELDS):
+            unchanged += 1
+            continue
+        to_update.append(asignar_claves(
+            Planificacion(
+                pk=pk,
+                item_code=item_code,
+                sucursal=sucursal,
+                normalize_status="pending",
+                normalize_notes="",
+                normalized_at=None,
+                **values,
+            )
+        ))
+
+    with transaction.atomic():
+        Planificacion.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        Planificacion.objects.bulk_update(
+            to_update,
+            DATA_FIELDS + campos_clave(Planificacion) + ["normalize_status", "normalize_notes", "normalized_at"],
+            batch_size=BULK_BATCH_SIZE,
+        )
+    return {"created": len(to_create), "updated": len(to_update), "unchanged": unchanged}
+
+
+def _filas_lote(batch: PlanningBatch) -> Iterator[Tuple[Clave, dict]]:
+    """
+    Detalle del lote agregado en SQL por (item_code, sucursal), leído por bloques.
+    Si la clave se repite se suma `a_despachar_total`; los textos toman el mayor.
+    Ordenado por código para que cada bloque del upsert toque pocos códigos.
+    """
+    agregados = (
+        PlanningEntry.objects.filter(batch=batch)
+        .values("item_code", "sucursal")
+        .annotate(
+            total=Sum("a_despachar_total"),
+            tipo=Max("tipo_carga"),
+            nombre=Max("item_name"),
+            origen=Max("cendis"),
+        )
+        .order_by("item_code", "sucursal")
+    )
+    for row in agregados.iterator(chunk_size=BULK_BATCH_SIZE):
+        yield (row["item_code"] or "", row["sucursal"] or ""), {
+            "tipo_carga": row["tipo"] or "",
+            "item_name": row["nombre"] or "",
+            "cendis": row["origen"] or "",
+            "a_despachar_total": row["total"],
+        }
+
+
+def sincronizar_lote(batch: PlanningBatch) -> Dict[str, int]:
+    """Vuelca un lote ya guardado a Planificacion (GROUP BY de la clave en SQL) y le pone la marca de agua."""
+    with transaction.atomic():
+        result = upsert_planificaciones(batch.plan_date, _filas_lote(batch))
+        PlanningBatch.objects.filter(id=batch.id).update(synced_at=timezone.now())
+    return result
+
+
+def sincronizar_lotes_pendientes(progreso=sin_progreso, limit: Optional[int] = None) -> Dict[str, int]:
+    """Vuelca, en orden de carga, los lotes que aún no tienen marca de agua."""
+    pendientes = PlanningBatch.objects.filter(synced_at__isnull=True).order_by("id")
+    if limit:
+        pendientes = pendientes[:limit]
+    lotes = list(pendientes)
+    totales = {"batches": 0, "created": 0, "updated": 0, "unchanged": 0}
+    progreso(0, len(lotes), force=True)
+    for batch in lotes:
+        result = sincronizar_lote(batch)
+        totales["batches"] += 1
+        for key, value in result.items():
+            totales[key] += value
+        progreso(totales["batches"])
+    return totales
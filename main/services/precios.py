@@ -0,0 +1,96 @@
+"""
+Índice de precios (PVP) compartido por todo lo que calcula USD.
+
+Se compila una vez desde `Pvp.objects.values_list("sku", "price")` (sin
+instanciar modelos) como un dict SKU en minúsculas -> PVP, la misma clave que
+`HechoCumplimiento.sku_key`, y se guarda en memoria del proceso junto con un
+número de versión. Igual que el resolver (ver services.resolver), la versión
+vive en el cache de Django, compartido entre el servidor web y el worker: las
+altas, cambios y bajas de Pvp la renuevan vía señales (`MainConfig.ready`, que
+cubre las correcciones de `PvpIssuesView`) y las escrituras masivas sin señales
+(la carga de PVP de `HomeView`) llaman a `invalidate()`.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import Pvp
+
+VERSION_KEY = "precios:version"
+CERO = Decimal("0")
+
+_lock = threading.Lock()
+_local: Optional["IndicePrecios"] = None
+
+
+def sku_key(sku) -> str:
+    """Clave de un SKU en el índice: en minúsculas (como HechoCumplimiento.sku_key)."""
+    return str(sku).lower() if sku else ""
+
+
+@dataclass(frozen=True)
+class IndicePrecios:
+    """SKU en minúsculas -> PVP."""
+    version: int
+    precios: Dict[str, Decimal]
+
+    def precio(self, key: str) -> Decimal:
+        """PVP de una clave ya normalizada (ver `sku_key`); 0 si el SKU no tiene PVP."""
+        return self.precios.get(key, CERO)
+
+    def precio_sku(self, sku) -> Decimal:
+        return self.precio(sku_key(sku))
+
+    def __len__(self) -> int:
+        return len(self.precios)
+
+
+def _current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Primera vez o clave expulsada del cache: cualquier valor nuevo fuerza recompilar
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _compile(version: int) -> IndicePrecios:
+    return IndicePrecios(
+        version=version,
+        precios={sku_key(sku): price for sku, price in Pvp.objects.values_list("sku", "price")},
+    )
+
+
+def get_precios() -> IndicePrecios:
+    """El índice vigente; solo recompila si alguien invalidó desde la última vez."""
+    global _local
+    version = _current_version()
+    indice = _local
+    if indice is not None and indice.version == version:
+        return indice
+    with _lock:
+        if _local is None or _local.version != version:
+            _local = _compile(version)
+        return _local
+
+
+def _bump_version() -> None:
+    global _local
+    _local = None
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate(**kwargs) -> None:
+    """
+    Invalida el índice en todos los procesos. Usable directamente como receptor de señal.
+    La versión se renueva al confirmar la transacción para que otro proceso no
+    recompile con precios aún sin commit.
+    """
+    global _local
+    _local = None
+    transaction.on_commit(_bump_version)
@@ -0,0 +1,201 @@
+"""
+Re-normalización incremental por cambios en maestros, mapeos e ignorados.
+
+El resultado de una fila cruda depende solo de la clave (`normalize_key`) de sus
+tres valores: sucursal, CEDIS y producto. Si cambia un Cendis, una Sucursal, un
+Product, un mapeo o una regla de ignorado, solo pueden cambiar las filas cuya
+clave coincide con alguna de las claves tocadas. Las señales (ver
+`MainConfig.ready`) acumulan esas claves durante la transacción y, al confirmar,
+se encola una tarea "renormalizar" (ver services.tareas) que re-resuelve solo
+esas filas con `services.normalizacion`. Si ninguna fila cruda tiene esas claves
+no se encola nada; si la transacción se revierte, sus claves se descartan.
+
+Índice inverso clave -> filas: las columnas de clave persistidas e indexadas
+(`sucursal_key`, `origen_key`, …; ver services.claves), filtradas con `__in`.
+
+Solo se tocan filas ya normalizadas (ok, error o ignorado): las pendientes las
+recoge la próxima pasada completa, salvo que se pida `incluir_pendientes` (las
+correcciones de nombres, ver `renormalizar_al_confirmar`, que encolan la misma tarea).
+"""
+import threading
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from typing import Dict, Set
+
+from django.db import transaction
+from django.db.models import Q
+
+from ..models import (
+    Cendis, IgnorarCedis, IgnorarSucursal, MapeoCedis, MapeoSucursal, Planificacion, Product, Salida, Sucursal,
+)
+from . import normalizacion
+from .resolver import normalize_key
+from .tareas import enqueue, register_task, sin_progreso
+
+# Tope de valores por `__in` (SQLite admite 32766 parámetros por consulta)
+MAX_VALORES = 2000
+
+DIMENSIONES = ("sucursal", "cedis", "producto")
+
+# Columna de clave de cada dimensión
+PLANIFICACION_CLAVES = {"sucursal": "sucursal_key", "cedis": "cendis_key", "producto": "item_key"}
+SALIDA_CLAVES = {"sucursal": "destino_key", "cedis": "origen_key", "producto": "sku_key"}
+CRUDOS = ((Planificacion, PLANIFICACION_CLAVES), (Salida, SALIDA_CLAVES))
+
+_pendiente = threading.local()
+
+
+def _vacio() -> Dict[str, Set[str]]:
+    return {dimension: set() for dimension in DIMENSIONES}
+
+
+def claves_de(instance) -> Dict[str, Set[str]]:
+    """Claves que un maestro, mapeo o ignorado aporta al resolver."""
+    claves = _vacio()
+    if isinstance(instance, (MapeoCedis, IgnorarCedis)):
+        claves["cedis"].add(normalize_key(instance.nombre_crudo))
+    elif isinstance(instance, (MapeoSucursal, IgnorarSucursal)):
+        claves["sucursal"].add(normalize_key(instance.nombre_crudo))
+    elif isinstance(instance, Cendis):
+        claves["cedis"].update(normalize_key(v) for v in (instance.origin, instance.pk, instance.code))
+    elif isinstance(instance, Sucursal):
+        claves["sucursal"].update(normalize_key(v) for v in (instance.name, instance.bpl_id))
+    elif isinstance(instance, Product):
+        claves["producto"].add(normalize_key(instance.code))
+    for valores in claves.values():
+        valores.discard("")
+    return claves
+
+
+# -----------------------------------------------------
+# Receptores de señales
+# -----------------------------------------------------
+
+def recordar_previas(sender, instance, raw=False, **kwargs) -> None:
+    """pre_save: si la fila ya existía, sus claves anteriores también se ven afectadas."""
+    if raw or instance.pk is None:
+        return
+    previa = sender.objects.filter(pk=instance.pk).first()
+    if previa is not None:
+        instance._claves_previas = claves_de(previa)
+
+
+def registrar_cambio(sender, instance, raw=False, **kwargs) -> None:
+    """post_save/post_delete: acumula las claves de la transacción y re-normaliza al confirmar."""
+    if raw:
+        return
+    claves = claves_de(instance)
+    for dimension, valores in getattr(instance, "_claves_previas", _vacio()).items():
+        claves[dimension] |= valores
+    pendiente = getattr(_pendiente, "aplicar", None)
+    if pendiente is not None and _en_espera(pendiente):
+        # Otro cambio de la misma transacción: una sola re-normalización al confirmar
+        for dimension, valores in claves.items():
+            pendiente.claves[dimension] |= valores
+        return
+
+    def aplicar():
+        _pendiente.aplicar = None
+        _aplicar_pendientes(claves)
+
+    # Las claves viajan con el callback: si la transacción (o el savepoint) se
+    # revierte, Django lo descarta y el siguiente cambio empieza de cero
+    aplicar.claves = claves
+    _pendiente.aplicar = aplicar
+    # robust: un fallo aquí no debe romper el request cuyo cambio ya se confirmó
+    transaction.on_commit(aplicar, robust=True)
+
+
+def _en_espera(callback) -> bool:
+    """¿Sigue `callback` en la cola on_commit de la transacción en curso?"""
+    conexion = transaction.get_connection()
+    return conexion.in_atomic_block and any(func is callback for _, func, _ in conexion.run_on_commit)
+
+
+def _aplicar_pendientes(claves: Dict[str, Set[str]], incluir_pendientes: bool = False) -> None:
+    """Encola la re-normalización de `claves`, solo si alguna fila cruda las usa."""
+    if not any(_con_filas(modelo, columnas, claves, incluir_pendientes) for modelo, columnas in CRUDOS):
+        return
+    enqueue(
+        "renormalizar",
+        claves={dimension: sorted(valores) for dimension, valores in claves.items()},
+        incluir_pendientes=incluir_pendientes,
+    )
+
+
+@register_task("renormalizar")
+def tarea_renormalizar(params, progreso=sin_progreso):
+    return renormalizar_claves(
+        {dimension: set(valores) for dimension, valores in params["claves"].items()},
+        incluir_pendientes=params.get("incluir_pendientes", False),
+    )
+
+
+# -----------------------------------------------------
+# Re-normalización
+# -----------------------------------------------------
+
+def _filtros(columnas: Dict[str, str], claves: Dict[str, Set[str]], incluir_pendientes: bool):
+    """
+    Un Q (OR de las dimensiones tocadas) por tramo de claves: una sola pasada por
+    fila aunque cambien varias dimensiones, sin pasar el límite de parámetros.
+    """
+    base = Q() if incluir_pendientes else ~Q(normalize_status="pending")
+    pares = [
+        (columnas[dimension], clave)
+        for dimension in DIMENSIONES
+        for clave in sorted(claves.get(dimension, ()))
+    ]
+    for start in range(0, len(pares), MAX_VALORES):
+        por_campo = defaultdict(list)
+        for campo, valor in pares[start:start + MAX_VALORES]:
+            por_campo[campo].append(valor)
+        yield base & reduce(or_, (Q(**{f"{campo}__in": valores}) for campo, valores in por_campo.items()))
+
+
+def _con_filas(modelo, columnas: Dict[str, str], claves: Dict[str, Set[str]], incluir_pendientes: bool = False):
+    """Los filtros de `_filtros` que tienen alguna fila cruda (un EXISTS por tramo)."""
+    return [
+        filtro for filtro in _filtros(columnas, claves, incluir_pendientes)
+        if modelo.objects.filter(filtro).exists()
+    ]
+
+
+def renormalizar_claves(claves: Dict[str, Set[str]], incluir_pendientes: bool = False) -> Dict[str, dict]:
+    """Re-resuelve las filas de Planificacion y Salida que dependen de `claves` (sin pasadas vacías)."""
+    totales = {"planificacion": {}, "salidas": {}}
+    for filtro in _con_filas(Planificacion, PLANIFICACION_CLAVES, claves, incluir_pendientes):
+        _sumar(totales["planificacion"], normalizacion.normalizar_planificaciones(filtro=filtro))
+    for filtro in _con_filas(Salida, SALIDA_CLAVES, claves, incluir_pendientes):
+        _sumar(totales["salidas"], normalizacion.normalizar_salidas(filtro=filtro))
+    return totales
+
+
+def renormalizar(sucursales=(), cedis=(), productos=(), incluir_pendientes: bool = False) -> Dict[str, dict]:
+    """Igual que `renormalizar_claves`, a partir de valores crudos o nombres oficiales."""
+    return renormalizar_claves(_claves(sucursales, cedis, productos), incluir_pendientes=incluir_pendientes)
+
+
+def renormalizar_al_confirmar(sucursales=(), cedis=(), productos=()) -> None:
+    """
+    Para vistas que reescriben valores crudos (correcciones de nombres): al
+    confirmar, encola la re-normalización de las filas que quedaron con esos
+    valores, pendientes incluidas (la misma tarea "renormalizar" de los maestros).
+    """
+    claves = _claves(sucursales, cedis, productos)
+    # robust: un fallo al encolar no debe romper el request cuya corrección ya se confirmó
+    transaction.on_commit(lambda: _aplicar_pendientes(claves, incluir_pendientes=True), robust=True)
+
+
+def _claves(sucursales, cedis, productos) -> Dict[str, Set[str]]:
+    return {
+        "sucursal": {normalize_key(v) for v in sucursales} - {""},
+        "cedis": {normalize_key(v) for v in cedis} - {""},
+        "producto": {normalize_key(v) for v in productos} - {""},
+    }
+
+
+def _sumar(total: dict, parcial: dict) -> None:
+    for key, value in parcial.items():
+        total[key] = total.get(key, 0) + value
@@ -0,0 +1,150 @@
+"""
+Tablas de búsqueda compartidas por la normalización y el resolutor de errores.
+
+Se compilan una vez desde Sucursal, Cendis, Product, MapeoCedis, MapeoSucursal,
+IgnorarCedis e IgnorarSucursal y se guardan en memoria del proceso junto con un
+número de versión. La versión vive en el cache de Django (compartido entre el
+servidor web y el worker); cualquier alta, cambio o baja en esos modelos la
+renueva vía señales (ver `MainConfig.ready`) y el siguiente `get_resolver()`
+recompila. Las escrituras masivas que no disparan señales (bulk_create/update,
+QuerySet.update) deben llamar a `invalidate()`.
+
+Orden de búsqueda (igual que antes en las vistas):
+1. Maestro oficial por nombre, ID o código (Sucursal: nombre y BPL_ID).
+2. Mapeo por nombre_crudo (los mapeos nunca pisan una clave oficial).
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import Cendis, IgnorarCedis, IgnorarSucursal, MapeoCedis, MapeoSucursal, Product, Sucursal
+
+VERSION_KEY = "resolver:version"
+
+_lock = threading.Lock()
+_local: Optional["Resolver"] = None
+
+
+def normalize_key(value) -> str:
+    """Clave de búsqueda de un nombre crudo: sin espacios extremos y en minúsculas."""
+    if value is None:
+        return ""
+    return str(value).strip().lower()
+
+
+@dataclass(frozen=True)
+class Resolver:
+    """Mapas clave -> id. Guarda ids y no instancias para que 100k productos ocupen poco."""
+    version: int
+    sucursales: Dict[str, int]
+    cedis: Dict[str, int]
+    productos: Dict[str, int]
+    ignorar_cedis: FrozenSet[str]
+    ignorar_sucursales: FrozenSet[str]
+    # Para sugerencias del resolutor de errores
+    nombres_sucursales: List[str] = field(default_factory=list)
+    nombres_cedis: List[str] = field(default_factory=list)
+    productos_codigo_nombre: List[Tuple[str, str]] = field(default_factory=list)
+
+    def sucursal(self, raw) -> Optional[int]:
+        return self.sucursales.get(normalize_key(raw))
+
+    def cendis(self, raw) -> Optional[int]:
+        return self.cedis.get(normalize_key(raw))
+
+    def producto(self, raw) -> Optional[int]:
+        return self.productos.get(normalize_key(raw))
+
+    def cedis_ignorado(self, raw) -> bool:
+        key = normalize_key(raw)
+        return bool(key) and key in self.ignorar_cedis
+
+    def sucursal_ignorada(self, raw) -> bool:
+        key = normalize_key(raw)
+        return bool(key) and key in self.ignorar_sucursales
+
+
+def _current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Primera vez o clave expulsada del cache: cualquier valor nuevo fuerza recompilar
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _compile(version: int) -> Resolver:
+    sucursales: Dict[str, int] = {}
+    nombres_sucursales: List[str] = []
+    for pk, name, bpl_id in Sucursal.objects.values_list("id", "name", "bpl_id"):
+        nombres_sucursales.append(name)
+        sucursales[normalize_key(name)] = pk  # Por nombre
+        sucursales[normalize_key(bpl_id)] = pk  # Por BPL_ID
+
+    cedis: Dict[str, int] = {}
+    nombres_cedis: List[str] = []
+    for pk, origin, code in Cendis.objects.values_list("id", "origin", "code"):
+        nombres_cedis.append(origin)
+        cedis[normalize_key(origin)] = pk  # Por nombre (origin)
+        cedis[normalize_key(pk)] = pk  # Por ID
+        if code:
+            cedis[normalize_key(code)] = pk  # Por código
+
+    # Mapeos: nombre_crudo -> oficial, sin pisar claves del maestro
+    for nombre, pk in MapeoCedis.objects.values_list("nombre_crudo", "cedis_oficial_id"):
+        cedis.setdefault(normalize_key(nombre), pk)
+    for nombre, pk in MapeoSucursal.objects.values_list("nombre_crudo", "sucursal_oficial_id"):
+        sucursales.setdefault(normalize_key(nombre), pk)
+
+    productos_codigo_nombre = list(Product.objects.values_list("code", "name"))
+    productos = {normalize_key(code): pk for pk, code in Product.objects.values_list("id", "code")}
+
+    return Resolver(
+        version=version,
+        sucursales=sucursales,
+        cedis=cedis,
+        productos=productos,
+        ignorar_cedis=frozenset(normalize_key(n) for n in IgnorarCedis.objects.values_list("nombre_crudo", flat=True)),
+        ignorar_sucursales=frozenset(normalize_key(n) for n in IgnorarSucursal.objects.values_list("nombre_crudo", flat=True)),
+        nombres_sucursales=nombres_sucursales,
+        nombres_cedis=nombres_cedis,
+        productos_codigo_nombre=productos_codigo_nombre,
+    )
+
+
+def get_resolver() -> Resolver:
+    """El resolver vigente; solo recompila si alguien invalidó desde la última vez."""
+    global _local
+    version = _current_version()
+    resolver = _local
+    if resolver is not None and resolver.version == version:
+        return resolver
+    with _lock:
+        if _local is None or _local.version != version:
+            _local = _compile(version)
+        return _local
+
+
+def _bump_version() -> None:
+    global _local
+    _local = None
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate(**kwargs) -> None:
+    """
+    Invalida el resolver en todos los procesos. Usable directamente como receptor de señal.
+    La versión se renueva al confirmar la transacción para que otro proceso no
+    recompile con datos aún sin commit.
+    """
+    global _local
+    _local = None
+    transaction.on_commit(_bump_version)
+
+
+# Modelos cuyos cambios afectan la resolución
+SOURCE_MODELS = (Sucursal, Cendis, Product, MapeoCedis, MapeoSucursal, IgnorarCedis, IgnorarSucursal)
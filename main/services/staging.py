@@ -0,0 +1,189 @@
+"""
+Área de staging para archivos Excel subidos.
+
+El primer POST guarda el archivo una sola vez bajo su hash SHA-256 y lo parsea
+una sola vez: cada hoja se vuelca a disco como una secuencia de bloques pickle
+de filas (tuplas de valores). Los pasos siguientes (cambiar de hoja en la
+previsualización, importar) usan el token y leen esos bloques en streaming,
+sin volver a subir ni a parsear el .xlsx.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from openpyxl import load_workbook
+
+CHUNK_ROWS = 5000
+_TOKEN_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class StagingError(Exception):
+    """El archivo no se pudo leer o el token no existe / expiró."""
+
+
+def _staging_dir() -> Path:
+    return Path(getattr(settings, "UPLOAD_STAGING_DIR", Path(settings.MEDIA_ROOT) / "staging"))
+
+
+def _ttl_seconds() -> int:
+    return int(getattr(settings, "UPLOAD_STAGING_TTL_HOURS", 24)) * 3600
+
+
+class StagedUpload:
+    """Archivo ya parseado. Las filas se leen de disco bajo demanda, bloque a bloque."""
+
+    def __init__(self, token: str, path: Path, meta: Dict[str, Any]):
+        self.token = token
+        self.path = path
+        self.filename: str = meta["filename"]
+        self.sheet_names: List[str] = meta["sheet_names"]
+        self._sheets: Dict[str, Dict[str, Any]] = meta["sheets"]
+
+    def headers(self, sheet_name: str) -> Optional[tuple]:
+        headers = self._sheet(sheet_name)["headers"]
+        return tuple(headers) if headers is not None else None
+
+    def row_count(self, sheet_name: str) -> int:
+        return self._sheet(sheet_name)["rows"]
+
+    def iter_rows(self, sheet_name: str) -> Iterator[tuple]:
+        """Filas de datos (sin encabezado) como generador."""
+        chunk_file = self.path / self._sheet(sheet_name)["file"]
+        with open(chunk_file, "rb") as fh:
+            while True:
+                try:
+                    chunk = pickle.load(fh)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def preview(self, sheet_name: str, limit: int = 10) -> List[List[Any]]:
+        return [list(r) for r in islice(self.iter_rows(sheet_name), limit)]
+
+    def _sheet(self, sheet_name: str) -> Dict[str, Any]:
+        try:
+            return self._sheets[sheet_name]
+        except KeyError:
+            raise StagingError(f"La hoja '{sheet_name}' no existe en el archivo.")
+
+
+def stage_upload(upload) -> StagedUpload:
+    """
+    Guarda y parsea `upload` (UploadedFile). Si ya existe un staging con el mismo
+    contenido se reutiliza sin volver a parsear.
+    """
+    base = _staging_dir()
+    base.mkdir(parents=True, exist_ok=True)
+    purge_expired()
+
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    token = digest.hexdigest()
+
+    staged = get_staged(token)
+    if staged is not None:
+        return staged
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{token[:12]}-", dir=base))
+    try:
+        source = tmp_dir / "original.xlsx"
+        with open(source, "wb") as fh:
+            for chunk in upload.chunks():
+                fh.write(chunk)
+        meta = _parse_workbook(source, tmp_dir)
+        meta["filename"] = upload.name
+        meta["created"] = time.time()
+        with open(tmp_dir / "meta.json", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        try:
+            os.replace(tmp_dir, base / token)
+        except OSError:
+            # Otro request ya dejó el mismo archivo en staging
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    staged = get_staged(token)
+    if staged is None:
+        raise StagingError("No se pudo preparar el archivo subido.")
+    return staged
+
+
+def get_staged(token: Optional[str]) -> Optional[StagedUpload]:
+    if not token or not _TOKEN_RE.match(token):
+        return None
+    path = _staging_dir() / token
+    try:
+        with open(path / "meta.json", encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    try:
+        # Renovar la vigencia: un staging en uso no debe expirar entre previsualizar e importar
+        os.utime(path)
+    except OSError:
+        pass
+    return StagedUpload(token, path, meta)
+
+
+def purge_expired() -> None:
+    """Elimina los staging más viejos que UPLOAD_STAGING_TTL_HOURS."""
+    base = _staging_dir()
+    if not base.exists():
+        return
+    limit = time.time() - _ttl_seconds()
+    for entry in base.iterdir():
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < limit:
+                shutil.rmtree(entry, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def _parse_workbook(source: Path, target: Path) -> Dict[str, Any]:
+    try:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    except Exception as exc:
+        raise StagingError(f"No se pudo leer el Excel: {exc}")
+
+    sheets: Dict[str, Dict[str, Any]] = {}
+    try:
+        for position, name in enumerate(workbook.sheetnames):
+            rows = workbook[name].iter_rows(values_only=True)
+            headers = next(rows, None)
+            file_name = f"hoja_{position}.pkl"
+            count = 0
+            with open(target / file_name, "wb") as fh:
+                while True:
+                    chunk = list(islice(rows, CHUNK_ROWS))
+                    if not chunk:
+                        break
+                    pickle.dump(chunk, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                    count += len(chunk)
+            sheets[name] = {
+                "file": file_name,
+                "headers": [_json_header(h) for h in headers] if headers is not None else None,
+                "rows": count,
+            }
+        sheet_names = list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+    return {"sheet_names": sheet_names, "sheets": sheets}
+
+
+def _json_header(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
@@ -0,0 +1,220 @@
+"""
+Ejecución de importaciones y normalizaciones en segundo plano.
+
+Las vistas encolan una `Tarea` y responden de inmediato; un proceso local
+(`python manage.py procesar_tareas`) las toma de la base de datos y las ejecuta.
+No requiere broker externo: el reclamo de tareas es un UPDATE condicional
+(status='queued' -> 'running'), seguro con varios workers en SQLite o Postgres.
+
+El progreso se publica en el cache de Django (FileBasedCache compartido entre
+procesos) porque los handlers suelen correr dentro de una transacción larga y
+sus escrituras en la tabla de tareas no serían visibles hasta el commit.
+"""
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from importlib import import_module
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ..models import Tarea
+
+# Módulos que registran handlers con @register_task al importarse
+HANDLER_MODULES = ["main.views", "main.services.renormalizacion"]
+
+_HANDLERS: Dict[str, Callable[..., Dict[str, Any]]] = {}
+
+
+def register_task(kind: str):
+    """Registra `func(params, progreso) -> dict` como handler de las tareas `kind`."""
+    def decorator(func):
+        _HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def _load_handlers() -> None:
+    for module in HANDLER_MODULES:
+        import_module(module)
+
+
+def _progress_key(tarea_id: int) -> str:
+    return f"tarea:{tarea_id}:progreso"
+
+
+class Progreso:
+    """
+    Callable que recibe (procesados, total) desde el handler. Publica como máximo
+    una actualización por `intervalo` segundos para no penalizar los bucles.
+    """
+
+    def __init__(self, tarea_id: int, intervalo: float = 1.0):
+        self.tarea_id = tarea_id
+        self.intervalo = intervalo
+        self.processed = 0
+        self.total: Optional[int] = None
+        self._last = 0.0
+
+    def __call__(self, processed: int, total: Optional[int] = None, force: bool = False) -> None:
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if force or now - self._last >= self.intervalo:
+            self._last = now
+            cache.set(
+                _progress_key(self.tarea_id),
+                {"processed": self.processed, "total": self.total},
+                timeout=24 * 3600,
+            )
+
+
+def sin_progreso(processed: int, total: Optional[int] = None, force: bool = False) -> None:
+    """Progreso nulo para llamar a un handler directamente, fuera del worker."""
+
+
+def enqueue(kind: str, **params) -> Tarea:
+    """Crea la tarea. Con JOBS_ASYNC=False se ejecuta en el mismo request (útil en desarrollo)."""
+    tarea = Tarea.objects.create(kind=kind, params=params)
+    if not getattr(settings, "JOBS_ASYNC", True):
+        claimed = Tarea.objects.filter(id=tarea.id, status="queued").update(
+            status="running", started_at=timezone.now(), worker="inline"
+        )
+        if claimed:
+            tarea.refresh_from_db()
+            run_task(tarea)
+        tarea.refresh_from_db()
+    return tarea
+
+
+def claim_next(worker: str) -> Optional[Tarea]:
+    """Toma la tarea en cola más antigua; devuelve None si otro worker la ganó o no hay."""
+    candidate = (
+        Tarea.objects.filter(status="queued")
+        .order_by("created_at", "id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if candidate is None:
+        return None
+    claimed = Tarea.objects.filter(id=candidate, status="queued").update(
+        status="running", started_at=timezone.now(), worker=worker
+    )
+    if not claimed:
+        return None
+    return Tarea.objects.get(id=candidate)
+
+
+def run_task(tarea: Tarea) -> None:
+    """Ejecuta una tarea ya reclamada y deja el resultado o el error en la fila."""
+    _load_handlers()
+    progreso = Progreso(tarea.id)
+    handler = _HANDLERS.get(tarea.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Tipo de tarea desconocido: {tarea.kind}")
+        result = handler(tarea.params, progreso)
+    except Exception as exc:
+        Tarea.objects.filter(id=tarea.id).update(
+            status="failed",
+            error=f"{exc}\n\n{traceback.format_exc()}",
+            processed=progreso.processed,
+            total=progreso.total,
+            finished_at=timezone.now(),
+        )
+    else:
+        Tarea.objects.filter(id=tarea.id).update(
+            status="done",
+            result=result or {},
+            processed=progreso.processed,
+            total=progreso.total,
+            finished_at=timezone.now(),
+        )
+    finally:
+        cache.delete(_progress_key(tarea.id))
+
+
+def fail_stale(max_age: timedelta) -> int:
+    """Marca como fallidas las tareas 'running' abandonadas (worker caído)."""
+    return Tarea.objects.filter(
+        status="running", started_at__lt=timezone.now() - max_age
+    ).update(status="failed", error="Tarea interrumpida: el worker dejó de responder.", finished_at=timezone.now())
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work_forever(poll_seconds: float = 2.0, once: bool = False, log: Callable[[str], None] = print) -> None:
+    _load_handlers()
+    name = worker_name()
+    while True:
+        close_old_connections()
+        tarea = claim_next(name)
+        if tarea is None:
+            if once:
+                return
+            time.sleep(poll_seconds)
+            continue
+        log(f"▶️ Tarea #{tarea.id} ({tarea.kind})")
+        run_task(tarea)
+        tarea.refresh_from_db(fields=["status"])
+        log(f"{'✅' if tarea.status == 'done' else '❌'} Tarea #{tarea.id}: {tarea.status}")
+
+
+def status_payload(tarea: Tarea) -> Dict[str, Any]:
+    """Estado para el endpoint JSON: filas procesadas, velocidad (filas/s) y ETA (s)."""
+    processed = tarea.processed
+    total = tarea.total
+    if tarea.status == "running":
+        live = cache.get(_progress_key(tarea.id))
+        if live:
+            processed = live.get("processed", processed)
+            total = live.get("total", total)
+
+    rate = None
+    eta = None
+    if tarea.started_at:
+        end = tarea.finished_at or timezone.now()
+        elapsed = (end - tarea.started_at).total_seconds()
+        if elapsed > 0 and processed:
+            rate = round(processed / elapsed, 1)
+            if total and tarea.status == "running":
+                eta = round(max(total - processed, 0) / rate, 1) if rate else None
+
+    return {
+        "id": tarea.id,
+        "kind": tarea.kind,
+        "status": tarea.status,
+        "status_display": tarea.get_status_display(),
+        "processed": processed,
+        "total": total,
+        "rate": rate,
+        "eta_seconds": eta,
+        "error": tarea.error.split("\n\n", 1)[0] if tarea.error else "",
+        "finished": tarea.is_finished,
+    }
+
+
+def tarea_desde_request(request, kind: str) -> Optional[Tarea]:
+    """La tarea indicada en `?job=` si existe y es del tipo esperado."""
+    job_id = request.GET.get("job")
+    if not job_id or not job_id.isdigit():
+        return None
+    return Tarea.objects.filter(id=int(job_id), kind=kind).first()
+
+
+def contexto_tarea(tarea: Optional[Tarea]) -> Dict[str, Any]:
+    """Variables que espera `_tarea_progreso.html`."""
+    if tarea is None:
+        return {"job": None}
+    return {
+        "job": tarea,
+        "job_error": tarea.error.split("\n\n", 1)[0] if tarea.error else "",
+    }
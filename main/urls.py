@@ -9,6 +9,7 @@ from .views import (
     SalidaNormalizeView,
     SalidaUploadView,
     TableroNormalizadoView,
+    TableroNivelView,
     PvpIssuesView,
     UploadMenuView,
     PlanificacionErrorResolverView,
@@ -21,6 +22,7 @@ from .views import (
     CorreccionSucursalesView,
     NormalizarTodoView,
     LimpiarTodoView,
+    TareaEstadoView,
 )
 
 urlpatterns = [
@@ -34,6 +36,7 @@ urlpatterns = [
     path("salidas/normalizar/", SalidaNormalizeView.as_view(), name="salida_normalize"),
     path("salidas/errores/", SalidaErrorResolverView.as_view(), name="salida_error_resolver"),
     path("tablero/normalizado/", TableroNormalizadoView.as_view(), name="tablero_normalizado"),
+    path("tablero/normalizado/nivel/", TableroNivelView.as_view(), name="tablero_nivel"),
     path("faltantes/", MissingProductsView.as_view(), name="missing_products"),
     path("pvp/faltantes/", PvpIssuesView.as_view(), name="pvp_issues"),
     # Admin maestros (legacy)
@@ -49,5 +52,7 @@ urlpatterns = [
     path("normalizar/", NormalizarTodoView.as_view(), name="normalizar_todo"),
     # Limpiar datos
     path("limpiar/", LimpiarTodoView.as_view(), name="limpiar_todo"),
+    # Progreso de tareas en segundo plano
+    path("tareas/<int:pk>/", TareaEstadoView.as_view(), name="tarea_estado"),
 ]
 
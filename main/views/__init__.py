@@ -7,7 +7,7 @@ from .planning_upload import PlanningUploadView
 from .salida_normalize import SalidaNormalizeView
 from .salida_upload import SalidaUploadView
 from .upload_menu import UploadMenuView
-from .tablero_normalizado import TableroNormalizadoView
+from .tablero_normalizado import TableroNivelView, TableroNormalizadoView
 from .error_resolver import PlanificacionErrorResolverView, SalidaErrorResolverView
 from .admin_maestros import AdminCedisView, AdminSucursalesView
 from .biblioteca_maestros import BibliotecaCedisView, BibliotecaSucursalesView
@@ -15,6 +15,7 @@ from .correccion_cedis import CorreccionCedisView
 from .correccion_sucursales import CorreccionSucursalesView
 from .normalizar_todo import NormalizarTodoView
 from .limpiar_todo import LimpiarTodoView
+from .tareas import TareaEstadoView
 
 __all__ = [
 	"HomeView",
@@ -25,6 +26,7 @@ __all__ = [
 	"SalidaNormalizeView",
 	"SalidaUploadView",
 	"TableroNormalizadoView",
+	"TableroNivelView",
 	"PvpIssuesView",
 	"UploadMenuView",
 	"PlanificacionErrorResolverView",
@@ -37,5 +39,6 @@ __all__ = [
 	"CorreccionSucursalesView",
 	"NormalizarTodoView",
 	"LimpiarTodoView",
+	"TareaEstadoView",
 ]
 
@@ -2,7 +2,10 @@
 Vista para crear la biblioteca de CEDIS y Sucursales desde los datos crudos.
 El sistema analiza los Excel subidos y pregunta al usuario cuáles son los nombres oficiales.
 Los mapeos se guardan en tablas separadas (MapeoCedis, MapeoSucursal) SIN modificar los datos originales.
+Cada POST es una transacción: al confirmar se re-normalizan de una vez las filas
+afectadas (ver services.renormalizacion).
 """
+from django.db import transaction
 from django.shortcuts import render, redirect
 from django.views import View
 from main.models import (
@@ -137,6 +140,7 @@ class BibliotecaCedisView(View):
         }
         return render(request, self.template_name, context)
 
+    @transaction.atomic
     def post(self, request):
         action = request.POST.get("action")
         
@@ -328,6 +332,7 @@ class BibliotecaSucursalesView(View):
         }
         return render(request, self.template_name, context)
 
+    @transaction.atomic
     def post(self, request):
         action = request.POST.get("action")
         
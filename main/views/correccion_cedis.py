@@ -12,6 +12,9 @@ from django.shortcuts import render
 from django.views import View
 
 from ..models import Cendis, Planificacion, Salida, IgnorarCedis
+from ..services.claves import corregir
+from ..services.renormalizacion import renormalizar_al_confirmar
+from ..services.resolver import normalize_key
 
 logger = logging.getLogger(__name__)
 
@@ -176,49 +179,16 @@ class CorreccionCedisView(View):
             
             idx += 1
         
-        # Aplicar cambios en ignorados
+        # Aplicar cambios en ignorados. Al confirmar, las filas con esos nombres se
+        # re-normalizan solas (services.renormalizacion), sin tocar su estado aquí.
         with transaction.atomic():
-            # Guardar nuevos ignorados
             for nombre in ignorar_nuevos:
                 IgnorarCedis.objects.get_or_create(
                     nombre_crudo=nombre,
                     defaults={"razon": "Ignorado desde corrección de CEDIS"}
                 )
-                # Marcar registros con error como ignorados
-                Planificacion.objects.filter(
-                    cendis=nombre,
-                    normalize_status="error"
-                ).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado por configuración"
-                )
-                Salida.objects.filter(
-                    nombre_sucursal_origen=nombre,
-                    normalize_status="error"
-                ).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado por configuración"
-                )
-            
-            # Eliminar des-ignorados y resetear a pending
             if des_ignorar:
                 IgnorarCedis.objects.filter(nombre_crudo__in=des_ignorar).delete()
-                # Resetear registros ignorados a pending para re-normalizarlos
-                for nombre in des_ignorar:
-                    Planificacion.objects.filter(
-                        cendis=nombre,
-                        normalize_status="ignored"
-                    ).update(
-                        normalize_status="pending",
-                        normalize_notes=""
-                    )
-                    Salida.objects.filter(
-                        nombre_sucursal_origen=nombre,
-                        normalize_status="ignored"
-                    ).update(
-                        normalize_status="pending",
-                        normalize_notes=""
-                    )
         
         # Aplicar correcciones de nombres
         registros_actualizados = {"planificacion": 0, "salida": 0}
@@ -249,35 +219,22 @@ class CorreccionCedisView(View):
         """
         Aplica las correcciones en los datos crudos.
         correcciones: {nombre_crudo: codigo_oficial}
-        También resetea registros con error a pending para re-normalizarlos.
+        Las filas se buscan por clave (índice sobre cendis_key / origen_key), así
+        que también se corrigen variantes de mayúsculas y espacios del mismo nombre.
+        Las filas corregidas quedan en pending y se re-normalizan al confirmar.
         """
         count_planificacion = 0
         count_salida = 0
         
         for nombre_crudo, codigo_oficial in correcciones.items():
-            # Actualizar en Planificacion y resetear a pending
-            updated = Planificacion.objects.filter(cendis=nombre_crudo).update(
-                cendis=codigo_oficial,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_planificacion += updated
+            clave = normalize_key(nombre_crudo)
+            # Planificacion (cendis)
+            count_planificacion += sum(corregir(Planificacion, "cendis_key", clave, codigo_oficial).values())
             
-            # Actualizar en Salida (nombre_almacen_origen) y resetear a pending
-            updated = Salida.objects.filter(nombre_almacen_origen=nombre_crudo).update(
-                nombre_almacen_origen=codigo_oficial,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_salida += updated
-            
-            # También actualizar en Salida (nombre_sucursal_origen) - campo usado en normalización
-            updated = Salida.objects.filter(nombre_sucursal_origen=nombre_crudo).update(
-                nombre_sucursal_origen=codigo_oficial,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_salida += updated
+            # Salida: el origen efectivo (nombre_almacen_origen o, si viene vacío, nombre_sucursal_origen)
+            count_salida += sum(corregir(Salida, "origen_key", clave, codigo_oficial).values())
+        
+        renormalizar_al_confirmar(cedis=correcciones.values())
         
         return {
             "planificacion": count_planificacion,
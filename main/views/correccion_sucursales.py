@@ -12,6 +12,9 @@ from django.shortcuts import render
 from django.views import View
 
 from ..models import Sucursal, Planificacion, Salida, IgnorarSucursal
+from ..services.claves import corregir
+from ..services.renormalizacion import renormalizar_al_confirmar
+from ..services.resolver import normalize_key
 
 logger = logging.getLogger(__name__)
 
@@ -207,65 +210,16 @@ class CorreccionSucursalesView(View):
             
             idx += 1
         
-        # Aplicar cambios en ignorados
+        # Aplicar cambios en ignorados. Al confirmar, las filas con esos nombres se
+        # re-normalizan solas (services.renormalizacion), sin tocar su estado aquí.
         with transaction.atomic():
-            # Guardar nuevos ignorados
             for nombre in ignorar_nuevos:
                 IgnorarSucursal.objects.get_or_create(
                     nombre_crudo=nombre,
                     defaults={"razon": "Ignorado desde corrección de Sucursales"}
                 )
-                # Marcar registros con error como ignorados
-                Planificacion.objects.filter(
-                    sucursal=nombre,
-                    normalize_status="error"
-                ).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado por configuración"
-                )
-                Salida.objects.filter(
-                    nombre_sucursal_destino=nombre,
-                    normalize_status="error"
-                ).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado por configuración"
-                )
-                # También para sucursal_destino_propuesto
-                Salida.objects.filter(
-                    sucursal_destino_propuesto=nombre,
-                    normalize_status="error"
-                ).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado por configuración"
-                )
-            
-            # Eliminar des-ignorados y resetear a pending
             if des_ignorar:
                 IgnorarSucursal.objects.filter(nombre_crudo__in=des_ignorar).delete()
-                # Resetear registros ignorados a pending para re-normalizarlos
-                for nombre in des_ignorar:
-                    Planificacion.objects.filter(
-                        sucursal=nombre,
-                        normalize_status="ignored"
-                    ).update(
-                        normalize_status="pending",
-                        normalize_notes=""
-                    )
-                    Salida.objects.filter(
-                        nombre_sucursal_destino=nombre,
-                        normalize_status="ignored"
-                    ).update(
-                        normalize_status="pending",
-                        normalize_notes=""
-                    )
-                    # También para sucursal_destino_propuesto
-                    Salida.objects.filter(
-                        sucursal_destino_propuesto=nombre,
-                        normalize_status="ignored"
-                    ).update(
-                        normalize_status="pending",
-                        normalize_notes=""
-                    )
         
         # Aplicar correcciones de nombres
         registros_actualizados = {"planificacion": 0, "salida_almacen": 0, "salida_sucursal": 0}
@@ -297,44 +251,25 @@ class CorreccionSucursalesView(View):
         """
         Aplica las correcciones en los datos crudos.
         correcciones: {nombre_crudo: bpl_id}
-        También resetea registros con error a pending para re-normalizarlos.
+        Las filas se buscan por clave (índice sobre sucursal_key / destino_key), así
+        que también se corrigen variantes de mayúsculas y espacios del mismo nombre.
+        Las filas corregidas quedan en pending y se re-normalizan al confirmar.
         """
         count_planificacion = 0
         count_salida_almacen = 0
         count_salida_sucursal = 0
         
         for nombre_crudo, bpl_id in correcciones.items():
-            # Actualizar en Planificacion y resetear a pending
-            updated = Planificacion.objects.filter(sucursal=nombre_crudo).update(
-                sucursal=bpl_id,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_planificacion += updated
+            clave = normalize_key(nombre_crudo)
+            # Planificacion (sucursal)
+            count_planificacion += sum(corregir(Planificacion, "sucursal_key", clave, bpl_id).values())
             
-            # Actualizar en Salida (nombre_almacen_destino) y resetear a pending
-            updated = Salida.objects.filter(nombre_almacen_destino=nombre_crudo).update(
-                nombre_almacen_destino=bpl_id,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_salida_almacen += updated
-            
-            # Actualizar en Salida (nombre_sucursal_destino) y resetear a pending
-            updated = Salida.objects.filter(nombre_sucursal_destino=nombre_crudo).update(
-                nombre_sucursal_destino=bpl_id,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_salida_sucursal += updated
-            
-            # También actualizar sucursal_destino_propuesto (campo usado en normalización)
-            updated = Salida.objects.filter(sucursal_destino_propuesto=nombre_crudo).update(
-                sucursal_destino_propuesto=bpl_id,
-                normalize_status="pending",
-                normalize_notes=""
-            )
-            count_salida_sucursal += updated
+            # Salida: se corrige la columna que define el destino efectivo
+            por_columna = corregir(Salida, "destino_key", clave, bpl_id)
+            count_salida_almacen += por_columna["nombre_almacen_destino"]
+            count_salida_sucursal += por_columna["nombre_sucursal_destino"] + por_columna["sucursal_destino_propuesto"]
+        
+        renormalizar_al_confirmar(sucursales=correcciones.values())
         
         return {
             "planificacion": count_planificacion,
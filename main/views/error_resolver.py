@@ -3,67 +3,80 @@ from collections import defaultdict
 from decimal import Decimal
 
 from django.db import transaction
+from django.db.models import Count
 from django.shortcuts import redirect, render
 from django.views import View
 
-from ..models import Cendis, Planificacion, Product, Salida, Sucursal, IgnorarCedis, IgnorarSucursal
+from ..models import Cendis, Planificacion, Product, Salida, Sucursal
+from ..services.claves import corregir
+from ..services.renormalizacion import renormalizar_al_confirmar
+from ..services.resolver import get_resolver, normalize_key
+
+
+def _errores_agrupados(model, resolver) -> dict:
+    """
+    Errores de `model` agrupados por dimensión y valor crudo: {error_kind: {error_key: cantidad}}.
+    Un solo GROUP BY sobre el índice (normalize_status, error_kind, error_key).
+    """
+    grupos = defaultdict(dict)
+    filas = (
+        model.objects.filter(normalize_status="error")
+        .values("error_kind", "error_key")
+        .annotate(total=Count("id"))
+        .order_by("error_kind", "error_key")
+    )
+    for fila in filas:
+        grupos[fila["error_kind"]][fila["error_key"]] = fila["total"]
+
+    # Valores que ya están en la lista de ignorados: se marcan como ignorados
+    ignorar = {
+        "cedis": [k for k in grupos["cedis"] if resolver.cedis_ignorado(k)],
+        "sucursal": [k for k in grupos["sucursal"] if resolver.sucursal_ignorada(k)],
+    }
+    for error_kind, claves in ignorar.items():
+        if not claves:
+            continue
+        model.objects.filter(normalize_status="error", error_kind=error_kind, error_key__in=claves).update(
+            normalize_status="ignored",
+            normalize_notes="Ignorado por configuración de biblioteca"
+        )
+        for clave in claves:
+            del grupos[error_kind][clave]
+    return grupos
+
+
+# error_type del formulario -> error_kind
+ERROR_TYPES = {"sucursal": "sucursal", "cedis": "cedis", "product": "producto"}
+
+
+def _ignorar_grupo(model, error_type, error_value) -> int:
+    """Marca como ignorados los errores de un grupo de la página (tipo + valor crudo)."""
+    error_kind = ERROR_TYPES.get(error_type)
+    if error_kind is None or error_value is None:
+        return 0
+    return model.objects.filter(normalize_status="error", error_kind=error_kind, error_key=error_value).update(
+        normalize_status="ignored",
+        normalize_notes="Ignorado manualmente"
+    )
 
 
 class PlanificacionErrorResolverView(View):
     template_name = "planificacion_error_resolver.html"
 
     def get(self, request, *args, **kwargs):
-        # Obtener errores agrupados
-        errors = Planificacion.objects.filter(normalize_status="error")
-        
-        # Obtener nombres ignorados
-        cedis_ignorados = set(IgnorarCedis.objects.values_list("nombre_crudo", flat=True))
-        sucursales_ignoradas = set(IgnorarSucursal.objects.values_list("nombre_crudo", flat=True))
-        
-        # Agrupar por tipo de error
-        cedis_origen_faltantes = defaultdict(list)
-        sucursales_faltantes = defaultdict(list)
-        productos_faltantes = defaultdict(list)
-        otros_errores = defaultdict(list)
-        
-        # IDs de registros a marcar como ignorados
-        ids_to_ignore = []
-        
-        for error in errors:
-            notes = error.normalize_notes or ""
-            # Buscar múltiples variantes de mensajes de error
-            if ("CEDIS" in notes and "origen" in notes) or ("cedis" in notes and "origen" in notes) or ("almacén" in notes and "origen" in notes) or "origen no es un CEDIS" in notes or "Origen NO es un almacén CEDIS" in notes or "CEDIS (almacén) origen" in notes:
-                origen_name = error.cendis
-                # Verificar si está ignorado
-                if origen_name and origen_name in cedis_ignorados:
-                    ids_to_ignore.append(error.id)
-                else:
-                    cedis_origen_faltantes[origen_name].append(error.id)
-            elif "Sucursal" in notes or "sucursal" in notes or "tienda" in notes:
-                sucursal_name = error.sucursal
-                # Verificar si está ignorado
-                if sucursal_name and sucursal_name in sucursales_ignoradas:
-                    ids_to_ignore.append(error.id)
-                else:
-                    sucursales_faltantes[sucursal_name].append(error.id)
-            elif "Producto" in notes or "producto" in notes:
-                product_code = error.item_code
-                productos_faltantes[product_code].append(error.id)
-            else:
-                # Errores que no encajan en las categorías anteriores
-                otros_errores[notes[:100]].append(error.id)
-        
-        # Marcar registros como ignorados si su nombre está en la lista de ignorados
-        if ids_to_ignore:
-            Planificacion.objects.filter(id__in=ids_to_ignore).update(
-                normalize_status="ignored",
-                normalize_notes="Ignorado por configuración de biblioteca"
-            )
+        # Tablas de búsqueda compartidas con la normalización (ignorados, maestros)
+        resolver = get_resolver()
+        
+        # Errores agrupados por tipo y valor crudo (cantidad de registros por grupo)
+        grupos = _errores_agrupados(Planificacion, resolver)
+        cedis_origen_faltantes = grupos["cedis"]
+        sucursales_faltantes = grupos["sucursal"]
+        productos_faltantes = grupos["producto"]
         
         # Obtener sucursales, cendis y productos existentes para sugerencias
-        existing_sucursales = list(Sucursal.objects.values_list('name', flat=True))
-        existing_cendis = list(Cendis.objects.values_list('origin', flat=True))
-        existing_products = list(Product.objects.values_list('code', 'name'))
+        existing_sucursales = resolver.nombres_sucursales
+        existing_cendis = resolver.nombres_cedis
+        existing_products = resolver.productos_codigo_nombre
         
         # Generar sugerencias con fuzzy matching para CEDIS origen (busca en Cendis)
         cedis_origen_suggestions = {}
@@ -112,17 +125,16 @@ class PlanificacionErrorResolverView(View):
                 ]
         
         return render(request, self.template_name, {
-            "cedis_origen_faltantes": dict(cedis_origen_faltantes),
-            "sucursales_faltantes": dict(sucursales_faltantes),
-            "productos_faltantes": dict(productos_faltantes),
-            "otros_errores": dict(otros_errores),
+            "cedis_origen_faltantes": cedis_origen_faltantes,
+            "sucursales_faltantes": sucursales_faltantes,
+            "productos_faltantes": productos_faltantes,
             "cedis_origen_suggestions": cedis_origen_suggestions,
             "sucursal_suggestions": sucursal_suggestions,
             "product_suggestions": product_suggestions,
             "all_sucursales": sorted(existing_sucursales),
             "all_cedis": sorted(existing_cendis),
             "all_products": sorted(existing_products, key=lambda x: x[0]),
-            "total_errors": errors.count(),
+            "total_errors": sum(sum(g.values()) for g in grupos.values()),
         })
     
     def post(self, request, *args, **kwargs):
@@ -162,16 +174,6 @@ class PlanificacionErrorResolverView(View):
                     code=cedis_code.strip()
                 )
                 
-                # Actualizar registros con error relacionados
-                Planificacion.objects.filter(
-                    normalize_status="error",
-                    cendis__iexact=cedis_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("planificacion_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -189,15 +191,9 @@ class PlanificacionErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                # Actualizar todos los registros con el nombre original
-                updated = Planificacion.objects.filter(
-                    cendis__iexact=original_name
-                ).update(
-                    cendis=target_name,
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
+                # Actualizar todos los registros con el nombre original (por clave)
+                corregir(Planificacion, "cendis_key", normalize_key(original_name), target_name)
+                renormalizar_al_confirmar(cedis=[target_name])
                 
                 # Redirigir a normalizar para que procese los cambios
                 # Si no hay más errores, ir a normalizar; si hay, quedarse aquí
@@ -227,16 +223,6 @@ class PlanificacionErrorResolverView(View):
                     bpl_id=int(bpl_id)
                 )
                 
-                # Actualizar registros con error relacionados
-                Planificacion.objects.filter(
-                    normalize_status="error",
-                    sucursal__iexact=sucursal_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("planificacion_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -254,15 +240,9 @@ class PlanificacionErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                # Actualizar todos los registros con el nombre original
-                updated = Planificacion.objects.filter(
-                    sucursal__iexact=original_name
-                ).update(
-                    sucursal=target_name,
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
+                # Actualizar todos los registros con el nombre original (por clave)
+                corregir(Planificacion, "sucursal_key", normalize_key(original_name), target_name)
+                renormalizar_al_confirmar(sucursales=[target_name])
                 
                 return redirect("planificacion_error_resolver")
         except Exception as e:
@@ -288,16 +268,6 @@ class PlanificacionErrorResolverView(View):
                     group=group.strip()
                 )
                 
-                # Actualizar registros con error relacionados
-                Planificacion.objects.filter(
-                    normalize_status="error",
-                    item_code__iexact=code
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("planificacion_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -315,15 +285,9 @@ class PlanificacionErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                # Actualizar todos los registros con el código original
-                Planificacion.objects.filter(
-                    item_code__iexact=original_code
-                ).update(
-                    item_code=target_code,
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
+                # Actualizar todos los registros con el código original (por clave)
+                corregir(Planificacion, "item_key", normalize_key(original_code), target_code)
+                renormalizar_al_confirmar(productos=[target_code])
                 
                 return redirect("planificacion_error_resolver")
         except Exception as e:
@@ -337,22 +301,7 @@ class PlanificacionErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                if error_type == "sucursal":
-                    Planificacion.objects.filter(
-                        normalize_status="error",
-                        sucursal__iexact=error_value
-                    ).update(
-                        normalize_status="ignored",
-                        normalize_notes="Ignorado manualmente"
-                    )
-                elif error_type == "product":
-                    Planificacion.objects.filter(
-                        normalize_status="error",
-                        item_code__iexact=error_value
-                    ).update(
-                        normalize_status="ignored",
-                        normalize_notes="Ignorado manualmente"
-                    )
+                _ignorar_grupo(Planificacion, error_type, error_value)
                 
                 return redirect("planificacion_error_resolver")
         except Exception as e:
@@ -365,57 +314,18 @@ class SalidaErrorResolverView(View):
     template_name = "salida_error_resolver.html"
 
     def get(self, request, *args, **kwargs):
-        errors = Salida.objects.filter(normalize_status="error")
-        
-        # Obtener nombres ignorados
-        cedis_ignorados = set(IgnorarCedis.objects.values_list("nombre_crudo", flat=True))
-        sucursales_ignoradas = set(IgnorarSucursal.objects.values_list("nombre_crudo", flat=True))
-        
-        cedis_origen_faltantes = defaultdict(list)
-        sucursales_destino_faltantes = defaultdict(list)
-        productos_faltantes = defaultdict(list)
-        otros_errores = defaultdict(list)
-        
-        # IDs de registros a marcar como ignorados
-        ids_to_ignore = []
-        
-        for error in errors:
-            notes = error.normalize_notes or ""
-            # Detectar errores de CEDIS origen
-            if ("CEDIS" in notes and "origen" in notes) or ("cedis" in notes and "origen" in notes) or ("almacén" in notes and "origen" in notes) or "origen NO es un almacén CEDIS" in notes or "Origen NO es un almacén CEDIS" in notes:
-                cedis_name = error.nombre_sucursal_origen
-                # Verificar si está ignorado
-                if cedis_name and cedis_name in cedis_ignorados:
-                    ids_to_ignore.append(error.id)
-                else:
-                    cedis_origen_faltantes[cedis_name].append(error.id)
-            # Detectar errores de Sucursal destino
-            elif "Sucursal" in notes or "sucursal" in notes or "tienda destino" in notes:
-                # Usar sucursal_destino_propuesto como principal, fallback a nombre_sucursal_destino
-                sucursal_name = error.sucursal_destino_propuesto or error.nombre_sucursal_destino
-                # Verificar si está ignorado
-                if sucursal_name and sucursal_name in sucursales_ignoradas:
-                    ids_to_ignore.append(error.id)
-                else:
-                    sucursales_destino_faltantes[sucursal_name].append(error.id)
-            # Detectar errores de Producto
-            elif "Producto" in notes or "producto" in notes:
-                product_code = error.sku
-                productos_faltantes[product_code].append(error.id)
-            else:
-                # Otros errores
-                otros_errores[notes[:100]].append(error.id)
-        
-        # Marcar registros como ignorados si su nombre está en la lista de ignorados
-        if ids_to_ignore:
-            Salida.objects.filter(id__in=ids_to_ignore).update(
-                normalize_status="ignored",
-                normalize_notes="Ignorado por configuración de biblioteca"
-            )
-        
-        existing_cedis = list(Cendis.objects.values_list('origin', flat=True))
-        existing_sucursales = list(Sucursal.objects.values_list('name', flat=True))
-        existing_products = list(Product.objects.values_list('code', 'name'))
+        # Tablas de búsqueda compartidas con la normalización (ignorados, maestros)
+        resolver = get_resolver()
+        
+        # Errores agrupados por tipo y valor crudo (origen/destino ya con sus respaldos)
+        grupos = _errores_agrupados(Salida, resolver)
+        cedis_origen_faltantes = grupos["cedis"]
+        sucursales_destino_faltantes = grupos["sucursal"]
+        productos_faltantes = grupos["producto"]
+        
+        existing_cedis = resolver.nombres_cedis
+        existing_sucursales = resolver.nombres_sucursales
+        existing_products = resolver.productos_codigo_nombre
         
         # Sugerencias para CEDIS origen
         cedis_suggestions = {}
@@ -464,17 +374,16 @@ class SalidaErrorResolverView(View):
                 ]
         
         return render(request, self.template_name, {
-            "cedis_origen_faltantes": dict(cedis_origen_faltantes),
-            "sucursales_destino_faltantes": dict(sucursales_destino_faltantes),
-            "productos_faltantes": dict(productos_faltantes),
-            "otros_errores": dict(otros_errores),
+            "cedis_origen_faltantes": cedis_origen_faltantes,
+            "sucursales_destino_faltantes": sucursales_destino_faltantes,
+            "productos_faltantes": productos_faltantes,
             "cedis_suggestions": cedis_suggestions,
             "sucursal_suggestions": sucursal_suggestions,
             "product_suggestions": product_suggestions,
             "all_sucursales": sorted(existing_sucursales),
             "all_cedis": sorted(existing_cedis),
             "all_products": sorted(existing_products, key=lambda x: x[0]),
-            "total_errors": errors.count(),
+            "total_errors": sum(sum(g.values()) for g in grupos.values()),
         })
     
     def post(self, request, *args, **kwargs):
@@ -513,15 +422,6 @@ class SalidaErrorResolverView(View):
                     code=cedis_code.strip()
                 )
                 
-                Salida.objects.filter(
-                    normalize_status="error",
-                    nombre_sucursal_origen__iexact=cedis_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("salida_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -539,14 +439,9 @@ class SalidaErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                Salida.objects.filter(
-                    nombre_sucursal_origen__iexact=original_name
-                ).update(
-                    nombre_sucursal_origen=target_name,
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
+                # Se corrige el campo del que sale el origen efectivo (ver origen_salida)
+                corregir(Salida, "origen_key", normalize_key(original_name), target_name)
+                renormalizar_al_confirmar(cedis=[target_name])
                 
                 return redirect("salida_error_resolver")
         except Exception as e:
@@ -570,36 +465,6 @@ class SalidaErrorResolverView(View):
                     bpl_id=int(bpl_id)
                 )
                 
-                # Resetear errores que coincidan con origen
-                Salida.objects.filter(
-                    normalize_status="error",
-                    nombre_sucursal_origen__iexact=sucursal_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
-                # Resetear errores que coincidan con destino (nombre_sucursal_destino)
-                Salida.objects.filter(
-                    normalize_status="error",
-                    nombre_sucursal_destino__iexact=sucursal_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
-                # Resetear errores que coincidan con destino (sucursal_destino_propuesto)
-                Salida.objects.filter(
-                    normalize_status="error",
-                    sucursal_destino_propuesto__iexact=sucursal_name
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("salida_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -618,34 +483,15 @@ class SalidaErrorResolverView(View):
         
         try:
             with transaction.atomic():
+                clave = normalize_key(original_name)
                 if field_type in ["origen", "both"]:
-                    Salida.objects.filter(
-                        nombre_sucursal_origen__iexact=original_name
-                    ).update(
-                        nombre_sucursal_origen=target_name,
-                        normalize_status="pending",
-                        normalize_notes="",
-                        normalized_at=None
-                    )
+                    corregir(Salida, "origen_key", clave, target_name)
                 
                 if field_type in ["destino", "both"]:
-                    # Actualizar tanto nombre_sucursal_destino como sucursal_destino_propuesto
-                    Salida.objects.filter(
-                        nombre_sucursal_destino__iexact=original_name
-                    ).update(
-                        nombre_sucursal_destino=target_name,
-                        normalize_status="pending",
-                        normalize_notes="",
-                        normalized_at=None
-                    )
-                    Salida.objects.filter(
-                        sucursal_destino_propuesto__iexact=original_name
-                    ).update(
-                        sucursal_destino_propuesto=target_name,
-                        normalize_status="pending",
-                        normalize_notes="",
-                        normalized_at=None
-                    )
+                    # El campo del que sale el destino efectivo (ver destino_salida)
+                    corregir(Salida, "destino_key", clave, target_name)
+                # El origen se resuelve contra CEDIS y el destino contra Sucursales
+                renormalizar_al_confirmar(cedis=[target_name], sucursales=[target_name])
                 
                 return redirect("salida_error_resolver")
         except Exception as e:
@@ -671,15 +517,6 @@ class SalidaErrorResolverView(View):
                     group=group.strip()
                 )
                 
-                Salida.objects.filter(
-                    normalize_status="error",
-                    sku__iexact=code
-                ).update(
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
-                
                 return redirect("salida_error_resolver")
         except Exception as e:
             return render(request, self.template_name, {
@@ -697,14 +534,8 @@ class SalidaErrorResolverView(View):
         
         try:
             with transaction.atomic():
-                Salida.objects.filter(
-                    sku__iexact=original_code
-                ).update(
-                    sku=target_code,
-                    normalize_status="pending",
-                    normalize_notes="",
-                    normalized_at=None
-                )
+                corregir(Salida, "sku_key", normalize_key(original_code), target_code)
+                renormalizar_al_confirmar(productos=[target_code])
                 
                 return redirect("salida_error_resolver")
         except Exception as e:
@@ -713,14 +544,12 @@ class SalidaErrorResolverView(View):
             })
     
     def _ignore_errors(self, request):
-        error_ids = request.POST.getlist("error_ids")
+        error_type = request.POST.get("error_type")
+        error_value = request.POST.get("error_value")
         
         try:
             with transaction.atomic():
-                Salida.objects.filter(id__in=error_ids).update(
-                    normalize_status="ignored",
-                    normalize_notes="Ignorado manualmente"
-                )
+                _ignorar_grupo(Salida, error_type, error_value)
                 
                 return redirect("salida_error_resolver")
         except Exception as e:
@@ -1,13 +1,19 @@
 import unicodedata
 from decimal import Decimal, InvalidOperation
 
-from django.shortcuts import render
+from django.db import transaction
+from django.shortcuts import redirect, render
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from openpyxl import load_workbook
 
 from ..models import Product, Pvp
+from ..services import precios
+from ..services.hechos import actualizar_precios, actualizar_productos
+from ..services.renormalizacion import renormalizar
+from ..services.resolver import invalidate
+from ..services.staging import StagingError, get_staged, stage_upload
+from ..services.tareas import contexto_tarea, enqueue, register_task, sin_progreso, tarea_desde_request
 
 
 def _normalize_header(name: str) -> str:
@@ -29,12 +35,115 @@ def _value(row, idx):
     return val
 
 
+BULK_BATCH_SIZE = 1000
+PRODUCT_FIELDS = ["name", "group", "manufacturer", "category", "subcategory", "size"]
+PVP_FIELDS = ["product", "description", "price"]
+
+
+def _text(value) -> str:
+    """Mismo texto que guardaría el CharField (los códigos numéricos del Excel llegan como int/float)."""
+    return "" if value is None else str(value)
+
+
+def _bulk_upsert_products(incoming, summary):
+    """
+    incoming: {code: {campo: valor}}. Compara contra el maestro cargado una sola vez
+    y solo escribe los productos nuevos o con algún campo distinto.
+    """
+    existing = {
+        row[1]: (row[0], row[2:])
+        for row in Product.objects.values_list("id", "code", *PRODUCT_FIELDS)
+    }
+    to_create = []
+    to_update = []
+    for code, values in incoming.items():
+        current = existing.get(code)
+        if current is None:
+            to_create.append(Product(code=code, **values))
+            continue
+        pk, old_values = current
+        if tuple(old_values) != tuple(values[f] for f in PRODUCT_FIELDS):
+            to_update.append(Product(pk=pk, code=code, **values))
+        else:
+            summary["products"]["unchanged"] += 1
+
+    with transaction.atomic():
+        Product.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        Product.objects.bulk_update(to_update, PRODUCT_FIELDS, batch_size=BULK_BATCH_SIZE)
+    if to_create or to_update:
+        # bulk_* no dispara señales: el maestro cambió, hay que recompilar las tablas de búsqueda
+        invalidate()
+    if to_create:
+        # Solo los códigos nuevos cambian la resolución: re-normalizar las filas que los esperaban
+        codigos = [product.code for product in to_create]
+        transaction.on_commit(lambda: renormalizar(productos=codigos), robust=True)
+    if to_update:
+        # Grupo/categoría de los hechos del tablero
+        ids = [product.pk for product in to_update]
+        transaction.on_commit(lambda: actualizar_productos(ids), robust=True)
+    summary["products"]["created"] += len(to_create)
+    summary["products"]["updated"] += len(to_update)
+
+
+def _bulk_upsert_pvps(incoming, summary):
+    """
+    incoming: {sku: {"description": str | None, "price": Decimal}}.
+    El producto se vincula con un mapa code -> (id, name) en memoria; si la
+    descripción es None se usa el nombre del producto (o el SKU si no existe).
+    """
+    products_by_code = {
+        code: (pk, name) for pk, code, name in Product.objects.values_list("id", "code", "name")
+    }
+    existing = {
+        sku: (pk, product_id, description, price)
+        for pk, sku, product_id, description, price in Pvp.objects.values_list(
+            "id", "sku", "product_id", "description", "price"
+        )
+    }
+    to_create = []
+    to_update = []
+    for sku, values in incoming.items():
+        product_id, product_name = products_by_code.get(sku, (None, None))
+        if product_id is None:
+            summary["pvp"]["missing_product"] += 1
+        description = values["description"]
+        if description is None:
+            description = product_name if product_id else sku
+        # Mismo redondeo que aplica el DecimalField (2 decimales) para comparar sin falsos cambios
+        price = values["price"].quantize(Decimal("0.01"))
+
+        current = existing.get(sku)
+        if current is None:
+            to_create.append(Pvp(sku=sku, product_id=product_id, description=description, price=price))
+            continue
+        pk, old_product_id, old_description, old_price = current
+        if (old_product_id, old_description, old_price) != (product_id, description, price):
+            to_update.append(Pvp(pk=pk, sku=sku, product_id=product_id, description=description, price=price))
+        else:
+            summary["pvp"]["unchanged"] += 1
+
+    with transaction.atomic():
+        Pvp.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        Pvp.objects.bulk_update(to_update, PVP_FIELDS, batch_size=BULK_BATCH_SIZE)
+    if to_create or to_update:
+        # bulk_* no dispara señales: índice de precios y USD de los hechos del tablero
+        precios.invalidate()
+        skus = [pvp.sku for pvp in to_create + to_update]
+        transaction.on_commit(lambda: actualizar_precios(skus), robust=True)
+    summary["pvp"]["created"] += len(to_create)
+    summary["pvp"]["updated"] += len(to_update)
+
+
 @method_decorator(csrf_exempt, name="dispatch")
 class HomeView(View):
     template_name = "upload_excel.html"
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name)
+        job = tarea_desde_request(request, "importar_maestros")
+        context = contexto_tarea(job)
+        if job and job.status == "done":
+            context["summary"] = job.result
+        return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         file_type = request.POST.get("file_type", "maestro")  # 'maestro' o 'productos_pvp'
@@ -46,31 +155,21 @@ class HomeView(View):
             return render(request, self.template_name, {"error": "El archivo debe ser .xlsx"})
 
         try:
-            workbook = load_workbook(upload, data_only=True)
-        except Exception as exc:  # pragma: no cover - defensive
-            return render(request, self.template_name, {"error": f"No se pudo leer el Excel: {exc}"})
-
-        summary = {
-            "products": {"created": 0, "updated": 0, "skipped": 0},
-            "pvp": {"created": 0, "updated": 0, "skipped": 0, "missing_product": 0, "invalid_price": 0},
-        }
-
-        # Procesar según el tipo de archivo
-        if file_type == "productos_pvp":
-            summary = self._process_productos_pvp(workbook, summary)
-        else:
-            summary = self._process_maestro_original(workbook, summary)
-        
-        return render(request, self.template_name, {"summary": summary})
+            # Staging por hash: re-subir el mismo archivo no lo vuelve a parsear
+            staged = stage_upload(upload)
+        except StagingError as exc:  # pragma: no cover - defensive
+            return render(request, self.template_name, {"error": str(exc)})
+
+        # La carga corre en el worker; la página muestra el progreso
+        tarea = enqueue("importar_maestros", token=staged.token, file_type=file_type)
+        return redirect(f"{request.path}?job={tarea.id}")
 
-    def _process_maestro_original(self, workbook, summary):
+    def _process_maestro_original(self, staged, summary):
         """Procesa el formato original: 'Maestro de Productos' y 'PVP'"""
         # Procesa Maestro de Productos
-        if "Maestro de Productos" in workbook.sheetnames:
-            sheet = workbook["Maestro de Productos"]
-            rows = list(sheet.iter_rows(values_only=True))
-            if rows:
-                headers = rows[0]
+        if "Maestro de Productos" in staged.sheet_names:
+            headers = staged.headers("Maestro de Productos")
+            if headers:
                 indexes = _index_map(headers)
                 mapping = {
                     "code": indexes.get("cod articulo"),
@@ -81,41 +180,37 @@ class HomeView(View):
                     "subcategory": indexes.get("sub categoria"),
                     "size": indexes.get("tamano"),
                 }
-                for row in rows[1:]:
+                incoming = {}
+                for row in staged.iter_rows("Maestro de Productos"):
                     code = _value(row, mapping["code"])
                     name = _value(row, mapping["name"])
                     if not code or not name:
                         summary["products"]["skipped"] += 1
                         continue
-                    defaults = {
-                        "name": name,
-                        "group": _value(row, mapping["group"]) or "",
-                        "manufacturer": _value(row, mapping["manufacturer"]) or "",
-                        "category": _value(row, mapping["category"]) or "",
-                        "subcategory": _value(row, mapping["subcategory"]) or "",
-                        "size": _value(row, mapping["size"]) or "",
+                    incoming[_text(code)] = {
+                        "name": _text(name),
+                        "group": _text(_value(row, mapping["group"]) or ""),
+                        "manufacturer": _text(_value(row, mapping["manufacturer"]) or ""),
+                        "category": _text(_value(row, mapping["category"]) or ""),
+                        "subcategory": _text(_value(row, mapping["subcategory"]) or ""),
+                        "size": _text(_value(row, mapping["size"]) or ""),
                     }
-                    obj, created = Product.objects.update_or_create(code=code, defaults=defaults)
-                    if created:
-                        summary["products"]["created"] += 1
-                    else:
-                        summary["products"]["updated"] += 1
+                _bulk_upsert_products(incoming, summary)
         else:
             summary["products"]["skipped"] = "Hoja 'Maestro de Productos' no encontrada"
 
         # Procesa PVP
-        if "PVP" in workbook.sheetnames:
-            sheet = workbook["PVP"]
-            rows = list(sheet.iter_rows(values_only=True))
-            if rows:
-                headers = rows[0]
+        if "PVP" in staged.sheet_names:
+            headers = staged.headers("PVP")
+            if headers:
                 indexes = _index_map(headers)
                 mapping = {
                     "sku": indexes.get("sku"),
                     "description": indexes.get("descripcion"),
                     "price": indexes.get("pvp"),
                 }
-                for row in rows[1:]:
+                incoming = {}
+                for row in staged.iter_rows("PVP"):
                     sku = _value(row, mapping["sku"])
                     description = _value(row, mapping["description"]) or ""
                     price_raw = _value(row, mapping["price"])
@@ -130,30 +225,19 @@ class HomeView(View):
                     except (InvalidOperation, TypeError):
                         summary["pvp"]["skipped"] += 1
                         continue
-                    product = Product.objects.filter(code=sku).first()
-                    obj, created = Pvp.objects.update_or_create(
-                        sku=sku,
-                        defaults={"product": product, "description": description, "price": price},
-                    )
-                    if not product:
-                        summary["pvp"]["missing_product"] += 1
-                    if created:
-                        summary["pvp"]["created"] += 1
-                    else:
-                        summary["pvp"]["updated"] += 1
+                    incoming[_text(sku)] = {"description": _text(description), "price": price}
+                _bulk_upsert_pvps(incoming, summary)
         else:
             summary["pvp"]["skipped"] = "Hoja 'PVP' no encontrada"
 
         return summary
 
-    def _process_productos_pvp(self, workbook, summary):
+    def _process_productos_pvp(self, staged, summary):
         """Procesa el formato de Maestros: 'Productos' e 'PVP' (ItemCode, Precio)"""
         # Procesa hoja "Productos"
-        if "Productos" in workbook.sheetnames:
-            sheet = workbook["Productos"]
-            rows = list(sheet.iter_rows(values_only=True))
-            if rows:
-                headers = rows[0]
+        if "Productos" in staged.sheet_names:
+            headers = staged.headers("Productos")
+            if headers:
                 indexes = _index_map(headers)
                 mapping = {
                     "code": indexes.get("itemcode"),
@@ -162,40 +246,36 @@ class HomeView(View):
                     "manufacturer": indexes.get("ds_marca"),  # Marca como manufacturer
                     "category": indexes.get("u_categoria"),
                 }
-                for row in rows[1:]:
+                incoming = {}
+                for row in staged.iter_rows("Productos"):
                     code = _value(row, mapping["code"])
                     name = _value(row, mapping["name"])
                     if not code or not name:
                         summary["products"]["skipped"] += 1
                         continue
-                    defaults = {
-                        "name": name,
-                        "group": _value(row, mapping["group"]) or "",
-                        "manufacturer": _value(row, mapping["manufacturer"]) or "",
-                        "category": _value(row, mapping["category"]) or "",
+                    incoming[_text(code)] = {
+                        "name": _text(name),
+                        "group": _text(_value(row, mapping["group"]) or ""),
+                        "manufacturer": _text(_value(row, mapping["manufacturer"]) or ""),
+                        "category": _text(_value(row, mapping["category"]) or ""),
                         "subcategory": "",  # No viene en este formato
                         "size": "",  # No viene en este formato
                     }
-                    obj, created = Product.objects.update_or_create(code=code, defaults=defaults)
-                    if created:
-                        summary["products"]["created"] += 1
-                    else:
-                        summary["products"]["updated"] += 1
+                _bulk_upsert_products(incoming, summary)
         else:
             summary["products"]["skipped"] = "Hoja 'Productos' no encontrada"
 
         # Procesa hoja "PVP"
-        if "PVP" in workbook.sheetnames:
-            sheet = workbook["PVP"]
-            rows = list(sheet.iter_rows(values_only=True))
-            if rows:
-                headers = rows[0]
+        if "PVP" in staged.sheet_names:
+            headers = staged.headers("PVP")
+            if headers:
                 indexes = _index_map(headers)
                 mapping = {
                     "sku": indexes.get("itemcode"),
                     "price": indexes.get("precio"),
                 }
-                for row in rows[1:]:
+                incoming = {}
+                for row in staged.iter_rows("PVP"):
                     sku = _value(row, mapping["sku"])
                     price_raw = _value(row, mapping["price"])
                     if not sku:
@@ -209,21 +289,35 @@ class HomeView(View):
                     except (InvalidOperation, TypeError):
                         summary["pvp"]["skipped"] += 1
                         continue
-                    # Buscar producto por code = sku
-                    product = Product.objects.filter(code=sku).first()
-                    # Usar el SKU como descripción si no hay producto vinculado
-                    description = product.name if product else sku
-                    obj, created = Pvp.objects.update_or_create(
-                        sku=sku,
-                        defaults={"product": product, "description": description, "price": price},
-                    )
-                    if not product:
-                        summary["pvp"]["missing_product"] += 1
-                    if created:
-                        summary["pvp"]["created"] += 1
-                    else:
-                        summary["pvp"]["updated"] += 1
+                    # description=None: se usa el nombre del producto vinculado o el SKU
+                    incoming[_text(sku)] = {"description": None, "price": price}
+                _bulk_upsert_pvps(incoming, summary)
         else:
             summary["pvp"]["skipped"] = "Hoja 'PVP' no encontrada"
 
         return summary
+
+
+@register_task("importar_maestros")
+def importar_maestros(params, progreso=sin_progreso):
+    staged = get_staged(params["token"])
+    if staged is None:
+        raise StagingError("El archivo subido expiró; vuelve a subirlo.")
+    # Progreso por hoja: el diff en memoria hace que la escritura sea lo más barato
+    total = sum(staged.row_count(name) for name in staged.sheet_names)
+    progreso(0, total, force=True)
+
+    summary = {
+        "products": {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0},
+        "pvp": {"created": 0, "updated": 0, "unchanged": 0, "skipped": 0, "missing_product": 0, "invalid_price": 0},
+    }
+
+    # Procesar según el tipo de archivo
+    view = HomeView()
+    if params.get("file_type") == "productos_pvp":
+        summary = view._process_productos_pvp(staged, summary)
+    else:
+        summary = view._process_maestro_original(staged, summary)
+
+    progreso(total, force=True)
+    return summary
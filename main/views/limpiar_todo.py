@@ -3,12 +3,17 @@ Vista para limpiar todas las tablas de Planificación y Salida
 """
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.db import transaction
 from django.views import View
 
 from ..models import (
-    Planificacion, PlanificacionNormalizada, PlanningBatch, PlanningEntry,
+    HechoCumplimiento, Planificacion, PlanificacionNormalizada, PlanningBatch, PlanningEntry,
     Salida, SalidaNormalizada
 )
+from ..services import cache_tablero
+from ..services.limpieza import (
+    HECHOS_PLANIFICACION, HECHOS_SALIDA, PLANIFICACION_TABLAS, SALIDA_TABLAS, borrar, vaciar,
+)
 
 
 class LimpiarTodoView(View):
@@ -24,15 +29,20 @@ class LimpiarTodoView(View):
         elif action == 'limpiar_todo':
             return self._limpiar_todo(request)
         
-        return redirect('main:home')
+        return redirect('home')
     
     def _limpiar_planificacion(self, request):
         """Limpiar todas las tablas de planificación"""
         # Eliminar en orden correcto (primero los que tienen FK)
-        count_norm = PlanificacionNormalizada.objects.all().delete()[0]
-        count_plan = Planificacion.objects.all().delete()[0]
-        count_entry = PlanningEntry.objects.all().delete()[0]
-        count_batch = PlanningBatch.objects.all().delete()[0]
+        # Tablas, hechos y cache en una sola transacción: o se limpia todo o nada
+        with transaction.atomic():
+            counts = vaciar(*PLANIFICACION_TABLAS)
+            borrar(HECHOS_PLANIFICACION)
+            cache_tablero.invalidar()
+        count_norm = counts[PlanificacionNormalizada]
+        count_plan = counts[Planificacion]
+        count_entry = counts[PlanningEntry]
+        count_batch = counts[PlanningBatch]
         
         total = count_norm + count_plan + count_entry + count_batch
         
@@ -42,13 +52,17 @@ class LimpiarTodoView(View):
             f"{count_entry} entries, {count_batch} batches eliminados. Total: {total}"
         )
         
-        return redirect('main:home')
+        return redirect('home')
     
     def _limpiar_salida(self, request):
         """Limpiar todas las tablas de salida"""
         # Eliminar en orden correcto (primero los que tienen FK)
-        count_norm = SalidaNormalizada.objects.all().delete()[0]
-        count_sal = Salida.objects.all().delete()[0]
+        with transaction.atomic():
+            counts = vaciar(*SALIDA_TABLAS)
+            borrar(HECHOS_SALIDA)
+            cache_tablero.invalidar()
+        count_norm = counts[SalidaNormalizada]
+        count_sal = counts[Salida]
         
         total = count_norm + count_sal
         
@@ -57,19 +71,23 @@ class LimpiarTodoView(View):
             f"✅ Salidas limpiadas: {count_norm} normalizadas, {count_sal} crudas eliminadas. Total: {total}"
         )
         
-        return redirect('main:home')
+        return redirect('home')
     
     def _limpiar_todo(self, request):
         """Limpiar TODAS las tablas de planificación y salida"""
+        with transaction.atomic():
+            counts = vaciar(HechoCumplimiento, *PLANIFICACION_TABLAS, *SALIDA_TABLAS)
+            cache_tablero.invalidar()
+        
         # Planificación
-        count_plan_norm = PlanificacionNormalizada.objects.all().delete()[0]
-        count_plan = Planificacion.objects.all().delete()[0]
-        count_entry = PlanningEntry.objects.all().delete()[0]
-        count_batch = PlanningBatch.objects.all().delete()[0]
+        count_plan_norm = counts[PlanificacionNormalizada]
+        count_plan = counts[Planificacion]
+        count_entry = counts[PlanningEntry]
+        count_batch = counts[PlanningBatch]
         
         # Salida
-        count_sal_norm = SalidaNormalizada.objects.all().delete()[0]
-        count_sal = Salida.objects.all().delete()[0]
+        count_sal_norm = counts[SalidaNormalizada]
+        count_sal = counts[Salida]
         
         total = count_plan_norm + count_plan + count_entry + count_batch + count_sal_norm + count_sal
         
@@ -79,4 +97,4 @@ class LimpiarTodoView(View):
             f"Salidas ({count_sal_norm} norm + {count_sal} crudas). Total: {total} registros eliminados."
         )
         
-        return redirect('main:home')
+        return redirect('home')
@@ -2,13 +2,19 @@ import datetime
 import re
 import unicodedata
 from decimal import Decimal, InvalidOperation
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-from django.shortcuts import render
+from django.db import transaction
+from django.shortcuts import redirect, render
 from django.views import View
-from openpyxl import load_workbook
 
 from ..models import PlanningBatch, PlanningEntry
+from ..services.planificacion import sincronizar_lote
+from ..services.staging import StagingError, get_staged, stage_upload
+from ..services.tareas import contexto_tarea, enqueue, register_task, sin_progreso, tarea_desde_request
+
+# Filas por cada bulk_create: acota la memoria pico del import
+IMPORT_BATCH_SIZE = 2000
 
 
 def _normalize_header(name: str) -> str:
@@ -82,15 +88,80 @@ def _value(row, idx):
     return row[idx]
 
 
-def _preview_rows(rows: List[List[Any]], limit: int = 10) -> List[List[Any]]:
-    return [list(r) for r in rows[:limit]]
+def _is_empty(row) -> bool:
+    return all(cell in (None, "") for cell in row)
+
+
+def _build_entry(batch: PlanningBatch, row, indexes: Dict[str, int]) -> PlanningEntry:
+    return PlanningEntry(
+        batch=batch,
+        external_id=str(_value(row, _pick(indexes, "id")) or ""),
+        tipo_carga=str(_value(row, _pick(indexes, "tipo_carga", "tipocarga")) or ""),
+        ranking_tienda=_parse_int(_value(row, _pick(indexes, "ranking_tienda", "ranking", "rankingt"))),
+        sucursal=str(_value(row, _pick(indexes, "sucursal", "tienda")) or ""),
+        item_code=str(_value(row, _pick(indexes, "item_code", "itemcode", "codigo")) or ""),
+        item_name=str(_value(row, _pick(indexes, "item_name", "itemname", "descripcion")) or ""),
+        u_categoria=str(_value(row, _pick(indexes, "u_categoria", "u_categoria")) or ""),
+        categoria=str(_value(row, _pick(indexes, "categoria")) or ""),
+        a_despachar_total=_parse_decimal(_value(row, _pick(indexes, "a_despachar_total", "a_despachar"))),
+        motivo_decision=str(_value(row, _pick(indexes, "motivo_decision", "motivo")) or ""),
+        en_transito=_parse_decimal(_value(row, _pick(indexes, "en_transito"))),
+        ult_entrada_almacen=_parse_date(_value(row, _pick(indexes, "ult_entrada_almacen", "ult_entrada"))),
+        ult_venta_tienda=_parse_date(_value(row, _pick(indexes, "ult_venta_tienda", "ult_venta"))),
+        dias_permanencia=_parse_int(_value(row, _pick(indexes, "dias_permanencia"))),
+        venta_diaria=_parse_decimal(_value(row, _pick(indexes, "venta_diaria"))),
+        stock_tienda=_parse_decimal(_value(row, _pick(indexes, "stock_tienda"))),
+        stock_cedis=_parse_decimal(_value(row, _pick(indexes, "stock_cedis", "stock_cedis"))),
+        necesidad_urgente=_parse_bool(_value(row, _pick(indexes, "necesidad_urgente", "urgente"))),
+        cendis=str(_value(row, _pick(indexes, "cendis", "origen", "origen_picking")) or ""),
+        no_planificar=_parse_bool(_value(row, _pick(indexes, "no_planificar", "no_planificar"))),
+        ng=_parse_decimal(_value(row, _pick(indexes, "ng"))),
+        ccct=_parse_decimal(_value(row, _pick(indexes, "ccct"))),
+        sm=_parse_decimal(_value(row, _pick(indexes, "sm"))),
+        cubicaje_unidad=_parse_decimal(_value(row, _pick(indexes, "cubicaje_unidad")), precision=4),
+        cubicaje_total=_parse_decimal(_value(row, _pick(indexes, "cubicaje_total")), precision=4),
+    )
+
+
+def _import_rows(
+    batch: PlanningBatch,
+    rows: Iterator,
+    indexes: Dict[str, int],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progreso=sin_progreso,
+):
+    """
+    Inserta las filas en lotes de `batch_size`.
+    `rows` es un generador: nunca se materializa la hoja completa en memoria.
+    """
+    created = 0
+    skipped = 0
+    pending: List[PlanningEntry] = []
+    for row in rows:
+        if _is_empty(row):
+            skipped += 1
+            continue
+        pending.append(_build_entry(batch, row, indexes))
+        if len(pending) >= batch_size:
+            PlanningEntry.objects.bulk_create(pending, batch_size=batch_size)
+            created += len(pending)
+            pending = []
+            progreso(created + skipped)
+    if pending:
+        PlanningEntry.objects.bulk_create(pending, batch_size=batch_size)
+        created += len(pending)
+    return created, skipped
 
 
 class PlanningUploadView(View):
     template_name = "planning_upload.html"
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name)
+        job = tarea_desde_request(request, "importar_planificacion")
+        context = contexto_tarea(job)
+        if job and job.status == "done":
+            context.update({"summary": job.result, "plan_date": job.result.get("plan_date")})
+        return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         errors: List[str] = []
@@ -98,6 +169,8 @@ class PlanningUploadView(View):
         selected_sheet = request.POST.get("sheet_name") or ""
         step = request.POST.get("step") or "preview"
         upload = request.FILES.get("file")
+        # Token del archivo ya subido en la previsualización (ver services.staging)
+        staged = None if upload else get_staged(request.POST.get("upload_token"))
 
         plan_date = None
         if plan_date_raw:
@@ -108,7 +181,7 @@ class PlanningUploadView(View):
         else:
             errors.append("Debes seleccionar una fecha de planificación.")
 
-        if not upload:
+        if not upload and not staged:
             errors.append("Debes subir un archivo Excel (.xlsx).")
 
         sheet_names: List[str] = []
@@ -123,13 +196,14 @@ class PlanningUploadView(View):
                 {"errors": errors, "plan_date": plan_date_raw},
             )
 
-        try:
-            workbook = load_workbook(upload, data_only=True)
-        except Exception as exc:
-            errors.append(f"No se pudo leer el Excel: {exc}")
-            return render(request, self.template_name, {"errors": errors, "plan_date": plan_date_raw})
+        if upload:
+            try:
+                staged = stage_upload(upload)
+            except StagingError as exc:
+                errors.append(str(exc))
+                return render(request, self.template_name, {"errors": errors, "plan_date": plan_date_raw})
 
-        sheet_names = workbook.sheetnames
+        sheet_names = staged.sheet_names
         if not sheet_names:
             errors.append("El archivo no tiene hojas (libros).")
             return render(request, self.template_name, {"errors": errors, "plan_date": plan_date_raw})
@@ -137,23 +211,20 @@ class PlanningUploadView(View):
         if selected_sheet not in sheet_names:
             selected_sheet = sheet_names[0]
 
-        sheet = workbook[selected_sheet]
-        rows = list(sheet.iter_rows(values_only=True))
-        if not rows:
+        headers = staged.headers(selected_sheet)
+        if headers is None:
             errors.append("La hoja seleccionada no tiene filas.")
             return render(request, self.template_name, {"errors": errors, "plan_date": plan_date_raw})
 
-        headers = rows[0]
         preview_headers = [str(h) if h is not None else "" for h in headers]
         indexes = _index_map(headers)
-        body_rows = rows[1:]
-        preview_rows = _preview_rows(body_rows)
+        preview_rows = staged.preview(selected_sheet)
         if step != "import":
             summary = {
                 "sheet_name": selected_sheet,
                 "sheet_count": len(sheet_names),
                 "sheet_names": sheet_names,
-                "filename": upload.name,
+                "filename": staged.filename,
                 "pending_import": True,
             }
             return render(
@@ -167,74 +238,51 @@ class PlanningUploadView(View):
                     "preview_headers": preview_headers,
                     "preview_rows": preview_rows,
                     "summary": summary,
+                    "upload_token": staged.token,
                 },
             )
 
-        batch = PlanningBatch.objects.create(
-            plan_date=plan_date,
+        # La importación corre en el worker; el archivo ya está en staging
+        tarea = enqueue(
+            "importar_planificacion",
+            token=staged.token,
             sheet_name=selected_sheet,
-            source_filename=upload.name,
+            plan_date=plan_date.isoformat(),
         )
+        return redirect(f"{request.path}?job={tarea.id}")
 
-        created = 0
-        skipped = 0
-
-        for row in body_rows:
-            if all(cell in (None, "") for cell in row):
-                skipped += 1
-                continue
-
-            entry = PlanningEntry(
-                batch=batch,
-                external_id=str(_value(row, _pick(indexes, "id")) or ""),
-                tipo_carga=str(_value(row, _pick(indexes, "tipo_carga", "tipocarga")) or ""),
-                ranking_tienda=_parse_int(_value(row, _pick(indexes, "ranking_tienda", "ranking", "rankingt"))),
-                sucursal=str(_value(row, _pick(indexes, "sucursal", "tienda")) or ""),
-                item_code=str(_value(row, _pick(indexes, "item_code", "itemcode", "codigo")) or ""),
-                item_name=str(_value(row, _pick(indexes, "item_name", "itemname", "descripcion")) or ""),
-                u_categoria=str(_value(row, _pick(indexes, "u_categoria", "u_categoria")) or ""),
-                categoria=str(_value(row, _pick(indexes, "categoria")) or ""),
-                a_despachar_total=_parse_decimal(_value(row, _pick(indexes, "a_despachar_total", "a_despachar"))),
-                motivo_decision=str(_value(row, _pick(indexes, "motivo_decision", "motivo")) or ""),
-                en_transito=_parse_decimal(_value(row, _pick(indexes, "en_transito"))),
-                ult_entrada_almacen=_parse_date(_value(row, _pick(indexes, "ult_entrada_almacen", "ult_entrada"))),
-                ult_venta_tienda=_parse_date(_value(row, _pick(indexes, "ult_venta_tienda", "ult_venta"))),
-                dias_permanencia=_parse_int(_value(row, _pick(indexes, "dias_permanencia"))),
-                venta_diaria=_parse_decimal(_value(row, _pick(indexes, "venta_diaria"))),
-                stock_tienda=_parse_decimal(_value(row, _pick(indexes, "stock_tienda"))),
-                stock_cedis=_parse_decimal(_value(row, _pick(indexes, "stock_cedis", "stock_cedis"))),
-                necesidad_urgente=_parse_bool(_value(row, _pick(indexes, "necesidad_urgente", "urgente"))),
-                cendis=str(_value(row, _pick(indexes, "cendis", "origen", "origen_picking")) or ""),
-                no_planificar=_parse_bool(_value(row, _pick(indexes, "no_planificar", "no_planificar"))),
-                ng=_parse_decimal(_value(row, _pick(indexes, "ng"))),
-                ccct=_parse_decimal(_value(row, _pick(indexes, "ccct"))),
-                sm=_parse_decimal(_value(row, _pick(indexes, "sm"))),
-                cubicaje_unidad=_parse_decimal(_value(row, _pick(indexes, "cubicaje_unidad")), precision=4),
-                cubicaje_total=_parse_decimal(_value(row, _pick(indexes, "cubicaje_total")), precision=4),
-            )
-            entry.save()
-            created += 1
-
-        summary = {
-            "created_entries": created,
-            "skipped_rows": skipped,
-            "sheet_name": selected_sheet,
-            "sheet_count": len(sheet_names),
-            "sheet_names": sheet_names,
-            "filename": upload.name,
-            "batch_id": batch.id,
-        }
-
-        return render(
-            request,
-            self.template_name,
-            {
-                "plan_date": plan_date_raw,
-                "sheet_names": sheet_names,
-                "sheet_count": len(sheet_names),
-                "selected_sheet": selected_sheet,
-                "preview_headers": preview_headers,
-                "preview_rows": preview_rows,
-                "summary": summary,
-            },
+
+@register_task("importar_planificacion")
+def importar_planificacion(params, progreso=sin_progreso):
+    staged = get_staged(params["token"])
+    if staged is None:
+        raise StagingError("El archivo subido expiró; vuelve a subirlo.")
+    sheet_name = params["sheet_name"]
+    headers = staged.headers(sheet_name) or ()
+    progreso(0, staged.row_count(sheet_name), force=True)
+
+    # Lote + detalle en una sola transacción: o entra la hoja completa o nada
+    with transaction.atomic():
+        batch = PlanningBatch.objects.create(
+            plan_date=datetime.date.fromisoformat(params["plan_date"]),
+            sheet_name=sheet_name,
+            source_filename=staged.filename,
+        )
+        created, skipped = _import_rows(
+            batch, staged.iter_rows(sheet_name), _index_map(headers), progreso=progreso
         )
+        # Directo a Planificacion (agregado en SQL), en la misma transacción que el detalle
+        planificacion = sincronizar_lote(batch)
+    progreso(created + skipped, force=True)
+
+    return {
+        "created_entries": created,
+        "skipped_rows": skipped,
+        "sheet_name": sheet_name,
+        "sheet_count": len(staged.sheet_names),
+        "sheet_names": staged.sheet_names,
+        "filename": staged.filename,
+        "batch_id": batch.id,
+        "plan_date": params["plan_date"],
+        "planificacion": planificacion,
+    }
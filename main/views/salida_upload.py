@@ -4,11 +4,34 @@ import unicodedata
 from decimal import Decimal, InvalidOperation
 from typing import Any, Dict, List, Optional
 
-from django.shortcuts import render
+from django.db import connection, transaction
+from django.shortcuts import redirect, render
 from django.views import View
-from openpyxl import load_workbook
 
 from ..models import Salida
+from ..services.claves import asignar_claves
+from ..services.staging import StagingError, get_staged, stage_upload
+from ..services.tareas import contexto_tarea, enqueue, register_task, sin_progreso, tarea_desde_request
+
+# Clave natural de Salida (ver UniqueConstraint "salida_clave_natural")
+NATURAL_KEY = ["fecha_salida", "sku", "salida"]
+UPSERT_FIELDS = [
+    "nombre_sucursal_origen",
+    "nombre_almacen_origen",
+    "descripcion",
+    "cantidad",
+    "sucursal_destino_propuesto",
+    "entrada",
+    "fecha_entrada",
+    "nombre_sucursal_destino",
+    "nombre_almacen_destino",
+    "comments",
+    # Claves de búsqueda (services.claves)
+    "origen_key",
+    "destino_key",
+    "sku_key",
+]
+UPSERT_BATCH_SIZE = 1000
 
 
 def _normalize_header(name: str) -> str:
@@ -64,54 +87,108 @@ def _parse_date(value: Any) -> Optional[datetime.date]:
     return None
 
 
-def _preview_rows(rows: List[List[Any]], limit: int = 10) -> List[List[Any]]:
-    return [list(r) for r in rows[:limit]]
+def _month_bounds(year: int, month: int):
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + 1, 1, 1) if month == 12 else datetime.date(year, month + 1, 1)
+    return start, end
+
+
+def _existing_keys(year: int, month: int) -> Dict[tuple, int]:
+    """Una sola consulta: clave natural -> id de las Salidas ya cargadas para el mes."""
+    start, end = _month_bounds(year, month)
+    return {
+        (fecha, sku, salida): pk
+        for pk, fecha, sku, salida in Salida.objects.filter(
+            fecha_salida__gte=start, fecha_salida__lt=end
+        ).values_list("id", *NATURAL_KEY)
+    }
+
+
+def _flush_upsert(pending: Dict[tuple, Salida], existing: Dict[tuple, int]) -> None:
+    """
+    Aplica un lote de Salidas ya deduplicadas por clave natural.
+    Con soporte nativo usa INSERT ... ON CONFLICT DO UPDATE; si no, separa en
+    bulk_create / bulk_update según las claves precargadas.
+    """
+    if not pending:
+        return
+    if connection.features.supports_update_conflicts_with_target:
+        Salida.objects.bulk_create(
+            list(pending.values()),
+            batch_size=UPSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=NATURAL_KEY,
+            update_fields=UPSERT_FIELDS,
+        )
+        return
+
+    to_create = []
+    to_update = []
+    for key, obj in pending.items():
+        pk = existing.get(key)
+        if pk:
+            obj.pk = pk
+            to_update.append(obj)
+        else:
+            to_create.append(obj)
+    if to_create:
+        Salida.objects.bulk_create(to_create, batch_size=UPSERT_BATCH_SIZE)
+        for obj in to_create:
+            if obj.pk:
+                existing[(obj.fecha_salida, obj.sku, obj.salida)] = obj.pk
+    if to_update:
+        Salida.objects.bulk_update(to_update, UPSERT_FIELDS, batch_size=UPSERT_BATCH_SIZE)
 
 
 class SalidaUploadView(View):
     template_name = "salida_upload.html"
 
     def get(self, request, *args, **kwargs):
-        return render(request, self.template_name)
+        job = tarea_desde_request(request, "importar_salidas")
+        context = contexto_tarea(job)
+        if job and job.status == "done":
+            context["summary"] = job.result
+        return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         errors: List[str] = []
         step = request.POST.get("step") or "preview"
         upload = request.FILES.get("file")
+        # Token del archivo ya subido en la previsualización (ver services.staging)
+        staged = None if upload else get_staged(request.POST.get("upload_token"))
 
-        if not upload:
+        if not upload and not staged:
             errors.append("Debes subir un archivo Excel (.xlsx).")
             return render(request, self.template_name, {"errors": errors})
 
-        try:
-            workbook = load_workbook(upload, data_only=True)
-        except Exception as exc:
-            errors.append(f"No se pudo leer el Excel: {exc}")
-            return render(request, self.template_name, {"errors": errors})
+        if upload:
+            try:
+                staged = stage_upload(upload)
+            except StagingError as exc:
+                errors.append(str(exc))
+                return render(request, self.template_name, {"errors": errors})
 
-        sheet_names = workbook.sheetnames
+        sheet_names = staged.sheet_names
         if not sheet_names:
             errors.append("El archivo no tiene hojas.")
             return render(request, self.template_name, {"errors": errors})
 
-        sheet = workbook[sheet_names[0]]
-        rows = list(sheet.iter_rows(values_only=True))
-        if not rows:
+        sheet_name = sheet_names[0]
+        headers = staged.headers(sheet_name)
+        if headers is None:
             errors.append("La hoja no tiene filas.")
             return render(request, self.template_name, {"errors": errors})
 
-        headers = rows[0]
         preview_headers = [str(h) if h is not None else "" for h in headers]
         indexes = _index_map(headers)
-        body_rows = rows[1:]
-        preview_rows = _preview_rows(body_rows)
+        preview_rows = staged.preview(sheet_name)
 
         if step != "import":
             summary = {
-                "sheet_name": sheet.title,
+                "sheet_name": sheet_name,
                 "sheet_count": len(sheet_names),
                 "sheet_names": sheet_names,
-                "filename": upload.name,
+                "filename": staged.filename,
                 "pending_import": True,
             }
             return render(
@@ -119,16 +196,17 @@ class SalidaUploadView(View):
                 self.template_name,
                 {
                     "sheet_names": sheet_names,
-                    "selected_sheet": sheet.title,
+                    "selected_sheet": sheet_name,
                     "preview_headers": preview_headers,
                     "preview_rows": preview_rows,
                     "summary": summary,
+                    "upload_token": staged.token,
                 },
             )
 
         # Detect target month/year from first valid fecha_salida (fallback: fecha_entrada)
         target_date = None
-        for row in body_rows:
+        for row in staged.iter_rows(sheet_name):
             fecha_salida = _parse_date(_value(row, _pick(indexes, "fecha_salida", "fecha_salida")))
             fecha_entrada = _parse_date(_value(row, _pick(indexes, "fecha_entrada", "fecha_entrad")))
             target_date = fecha_salida or fecha_entrada
@@ -143,21 +221,50 @@ class SalidaUploadView(View):
                 {
                     "errors": errors,
                     "sheet_names": sheet_names,
-                    "selected_sheet": sheet.title,
+                    "selected_sheet": sheet_name,
                     "preview_headers": preview_headers,
                     "preview_rows": preview_rows,
+                    "upload_token": staged.token,
                 },
             )
 
-        target_year, target_month = target_date.year, target_date.month
-
-        created = 0
-        skipped = 0
-        updated = 0
-        skipped_wrong_month = 0
-        skipped_no_date = 0
-
-        for row in body_rows:
+        # La importación corre en el worker; el archivo ya está en staging
+        tarea = enqueue(
+            "importar_salidas",
+            token=staged.token,
+            sheet_name=sheet_name,
+            target_year=target_date.year,
+            target_month=target_date.month,
+        )
+        return redirect(f"{request.path}?job={tarea.id}")
+
+
+@register_task("importar_salidas")
+def importar_salidas(params, progreso=sin_progreso):
+    staged = get_staged(params["token"])
+    if staged is None:
+        raise StagingError("El archivo subido expiró; vuelve a subirlo.")
+    sheet_name = params["sheet_name"]
+    indexes = _index_map(staged.headers(sheet_name) or ())
+    target_year, target_month = params["target_year"], params["target_month"]
+    total = staged.row_count(sheet_name)
+    progreso(0, total, force=True)
+
+    created = 0
+    skipped = 0
+    updated = 0
+    skipped_wrong_month = 0
+    skipped_no_date = 0
+
+    # Claves existentes del mes en una sola consulta; el resto se resuelve en memoria
+    existing = _existing_keys(target_year, target_month)
+    seen = set(existing)
+    pending: Dict[tuple, Salida] = {}
+
+    with transaction.atomic():
+        for row_count, row in enumerate(staged.iter_rows(sheet_name), start=1):
+            if row_count % UPSERT_BATCH_SIZE == 0:
+                progreso(row_count)
             if all(cell in (None, "") for cell in row):
                 skipped += 1
                 continue
@@ -188,38 +295,30 @@ class SalidaUploadView(View):
                 "comments": str(_value(row, _pick(indexes, "comments", "comentarios", "comentario")) or ""),
             }
 
-            obj, created_flag = Salida.objects.update_or_create(
-                sku=sku,
-                fecha_salida=row_date,
-                salida=salida,
-                defaults=defaults,
-            )
-            if created_flag:
-                created += 1
-            else:
+            key = (row_date, sku, salida)
+            # Contadores exactos sin consultar: misma semántica que update_or_create fila a fila
+            if key in seen:
                 updated += 1
-
-        summary = {
-            "created_entries": created,
-            "updated_entries": updated,
-            "skipped_rows": skipped,
-            "skipped_wrong_month": skipped_wrong_month,
-            "skipped_no_date": skipped_no_date,
-            "sheet_name": sheet.title,
-            "sheet_count": len(sheet_names),
-            "sheet_names": sheet_names,
-            "filename": upload.name,
-            "target_month": f"{target_year:04d}-{target_month:02d}",
-        }
-
-        return render(
-            request,
-            self.template_name,
-            {
-                "sheet_names": sheet_names,
-                "selected_sheet": sheet.title,
-                "preview_headers": preview_headers,
-                "preview_rows": preview_rows,
-                "summary": summary,
-            },
-        )
+            else:
+                created += 1
+                seen.add(key)
+            pending[key] = asignar_claves(Salida(sku=sku, fecha_salida=row_date, salida=salida, **defaults))
+            if len(pending) >= UPSERT_BATCH_SIZE:
+                _flush_upsert(pending, existing)
+                pending = {}
+
+        _flush_upsert(pending, existing)
+    progreso(total, force=True)
+
+    return {
+        "created_entries": created,
+        "updated_entries": updated,
+        "skipped_rows": skipped,
+        "skipped_wrong_month": skipped_wrong_month,
+        "skipped_no_date": skipped_no_date,
+        "sheet_name": sheet_name,
+        "sheet_count": len(staged.sheet_names),
+        "sheet_names": staged.sheet_names,
+        "filename": staged.filename,
+        "target_month": f"{target_year:04d}-{target_month:02d}",
+    }
@@ -1,72 +1,157 @@
 import datetime
-from collections import defaultdict
+import tempfile
+from collections import defaultdict, namedtuple
 from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+from typing import NamedTuple, Optional
+from urllib.parse import urlencode
 
 from django.shortcuts import render
 from django.views import View
-from django.http import HttpResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 import csv
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
 
-from ..models import PlanificacionNormalizada, SalidaNormalizada, Pvp, GerenteRegional
+from django.db.models import BigIntegerField, F, Max, Sum
+from django.db.models.functions import Cast, Round
+
+from ..models import Cendis, GerenteRegional, HechoCumplimiento, Product, Sucursal
+from ..services import cache_tablero
+
+# Columnas de HechoCumplimiento que leen los resúmenes: la clave de cada hecho
+# dentro de su mes o fecha, y los datos que se suman (o se toman) al juntar fechas
+HECHO_CLAVE = [
+    "cedis_id", "sucursal_id", "tipo_carga", "grupo", "categoria", "sku", "sku_key", "product_id",
+]
+HECHO_CAMPOS = HECHO_CLAVE + ["nombre", "registros"]
+PRODUCTO_CAMPOS = ["group", "manufacturer", "category", "subcategory", "size"]
+
+# Los resúmenes suman enteros: cantidades en centésimas y USD en diezmilésimas
+# (cantidad × PVP, ambos con 2 decimales). Se pasan a Decimal solo al armar cada nodo.
+DECIMALES_CANTIDAD = 2
+DECIMALES_USD = 4
+HECHO_ENTEROS = {
+    "plan_qty_int": ("plan_qty", DECIMALES_CANTIDAD),
+    "plan_usd_int": ("plan_usd", DECIMALES_USD),
+    "salida_qty_int": ("salida_qty", DECIMALES_CANTIDAD),
+    "salida_usd_int": ("salida_usd", DECIMALES_USD),
+}
+
+# Fila de hecho que leen los resúmenes (HECHO_CAMPOS más los importes en enteros)
+Hecho = namedtuple("Hecho", HECHO_CAMPOS + list(HECHO_ENTEROS))
+
+# Orden de los tipos de carga en las jerarquías (los demás al final, por nombre)
+TIPO_ORDER = {"PRIORIDAD": 0, "LANZAMIENTO": 1, "NO PLANIFICADO": 2}
+
+# Valores de ?export=
+EXPORTS = ("cumplimiento", "cedis", "tiendas", "xlsx")
+
+# Resúmenes que dependen del gerente seleccionado (los demás se cachean sin él)
+RESUMENES_POR_GERENTE = ("tiendas", "jerarquia_tiendas", "nacional")
+# Filas por bloque en los CSV en streaming
+CSV_FILAS_POR_BLOQUE = 1000
+
+# Columnas de cada export: (título, formato); el formato decide cómo se escribe en CSV y en Excel
+COLUMNAS_TOTALES = [
+    ("Unid. Plan.", "unidades"), ("USD Plan.", "usd"),
+    ("Unid. Plan. Despachadas", "unidades"), ("USD Plan. Despachados", "usd"),
+    ("% Unid. Plan.", "porcentaje"), ("% USD Plan.", "porcentaje"),
+    ("Unid. NO Plan.", "unidades"), ("USD NO Plan.", "usd"),
+    ("Total Unid. Despachadas", "unidades"), ("Total USD Despachados", "usd"),
+]
+COLUMNAS = {
+    "cumplimiento": [
+        ("CEDIS", "texto"), ("Tipo Carga", "texto"), ("Grupo", "texto"), ("Categoría", "texto"),
+        ("Producto", "texto"), ("Planificado", "unidades"), ("Despachado", "unidades"),
+        ("% Cumplimiento", "porcentaje"),
+    ],
+    "cedis": [("CEDIS", "texto")] + COLUMNAS_TOTALES,
+    "tiendas": [("Tienda", "texto")] + COLUMNAS_TOTALES,
+}
+ARCHIVOS = {"cumplimiento": "cumplimiento", "cedis": "resumen_cedis", "tiendas": "resumen_tiendas"}
+
+# Excel: una hoja por pestaña, con las fechas seleccionadas como primeras columnas
+HOJAS_XLSX = [("cumplimiento", "Cumplimiento"), ("cedis", "CEDIS"), ("tiendas", "Tiendas")]
+COLUMNAS_FECHAS = [("Mes Planificación", "fecha"), ("Salidas Desde", "fecha"), ("Salidas Hasta", "fecha")]
+FORMATOS_XLSX = {"unidades": "#,##0", "usd": '"$"#,##0.00', "porcentaje": "0.0%", "fecha": "yyyy-mm-dd"}
+ANCHOS_XLSX = {"texto": 30, "unidades": 14, "usd": 16, "porcentaje": 12, "fecha": 14}
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Árboles que se despliegan por niveles (TableroNivelView): resumen de cada uno
+# y clave de los hijos en cada nivel
+ARBOLES = {"cumplimiento": "cumplimiento", "tiendas": "jerarquia_tiendas"}
+NIVELES = ("tipos", "grupos", "categorias", "productos")
+
+
+class RangoSalida(NamedTuple):
+    """Fechas de salida seleccionadas, ambas inclusive (un solo día si son iguales)"""
+    desde: datetime.date
+    hasta: datetime.date
+
+    def __str__(self):
+        # Parte de las claves de cache y de los nombres de archivo
+        if self.desde == self.hasta:
+            return str(self.desde)
+        return f"{self.desde}_{self.hasta}"
+
+
+class DatosTablero(NamedTuple):
+    """Hechos de las fechas seleccionadas, leídos una sola vez, y los lookups que comparten las pestañas"""
+    plan_date: Optional[datetime.date]
+    rango_salida: Optional[RangoSalida]
+    plan: list  # Hechos (Hecho) del mes de planificación, importes en enteros
+    salida: list  # Hechos del rango de salidas, una fila por clave con los días sumados
+    cedis_names: dict  # cedis_id -> origin
+    tiendas: dict  # sucursal_id -> (name, gerente_id)
+    productos: Optional[dict]  # product_id -> atributos del maestro (None si no se cargaron)
+    # Planificado por (cedis, sku, sucursal) y por (sucursal, sku): incluye SIN TIPO
+    plan_cedis: set
+    plan_tienda: set
+    # Tipo de carga por las mismas claves: solo planificaciones con tipo
+    tipo_cedis: dict
+    tipo_tienda: dict
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve cada línea en vez de guardarla"""
+
+    def write(self, value):
+        return value
 
 
 class TableroNormalizadoView(View):
     template_name = "tablero_normalizado.html"
 
     def get(self, request, *args, **kwargs):
-        # Obtener fechas seleccionadas
-        plan_date = self._selected_plan_date(request)
-        salida_date = self._selected_salida_date(request)
+        plan_date, rango_salida, plan_dates, salida_dates, selected_gerente = self._parametros(request)
         active_tab = request.GET.get("tab", "cumplimiento")
         
-        # Obtener filtro de gerente
-        gerente_id = request.GET.get("gerente")
-        selected_gerente = None
-        if gerente_id:
-            try:
-                selected_gerente = GerenteRegional.objects.get(id=gerente_id)
-            except GerenteRegional.DoesNotExist:
-                pass
-        
-        # Obtener fechas disponibles para los selectores
-        plan_dates = self._available_plan_dates()
-        salida_dates = self._available_salida_dates()
-        
-        # Si no hay fechas seleccionadas, usar las más recientes
-        if not plan_date and plan_dates:
-            plan_date = plan_dates[0]
-        if not salida_date and salida_dates:
-            salida_date = salida_dates[0]
-        
-        # Pre-cargar precios PVP
-        pvp_map = {p.sku.lower(): p.price for p in Pvp.objects.all()}
+        # Export CSV: solo el resumen pedido
+        export = request.GET.get("export")
+        if export in EXPORTS:
+            return self._exportar(export, plan_date, rango_salida, selected_gerente)
         
-        # Generar datos para cada pestaña
-        resumen_cumplimiento = self._build_resumen_cumplimiento(plan_date, salida_date, pvp_map)
-        resumen_cedis = self._build_resumen_cedis(plan_date, salida_date, pvp_map)
-        resumen_tiendas = self._build_resumen_tiendas(plan_date, salida_date, pvp_map, selected_gerente)
+        # Solo el resumen de la pestaña visible (los totales nacionales siempre)
+        resumen = lambda nombre: self._resumen(nombre, plan_date, rango_salida, selected_gerente)
+        resumen_cumplimiento = resumen("cumplimiento") if active_tab == "cumplimiento" else []
+        resumen_cedis = resumen("cedis") if active_tab == "cedis" else []
+        resumen_tiendas = resumen("tiendas") if active_tab == "tiendas" else []
+        nacional = resumen("nacional")
         
         # Lista de gerentes para el filtro
         gerentes = GerenteRegional.objects.all().order_by("name")
-        
-        # Totales nacionales con conteo de registros
-        nacional = self._calculate_nacional(resumen_tiendas, plan_date, salida_date)
-        
-        # Export CSV
-        export = request.GET.get("export")
-        if export == "cumplimiento":
-            return self._export_cumplimiento_csv(resumen_cumplimiento, plan_date, salida_date)
-        elif export == "cedis":
-            return self._export_cedis_csv(resumen_cedis, plan_date, salida_date)
-        elif export == "tiendas":
-            return self._export_tiendas_csv(resumen_tiendas, plan_date, salida_date)
 
         return render(
             request,
             self.template_name,
             {
                 "plan_date": plan_date,
-                "salida_date": salida_date,
+                "rango_salida": rango_salida,
+                "filtro_fechas": self._filtro_fechas(plan_date, rango_salida),
                 "plan_dates": plan_dates,
                 "salida_dates": salida_dates,
                 "active_tab": active_tab,
@@ -82,27 +167,127 @@ class TableroNormalizadoView(View):
     def post(self, request, *args, **kwargs):
         return self.get(request, *args, **kwargs)
 
-    def _selected_plan_date(self, request):
-        raw_date = request.GET.get("plan_date") or request.POST.get("plan_date")
-        if raw_date:
+    def _parametros(self, request):
+        """(plan_date, rango_salida, plan_dates, salida_dates, gerente) seleccionados en `request`"""
+        # Obtener fechas seleccionadas
+        plan_date = self._selected_plan_date(request)
+        rango_salida = self._selected_rango_salida(request)
+        
+        # Obtener filtro de gerente
+        gerente_id = request.GET.get("gerente")
+        selected_gerente = None
+        if gerente_id:
             try:
-                return datetime.datetime.strptime(raw_date, "%Y-%m-%d").date()
-            except ValueError:
-                return None
-        return None
+                selected_gerente = GerenteRegional.objects.get(id=gerente_id)
+            except (GerenteRegional.DoesNotExist, ValueError):
+                pass
+        
+        # Obtener fechas disponibles para los selectores
+        plan_dates, salida_dates = cache_tablero.obtener(
+            ("fechas",), lambda: (self._available_plan_dates(), self._available_salida_dates())
+        )
+        
+        # Si no hay fechas seleccionadas, usar las más recientes
+        if not plan_date and plan_dates:
+            plan_date = plan_dates[0]
+        if not rango_salida and salida_dates:
+            rango_salida = RangoSalida(salida_dates[0], salida_dates[0])
+        
+        return plan_date, rango_salida, plan_dates, salida_dates, selected_gerente
+
+    def _selected_plan_date(self, request):
+        return self._selected_date(request, "plan_date")
 
-    def _selected_salida_date(self, request):
-        raw_date = request.GET.get("salida_date") or request.POST.get("salida_date")
+    def _selected_rango_salida(self, request):
+        """
+        Rango de salidas: salida_desde y salida_hasta (si falta una, un solo día).
+        salida_date, de los enlaces anteriores al rango, equivale a un solo día.
+        """
+        desde = self._selected_date(request, "salida_desde") or self._selected_date(request, "salida_date")
+        hasta = self._selected_date(request, "salida_hasta") or desde
+        desde = desde or hasta
+        if not desde:
+            return None
+        return RangoSalida(min(desde, hasta), max(desde, hasta))
+
+    def _selected_date(self, request, campo):
+        raw_date = request.GET.get(campo) or request.POST.get(campo)
         if raw_date:
             try:
                 return datetime.datetime.strptime(raw_date, "%Y-%m-%d").date()
             except ValueError:
                 return None
         return None
+
+    def _filtro_fechas(self, plan_date, rango_salida):
+        """Query string de las fechas seleccionadas, para los enlaces de export"""
+        params = {"plan_date": plan_date or ""}
+        if rango_salida:
+            params["salida_desde"] = rango_salida.desde
+            params["salida_hasta"] = rango_salida.hasta
+        return urlencode(params)
     
+    def _resumen(self, nombre, plan_date, rango_salida, gerente_filter=None):
+        """
+        Un resumen del tablero (cumplimiento, cedis, tiendas, jerarquia_tiendas o
+        nacional), cacheado por fechas y gerente hasta que cambien los datos
+        """
+        gerente_pk = gerente_filter.pk if gerente_filter and nombre in RESUMENES_POR_GERENTE else None
+        return cache_tablero.obtener(
+            (plan_date, rango_salida, gerente_pk, nombre),
+            lambda: self._construir(nombre, plan_date, rango_salida, gerente_filter),
+        )
+
+    def _construir(self, nombre, plan_date, rango_salida, gerente_filter=None):
+        con_productos = nombre in ("cumplimiento", "jerarquia_tiendas")
+        datos = self._datos(plan_date, rango_salida, con_productos)
+        if nombre == "cumplimiento":
+            return self._build_resumen_cumplimiento(datos)
+        if nombre == "cedis":
+            return self._build_resumen_cedis(datos)
+        if nombre == "nacional":
+            # Totales nacionales con conteo de registros (salen de los totales por tienda)
+            return self._calculate_nacional(self._resumen("tiendas", plan_date, rango_salida, gerente_filter), datos)
+        resumen_tiendas = self._build_totales_tiendas(datos, gerente_filter)
+        if nombre == "jerarquia_tiendas":
+            self._build_jerarquia_tiendas(resumen_tiendas, datos, gerente_filter)
+        return resumen_tiendas
+
+    def _datos(self, plan_date, rango_salida, con_productos=False):
+        """Hechos de la request: un solo paso por HechoCumplimiento aunque se construyan varios resúmenes"""
+        datos = getattr(self, "_datos_cargados", None)
+        if datos is None or (datos.plan_date, datos.rango_salida) != (plan_date, rango_salida):
+            datos = self._cargar_hechos(plan_date, rango_salida, con_productos)
+        elif con_productos and datos.productos is None:
+            datos = datos._replace(productos=self._productos(datos.plan, datos.salida))
+        self._datos_cargados = datos
+        return datos
+
+    def _exportar(self, export, plan_date, rango_salida, gerente_filter=None):
+        if export == "xlsx":
+            return self._export_xlsx(plan_date, rango_salida, gerente_filter)
+        filas = self._filas_export(export, plan_date, rango_salida, gerente_filter)
+        return self._export_csv(export, filas, plan_date, rango_salida)
+
+    def _filas_export(self, export, plan_date, rango_salida, gerente_filter=None):
+        """
+        Filas planas de un export (ver _filas), las mismas para CSV y Excel,
+        cacheadas como los resúmenes por fechas y gerente hasta que cambien los datos
+        """
+        gerente_pk = gerente_filter.pk if gerente_filter and export in RESUMENES_POR_GERENTE else None
+        return cache_tablero.obtener(
+            (plan_date, rango_salida, gerente_pk, "export", export),
+            lambda: list(self._filas(
+                export,
+                self._datos(plan_date, rango_salida, con_productos=export == "cumplimiento"),
+                gerente_filter,
+            )),
+        )
+
     def _available_plan_dates(self):
         return list(
-            PlanificacionNormalizada.objects
+            HechoCumplimiento.objects
+            .filter(plan_month__isnull=False)
             .values_list("plan_month", flat=True)
             .distinct()
             .order_by("-plan_month")
@@ -110,654 +295,351 @@ class TableroNormalizadoView(View):
     
     def _available_salida_dates(self):
         return list(
-            SalidaNormalizada.objects
+            HechoCumplimiento.objects
+            .filter(fecha_salida__isnull=False)
             .values_list("fecha_salida", flat=True)
             .distinct()
             .order_by("-fecha_salida")
         )
 
-    def _get_price(self, item_code, pvp_map):
-        """Obtener precio de un producto"""
-        if not item_code:
-            return Decimal("0")
-        return pvp_map.get(item_code.lower(), Decimal("0"))
+    def _hechos(self, **filtro):
+        """
+        Hechos de una partición (plan_month= o fecha_salida=) como tuplas Hecho.
+        Ordenados por SKU como las normalizadas: si un mismo SKU (sin distinguir
+        mayúsculas) tiene varios tipos de carga, en los lookups gana el último.
+        """
+        enteros = {
+            nombre: Cast(Round(F(campo) * 10 ** decimales), BigIntegerField())
+            for nombre, (campo, decimales) in HECHO_ENTEROS.items()
+        }
+        filas = (
+            HechoCumplimiento.objects.filter(**filtro)
+            .annotate(**enteros)
+            .order_by("sku")
+            .values_list(*HECHO_CAMPOS, *enteros)
+        )
+        return [Hecho._make(fila) for fila in filas]
 
-    def _build_resumen_cumplimiento(self, plan_date, salida_date, pvp_map):
+    def _hechos_salida(self, rango_salida):
         """
-        Construye resumen jerárquico: CEDIS → Tipo Carga → Categoría → Productos
+        Hechos de salida del rango. Con varios días la base los suma por clave (un
+        GROUP BY sobre el rango del índice (fecha_salida, cedis)): llega una fila por
+        clave, así que un mes cuesta en Python lo mismo que un día con esas claves.
         """
-        if not plan_date:
-            return []
-        
-        # Obtener planificaciones
-        plan_qs = (
-            PlanificacionNormalizada.objects
-            .filter(plan_month=plan_date)
-            .select_related("cedis_origen", "product")
+        if rango_salida.desde == rango_salida.hasta:
+            return self._hechos(fecha_salida=rango_salida.desde)
+        sumas = {
+            nombre: Cast(Round(Sum(campo) * 10 ** decimales), BigIntegerField())
+            for nombre, (campo, decimales) in HECHO_ENTEROS.items()
+        }
+        filas = (
+            HechoCumplimiento.objects.filter(fecha_salida__range=rango_salida)
+            .values_list(*HECHO_CLAVE)
+            .annotate(_nombre=Max("nombre"), _registros=Sum("registros"), **sumas)
+            .order_by("sku")
         )
-        
-        # Obtener salidas
-        salida_qs = (
-            SalidaNormalizada.objects
-            .filter(fecha_salida=salida_date)
-            .select_related("cedis_origen", "product")
-        ) if salida_date else SalidaNormalizada.objects.none()
-        
-        # Agrupar planificaciones: cedis -> tipo_carga -> grupo -> categoria -> producto_code -> {qty, info}
-        # NOTA: Excluimos registros vacíos y "SIN TIPO" del análisis
-        plan_data = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
-        for p in plan_qs:
-            tipo_raw = p.tipo_carga.strip() if p.tipo_carga else ""
-            # Excluir registros vacíos o con "SIN TIPO"
-            if not tipo_raw or tipo_raw.upper() == "SIN TIPO":
+        return [Hecho._make(fila) for fila in filas]
+
+    def _productos(self, *hechos):
+        """Atributos de los productos de los hechos: {product_id: {group, manufacturer, ...}}"""
+        ids = {h.product_id for filas in hechos for h in filas if h.product_id}
+        if not ids:
+            return {}
+        return {
+            row["id"]: row
+            for row in Product.objects.filter(id__in=ids).values("id", *PRODUCTO_CAMPOS)
+        }
+
+    def _cargar_hechos(self, plan_date, rango_salida, con_productos=True):
+        """Lee los hechos de ambas fechas y arma una vez los lookups de planificado y tipo de carga"""
+        plan = self._hechos(plan_month=plan_date) if plan_date else []
+        salida = self._hechos_salida(rango_salida) if rango_salida else []
+        
+        plan_cedis, plan_tienda = set(), set()
+        tipo_cedis, tipo_tienda = {}, {}
+        for h in plan:
+            clave_cedis = (h.cedis_id, h.sku_key, h.sucursal_id)
+            clave_tienda = (h.sucursal_id, h.sku_key)
+            plan_cedis.add(clave_cedis)
+            plan_tienda.add(clave_tienda)
+            # tipo_carga vacío en el hecho: registros vacíos o "SIN TIPO"
+            if h.tipo_carga:
+                tipo_cedis[clave_cedis] = h.tipo_carga
+                tipo_tienda[clave_tienda] = h.tipo_carga
+        
+        return DatosTablero(
+            plan_date=plan_date,
+            rango_salida=rango_salida,
+            plan=plan,
+            salida=salida,
+            cedis_names=dict(Cendis.objects.values_list("id", "origin")),
+            tiendas={pk: (name, gerente_id) for pk, name, gerente_id in Sucursal.objects.values_list("id", "name", "gerente_id")},
+            productos=self._productos(plan, salida) if con_productos else None,
+            plan_cedis=plan_cedis,
+            plan_tienda=plan_tienda,
+            tipo_cedis=tipo_cedis,
+            tipo_tienda=tipo_tienda,
+        )
+
+    def _tienda_name(self, hecho, datos):
+        return datos.tiendas.get(hecho.sucursal_id, ("SIN TIENDA", None))[0]
+
+    def _de_gerente(self, hechos, datos, gerente_filter):
+        """Hechos de tiendas del gerente (todos si no hay filtro)"""
+        if not gerente_filter:
+            return hechos
+        return [h for h in hechos if datos.tiendas.get(h.sucursal_id, (None, None))[1] == gerente_filter.id]
+
+    def _producto_info(self, hecho, productos):
+        """Datos de la fila de producto: código y nombre del hecho, el resto del maestro"""
+        producto = productos.get(hecho.product_id, {})
+        info = {
+            'code': hecho.sku,
+            'name': hecho.nombre,
+        }
+        for campo in PRODUCTO_CAMPOS:
+            info[campo] = producto.get(campo, "")
+        return info
+
+    # -----------------------------------------------------
+    # Núcleo de agregación en enteros
+    # -----------------------------------------------------
+
+    def _cantidad(self, valor):
+        return Decimal(valor).scaleb(-DECIMALES_CANTIDAD)
+
+    def _usd(self, valor):
+        return Decimal(valor).scaleb(-DECIMALES_USD)
+
+    def _porcentaje(self, actual, planned):
+        """
+        Igual que _calc_percent pero sobre enteros de la misma escala: redondeo
+        exacto a centésimas (mitad al par, como Decimal.quantize)
+        """
+        if planned <= 0:
+            return Decimal("0")
+        cociente, resto = divmod(actual * 10000, planned)
+        if 2 * resto > planned or (2 * resto == planned and cociente % 2):
+            cociente += 1
+        return Decimal(cociente).scaleb(-2)
+
+    def _medidas_cumplimiento(self, medidas):
+        return {
+            "plan": self._cantidad(medidas[0]),
+            "salida": self._cantidad(medidas[2]),
+            "percent": self._porcentaje(medidas[2], medidas[0]),
+        }
+
+    def _medidas_tiendas(self, medidas):
+        return {
+            "plan_qty": self._cantidad(medidas[0]),
+            "plan_usd": self._usd(medidas[1]),
+            "salida_plan_qty": self._cantidad(medidas[2]),
+            "salida_plan_usd": self._usd(medidas[3]),
+            "percent_qty": self._porcentaje(medidas[2], medidas[0]),
+            "percent_usd": self._porcentaje(medidas[3], medidas[1]),
+        }
+
+    def _totales(self, name, t):
+        """Fila de totales (cedis o tienda) desde [plan_qty, plan_usd, salida_plan_qty, salida_plan_usd, salida_noplan_qty, salida_noplan_usd]"""
+        return {
+            "name": name,
+            "plan_qty": self._cantidad(t[0]),
+            "plan_usd": self._usd(t[1]),
+            "salida_plan_qty": self._cantidad(t[2]),
+            "salida_plan_usd": self._usd(t[3]),
+            "percent_qty": self._porcentaje(t[2], t[0]),
+            "percent_usd": self._porcentaje(t[3], t[1]),
+            "salida_noplan_qty": self._cantidad(t[4]),
+            "salida_noplan_usd": self._usd(t[5]),
+            "total_salida_qty": self._cantidad(t[2] + t[4]),
+            "total_salida_usd": self._usd(t[3] + t[5]),
+        }
+
+    def _sumar_totales(self, plan, salida, raiz, planificado):
+        """{raíz: totales en enteros} (ver _totales); `planificado(h)` separa las salidas planificadas"""
+        totales = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+        for h in plan:
+            t = totales[raiz(h)]
+            t[0] += h.plan_qty_int
+            t[1] += h.plan_usd_int
+        for h in salida:
+            t = totales[raiz(h)]
+            i = 2 if planificado(h) else 4
+            t[i] += h.salida_qty_int
+            t[i + 1] += h.salida_usd_int
+        return totales
+
+    def _hojas(self, datos, plan, salida, raiz, tipo_salida):
+        """
+        Suma los hechos por (raíz, tipo de carga, grupo, categoría, código):
+        {clave: [plan_qty, plan_usd, salida_qty, salida_usd]} en enteros, y los
+        datos del producto de cada hoja (de su primera planificación o, si no fue
+        planificado, de su primera salida). Las planificaciones SIN TIPO no entran.
+        """
+        hojas = {}
+        info = {}
+        for h in plan:
+            if not h.tipo_carga:
                 continue
-            # Normalizar: quitar prefijos numéricos "1. ", "2. ", etc.
-            tipo = tipo_raw.split('. ', 1)[-1] if '. ' in tipo_raw else tipo_raw
-            cedis_name = p.cedis_origen.origin if p.cedis_origen else "SIN CEDIS"
-            grupo = p.product.group.strip() if p.product and p.product.group else "SIN GRUPO"
-            categoria = p.product.category.strip() if p.product and p.product.category else "SIN CATEGORÍA"
-            producto_code = p.item_code if p.item_code else "SIN CÓDIGO"
-            qty = Decimal(p.a_despachar_total or 0)
-            
-            # Inicializar o actualizar
-            if producto_code not in plan_data[cedis_name][tipo][grupo][categoria]:
-                plan_data[cedis_name][tipo][grupo][categoria][producto_code] = {
-                    'qty': Decimal('0'),
-                    'code': p.item_code or "",
-                    'name': p.item_name or "",
-                    'group': p.product.group if p.product else "",
-                    'manufacturer': p.product.manufacturer if p.product else "",
-                    'category': p.product.category if p.product else "",
-                    'subcategory': p.product.subcategory if p.product else "",
-                    'size': p.product.size if p.product else "",
-                }
-            plan_data[cedis_name][tipo][grupo][categoria][producto_code]['qty'] += qty
+            clave = (raiz(h), h.tipo_carga, h.grupo, h.categoria, h.sku or "SIN CÓDIGO")
+            medidas = hojas.get(clave)
+            if medidas is None:
+                medidas = hojas[clave] = [0, 0, 0, 0]
+                info[clave] = self._producto_info(h, datos.productos)
+            medidas[0] += h.plan_qty_int
+            medidas[1] += h.plan_usd_int
+        for h in salida:
+            clave = (raiz(h), tipo_salida(h), h.grupo, h.categoria, h.sku or "SIN CÓDIGO")
+            medidas = hojas.get(clave)
+            if medidas is None:
+                medidas = hojas[clave] = [0, 0, 0, 0]
+                info[clave] = self._producto_info(h, datos.productos)
+            medidas[2] += h.salida_qty_int
+            medidas[3] += h.salida_usd_int
+        return hojas, info
+
+    def _orden(self, nivel, nombre, medidas):
+        """
+        Clave de orden de un nodo entre sus hermanos, la misma para los árboles y
+        para las filas de los exports: tipos de carga (nivel 1) por TIPO_ORDER; raíces,
+        grupos, categorías y productos por % de cumplimiento de mayor a menor. A
+        igualdad, por `nombre` (el valor de la clave de la hoja en ese nivel).
+        """
+        if nivel == 1:
+            # PRIORIDAD, LANZAMIENTO, NO PLANIFICADO y luego el resto
+            return (TIPO_ORDER.get(nombre.upper(), 99), nombre)
+        return (-self._porcentaje(medidas[2], medidas[0]), nombre)
+
+    def _jerarquia(self, hojas, info, formato):
+        """
+        Arma Tipo Carga → Grupo → Categoría → Producto bajo cada raíz a partir de
+        las hojas ordenadas, sumando enteros hacia arriba y ordenando cada nivel con
+        _orden. `formato(medidas)` da los campos de cada nodo. Devuelve
+        {raíz: (medidas, tipos)} en orden alfabético de raíz.
+        """
+        def armar(claves, nivel):
+            total = [0, 0, 0, 0]
+            nodos = []
+            for nombre, grupo in groupby(claves, key=itemgetter(nivel)):
+                if nivel == len(NIVELES):
+                    # Un producto por clave
+                    clave = next(grupo)
+                    medidas = hojas[clave]
+                    nodo = {**info[clave], **formato(medidas)}
+                else:
+                    medidas, hijos = armar(grupo, nivel + 1)
+                    nodo = {"name": nombre, **formato(medidas), NIVELES[nivel]: hijos}
+                nodos.append((self._orden(nivel, nombre, medidas), nodo))
+                for i, valor in enumerate(medidas):
+                    total[i] += valor
+            nodos.sort(key=itemgetter(0))
+            return total, [nodo for _, nodo in nodos]
+        
+        return {
+            raiz: armar(grupo, 1)
+            for raiz, grupo in groupby(sorted(hojas), key=itemgetter(0))
+        }
+
+    def _hojas_cumplimiento(self, datos):
+        """Hojas (ver _hojas) por CEDIS; las salidas toman el tipo_carga de la planificación (CEDIS, SKU, tienda)"""
+        return self._hojas(
+            datos,
+            datos.plan,
+            datos.salida,
+            raiz=lambda h: datos.cedis_names.get(h.cedis_id, "SIN CEDIS"),
+            tipo_salida=lambda h: datos.tipo_cedis.get((h.cedis_id, h.sku_key, h.sucursal_id), "NO PLANIFICADO"),
+        )
+
+    def _totales_cedis(self, datos):
+        """Totales en enteros por CEDIS, con las salidas separadas en planificadas vs no planificadas"""
+        return self._sumar_totales(
+            datos.plan,
+            datos.salida,
+            raiz=lambda h: datos.cedis_names.get(h.cedis_id, "SIN CEDIS"),
+            planificado=lambda h: (h.cedis_id, h.sku_key, h.sucursal_id) in datos.plan_cedis,
+        )
+
+    def _totales_tiendas(self, datos, gerente_filter=None):
+        """Totales en enteros por tienda (del gerente, si hay filtro), incluidas las planificaciones SIN TIPO"""
+        return self._sumar_totales(
+            self._de_gerente(datos.plan, datos, gerente_filter),
+            self._de_gerente(datos.salida, datos, gerente_filter),
+            raiz=lambda h: self._tienda_name(h, datos),
+            planificado=lambda h: (h.sucursal_id, h.sku_key) in datos.plan_tienda,
+        )
+
+    def _filas_totales(self, totales):
+        """Filas de totales (ver _totales) ordenadas como raíces (ver _orden): de mayor a menor % de unidades"""
+        return [
+            self._totales(nombre, totales[nombre])
+            for nombre in sorted(totales, key=lambda nombre: self._orden(0, nombre, totales[nombre]))
+        ]
+
+    # -----------------------------------------------------
+    # Resúmenes
+    # -----------------------------------------------------
+
+    def _build_resumen_cumplimiento(self, datos):
+        """
+        Construye resumen jerárquico: CEDIS → Tipo Carga → Grupo → Categoría → Productos
+        """
+        if not datos.plan_date:
+            return []
         
-        # Mapear salidas a planificaciones para obtener tipo_carga
-        # Solo incluir registros con tipo válido (no vacíos ni "SIN TIPO")
-        plan_lookup = {}
-        for p in plan_qs:
-            tipo_raw = p.tipo_carga.strip() if p.tipo_carga else ""
-            # Solo guardar si tiene contenido y no es "SIN TIPO"
-            if not tipo_raw or tipo_raw.upper() == "SIN TIPO":
-                continue
-            # Normalizar
-            tipo = tipo_raw.split('. ', 1)[-1] if '. ' in tipo_raw else tipo_raw
-            key = (
-                p.cedis_origen.id if p.cedis_origen else None,
-                p.item_code.lower() if p.item_code else "",
-                p.sucursal_id
-            )
-            plan_lookup[key] = tipo
+        hojas, info = self._hojas_cumplimiento(datos)
+        jerarquia = self._jerarquia(hojas, info, self._medidas_cumplimiento)
         
-        # Agrupar salidas: cedis -> tipo_carga -> grupo -> categoria -> producto_code -> {qty, info}
-        salida_data = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
-        for s in salida_qs:
-            cedis_name = s.cedis_origen.origin if s.cedis_origen else "SIN CEDIS"
-            grupo = s.product.group.strip() if s.product and s.product.group else "SIN GRUPO"
-            categoria = s.product.category.strip() if s.product and s.product.category else "SIN CATEGORÍA"
-            producto_code = s.sku if s.sku else "SIN CÓDIGO"
-            qty = Decimal(s.cantidad or 0)
-            
-            # Buscar tipo_carga de la planificación correspondiente
-            key = (
-                s.cedis_origen_id,
-                s.sku.lower() if s.sku else "",
-                s.sucursal_destino_id
+        # CEDIS de mayor a menor por porcentaje de cumplimiento
+        return [
+            {"name": cedis_name, **self._medidas_cumplimiento(medidas), "tipos": tipos}
+            for cedis_name, (medidas, tipos) in sorted(
+                jerarquia.items(), key=lambda item: self._orden(0, item[0], item[1][0])
             )
-            tipo = plan_lookup.get(key, "NO PLANIFICADO")
-            
-            # Inicializar o actualizar
-            if producto_code not in salida_data[cedis_name][tipo][grupo][categoria]:
-                salida_data[cedis_name][tipo][grupo][categoria][producto_code] = {
-                    'qty': Decimal('0'),
-                    'code': s.sku or "",
-                    'name': s.descripcion or "",
-                    'group': s.product.group if s.product else "",
-                    'manufacturer': s.product.manufacturer if s.product else "",
-                    'category': s.product.category if s.product else "",
-                    'subcategory': s.product.subcategory if s.product else "",
-                    'size': s.product.size if s.product else "",
-                }
-            salida_data[cedis_name][tipo][grupo][categoria][producto_code]['qty'] += qty
-        
-        # Construir estructura de resultado
-        result = []
-        all_cedis = sorted(set(plan_data.keys()) | set(salida_data.keys()))
-        
-        for cedis_name in all_cedis:
-            cedis_plan = plan_data.get(cedis_name, {})
-            cedis_salida = salida_data.get(cedis_name, {})
-            
-            # Ordenar tipos en orden específico: PRIORIDAD, LANZAMIENTO, NO PLANIFICADO
-            tipo_order = {"PRIORIDAD": 0, "LANZAMIENTO": 1, "NO PLANIFICADO": 2}
-            all_tipos = sorted(set(cedis_plan.keys()) | set(cedis_salida.keys()), 
-                             key=lambda x: tipo_order.get(x.upper(), 99))
-            
-            tipos_list = []
-            cedis_total_plan = Decimal("0")
-            cedis_total_salida = Decimal("0")
-            
-            for tipo in all_tipos:
-                tipo_plan = cedis_plan.get(tipo, {})
-                tipo_salida = cedis_salida.get(tipo, {})
-                
-                all_grupos = sorted(set(tipo_plan.keys()) | set(tipo_salida.keys()))
-                
-                grupos_list = []
-                tipo_total_plan = Decimal("0")
-                tipo_total_salida = Decimal("0")
-                
-                for grupo in all_grupos:
-                    grupo_plan = tipo_plan.get(grupo, {})
-                    grupo_salida = tipo_salida.get(grupo, {})
-                    
-                    all_categorias = sorted(set(grupo_plan.keys()) | set(grupo_salida.keys()))
-                    
-                    categorias_list = []
-                    grupo_total_plan = Decimal("0")
-                    grupo_total_salida = Decimal("0")
-                    
-                    for categoria in all_categorias:
-                        categoria_plan = grupo_plan.get(categoria, {})
-                        categoria_salida = grupo_salida.get(categoria, {})
-                        
-                        all_productos = sorted(set(categoria_plan.keys()) | set(categoria_salida.keys()))
-                        
-                        productos_list = []
-                        categoria_total_plan = Decimal("0")
-                        categoria_total_salida = Decimal("0")
-                        
-                        for producto_code in all_productos:
-                            plan_info = categoria_plan.get(producto_code, {})
-                            salida_info = categoria_salida.get(producto_code, {})
-                            
-                            plan_qty = plan_info.get('qty', Decimal("0")) if plan_info else Decimal("0")
-                            salida_qty = salida_info.get('qty', Decimal("0")) if salida_info else Decimal("0")
-                            
-                            # Tomar info del producto de planificación, si no existe de salida
-                            info = plan_info if plan_info else salida_info
-                            
-                            percent = self._calc_percent(salida_qty, plan_qty)
-                            
-                            productos_list.append({
-                                "code": info.get('code', ''),
-                                "name": info.get('name', ''),
-                                "group": info.get('group', ''),
-                                "manufacturer": info.get('manufacturer', ''),
-                                "category": info.get('category', ''),
-                                "subcategory": info.get('subcategory', ''),
-                                "size": info.get('size', ''),
-                                "plan": plan_qty,
-                                "salida": salida_qty,
-                                "percent": percent,
-                            })
-                            
-                            categoria_total_plan += plan_qty
-                            categoria_total_salida += salida_qty
-                        
-                        # Ordenar productos de mayor a menor por porcentaje de cumplimiento
-                        productos_list.sort(key=lambda x: x["percent"], reverse=True)
-                        
-                        categoria_percent = self._calc_percent(categoria_total_salida, categoria_total_plan)
-                        
-                        categorias_list.append({
-                            "name": categoria,
-                            "plan": categoria_total_plan,
-                            "salida": categoria_total_salida,
-                            "percent": categoria_percent,
-                            "productos": productos_list,
-                        })
-                        
-                        grupo_total_plan += categoria_total_plan
-                        grupo_total_salida += categoria_total_salida
-                    
-                    # Ordenar categorías de mayor a menor por porcentaje de cumplimiento
-                    categorias_list.sort(key=lambda x: x["percent"], reverse=True)
-                    
-                    grupo_percent = self._calc_percent(grupo_total_salida, grupo_total_plan)
-                    
-                    grupos_list.append({
-                        "name": grupo,
-                        "plan": grupo_total_plan,
-                        "salida": grupo_total_salida,
-                        "percent": grupo_percent,
-                        "categorias": categorias_list,
-                    })
-                    
-                    tipo_total_plan += grupo_total_plan
-                    tipo_total_salida += grupo_total_salida
-                
-                
-                # Ordenar grupos de mayor a menor por porcentaje de cumplimiento
-                grupos_list.sort(key=lambda x: x["percent"], reverse=True)
-                
-                tipo_percent = self._calc_percent(tipo_total_salida, tipo_total_plan)
-                
-                tipos_list.append({
-                    "name": tipo,
-                    "plan": tipo_total_plan,
-                    "salida": tipo_total_salida,
-                    "percent": tipo_percent,
-                    "grupos": grupos_list,
-                })
-                
-                cedis_total_plan += tipo_total_plan
-                cedis_total_salida += tipo_total_salida
-            
-            # Ordenar tipos en orden específico: PRIORIDAD, LANZAMIENTO, NO PLANIFICADO
-            tipo_order = {"PRIORIDAD": 0, "LANZAMIENTO": 1, "NO PLANIFICADO": 2}
-            tipos_list.sort(key=lambda x: tipo_order.get(x["name"].upper(), 99))
-            
-            cedis_percent = self._calc_percent(cedis_total_salida, cedis_total_plan)
-            
-            result.append({
-                "name": cedis_name,
-                "plan": cedis_total_plan,
-                "salida": cedis_total_salida,
-                "percent": cedis_percent,
-                "tipos": tipos_list,
-            })
-        
-        # Ordenar CEDIS de mayor a menor por porcentaje de cumplimiento
-        result.sort(key=lambda x: x["percent"], reverse=True)
-        
-        return result
+        ]
 
-    def _build_resumen_cedis(self, plan_date, salida_date, pvp_map):
+    def _build_resumen_cedis(self, datos):
         """
         Construye resumen por CEDIS con unidades y USD
         """
-        if not plan_date:
+        if not datos.plan_date:
             return []
         
-        # Obtener planificaciones
-        plan_qs = (
-            PlanificacionNormalizada.objects
-            .filter(plan_month=plan_date)
-            .select_related("cedis_origen", "product")
-        )
-        
-        # Obtener salidas
-        salida_qs = (
-            SalidaNormalizada.objects
-            .filter(fecha_salida=salida_date)
-            .select_related("cedis_origen", "product")
-        ) if salida_date else SalidaNormalizada.objects.none()
-        
-        # Crear lookup de planificaciones por (cedis, sku, sucursal)
-        plan_lookup = set()
-        for p in plan_qs:
-            key = (
-                p.cedis_origen_id,
-                p.item_code.lower() if p.item_code else "",
-                p.sucursal_id
-            )
-            plan_lookup.add(key)
-        
-        # Agrupar planificaciones por CEDIS
-        plan_by_cedis = defaultdict(lambda: {"qty": Decimal("0"), "usd": Decimal("0")})
-        for p in plan_qs:
-            cedis_name = p.cedis_origen.origin if p.cedis_origen else "SIN CEDIS"
-            qty = Decimal(p.a_despachar_total or 0)
-            price = self._get_price(p.item_code, pvp_map)
-            plan_by_cedis[cedis_name]["qty"] += qty
-            plan_by_cedis[cedis_name]["usd"] += qty * price
-        
-        # Agrupar salidas por CEDIS (separando planificadas vs no planificadas)
-        salida_plan_by_cedis = defaultdict(lambda: {"qty": Decimal("0"), "usd": Decimal("0")})
-        salida_noplan_by_cedis = defaultdict(lambda: {"qty": Decimal("0"), "usd": Decimal("0")})
-        
-        for s in salida_qs:
-            cedis_name = s.cedis_origen.origin if s.cedis_origen else "SIN CEDIS"
-            qty = Decimal(s.cantidad or 0)
-            price = self._get_price(s.sku, pvp_map)
-            
-            # Verificar si estaba planificada
-            key = (
-                s.cedis_origen_id,
-                s.sku.lower() if s.sku else "",
-                s.sucursal_destino_id
-            )
-            
-            if key in plan_lookup:
-                salida_plan_by_cedis[cedis_name]["qty"] += qty
-                salida_plan_by_cedis[cedis_name]["usd"] += qty * price
-            else:
-                salida_noplan_by_cedis[cedis_name]["qty"] += qty
-                salida_noplan_by_cedis[cedis_name]["usd"] += qty * price
-        
-        # Construir resultado
-        result = []
-        all_cedis = sorted(set(plan_by_cedis.keys()) | set(salida_plan_by_cedis.keys()) | set(salida_noplan_by_cedis.keys()))
-        
-        for cedis_name in all_cedis:
-            plan = plan_by_cedis.get(cedis_name, {"qty": Decimal("0"), "usd": Decimal("0")})
-            salida_plan = salida_plan_by_cedis.get(cedis_name, {"qty": Decimal("0"), "usd": Decimal("0")})
-            salida_noplan = salida_noplan_by_cedis.get(cedis_name, {"qty": Decimal("0"), "usd": Decimal("0")})
-            
-            total_salida_qty = salida_plan["qty"] + salida_noplan["qty"]
-            total_salida_usd = salida_plan["usd"] + salida_noplan["usd"]
-            
-            result.append({
-                "name": cedis_name,
-                "plan_qty": plan["qty"],
-                "plan_usd": plan["usd"],
-                "salida_plan_qty": salida_plan["qty"],
-                "salida_plan_usd": salida_plan["usd"],
-                "percent_qty": self._calc_percent(salida_plan["qty"], plan["qty"]),
-                "percent_usd": self._calc_percent(salida_plan["usd"], plan["usd"]),
-                "salida_noplan_qty": salida_noplan["qty"],
-                "salida_noplan_usd": salida_noplan["usd"],
-                "total_salida_qty": total_salida_qty,
-                "total_salida_usd": total_salida_usd,
-            })
-        
-        # Ordenar CEDIS de mayor a menor por porcentaje de cumplimiento
-        result.sort(key=lambda x: x["percent_qty"], reverse=True)
-        
-        return result
+        return self._filas_totales(self._totales_cedis(datos))
 
-    def _build_resumen_tiendas(self, plan_date, salida_date, pvp_map, gerente_filter=None):
+    def _build_totales_tiendas(self, datos, gerente_filter=None):
         """
-        Construye resumen por Tienda con jerarquía: Tienda → Tipo Carga → Grupo → Categoría → Producto
-        Mantiene los totales correctos incluyendo TODAS las planificaciones y separando salidas planificadas vs no planificadas
+        Construye el resumen por Tienda (solo totales, sin jerarquía)
+        Mantiene los totales correctos incluyendo TODAS las planificaciones (también SIN TIPO) y separando salidas planificadas vs no planificadas
         Si gerente_filter está definido, solo muestra tiendas de ese gerente.
         """
-        if not plan_date:
+        if not datos.plan_date:
             return []
         
-        # Obtener planificaciones
-        plan_qs = (
-            PlanificacionNormalizada.objects
-            .filter(plan_month=plan_date)
-            .select_related("sucursal", "sucursal__gerente", "product")
-        )
-        
-        # Filtrar por gerente si está definido
-        if gerente_filter:
-            plan_qs = plan_qs.filter(sucursal__gerente=gerente_filter)
-        
-        # Obtener salidas
-        salida_qs = (
-            SalidaNormalizada.objects
-            .filter(fecha_salida=salida_date)
-            .select_related("sucursal_destino", "sucursal_destino__gerente", "product")
-        ) if salida_date else SalidaNormalizada.objects.none()
-        
-        # Filtrar salidas por gerente si está definido
-        if gerente_filter and salida_date:
-            salida_qs = salida_qs.filter(sucursal_destino__gerente=gerente_filter)
-        
-        # Crear lookup de planificaciones por (sucursal, sku) - incluye TODOS los registros
-        plan_lookup_set = set()
-        for p in plan_qs:
-            key = (p.sucursal_id, p.item_code.lower() if p.item_code else "")
-            plan_lookup_set.add(key)
-        
-        # Totales por tienda - incluye TODAS las planificaciones
-        tienda_totals = defaultdict(lambda: {
-            "plan_qty": Decimal("0"),
-            "plan_usd": Decimal("0"),
-            "salida_plan_qty": Decimal("0"),
-            "salida_plan_usd": Decimal("0"),
-            "salida_noplan_qty": Decimal("0"),
-            "salida_noplan_usd": Decimal("0"),
-        })
-        
-        # Sumar TODAS las planificaciones (incluyendo SIN TIPO)
-        for p in plan_qs:
-            tienda_name = p.sucursal.name if p.sucursal else "SIN TIENDA"
-            qty = Decimal(p.a_despachar_total or 0)
-            price = self._get_price(p.item_code, pvp_map)
-            tienda_totals[tienda_name]["plan_qty"] += qty
-            tienda_totals[tienda_name]["plan_usd"] += qty * price
-        
-        # Sumar salidas y clasificarlas como planificadas o no planificadas
-        for s in salida_qs:
-            tienda_name = s.sucursal_destino.name if s.sucursal_destino else "SIN TIENDA"
-            qty = Decimal(s.cantidad or 0)
-            price = self._get_price(s.sku, pvp_map)
-            
-            key = (s.sucursal_destino_id, s.sku.lower() if s.sku else "")
-            if key in plan_lookup_set:
-                tienda_totals[tienda_name]["salida_plan_qty"] += qty
-                tienda_totals[tienda_name]["salida_plan_usd"] += qty * price
-            else:
-                tienda_totals[tienda_name]["salida_noplan_qty"] += qty
-                tienda_totals[tienda_name]["salida_noplan_usd"] += qty * price
-        
-        # Agrupar planificaciones para jerarquía: tienda -> tipo_carga -> grupo -> categoria -> producto_code
-        # Excluimos SIN TIPO solo de la JERARQUÍA visual, no de los totales
-        plan_data = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
-        plan_lookup_tipo = {}
-        
-        for p in plan_qs:
-            tipo_raw = p.tipo_carga.strip() if p.tipo_carga else ""
-            # Para la jerarquía visual, excluir SIN TIPO
-            if not tipo_raw or tipo_raw.upper() == "SIN TIPO":
-                continue
-            tipo = tipo_raw.split('. ', 1)[-1] if '. ' in tipo_raw else tipo_raw
-            tienda_name = p.sucursal.name if p.sucursal else "SIN TIENDA"
-            grupo = p.product.group.strip() if p.product and p.product.group else "SIN GRUPO"
-            categoria = p.product.category.strip() if p.product and p.product.category else "SIN CATEGORÍA"
-            producto_code = p.item_code if p.item_code else "SIN CÓDIGO"
-            qty = Decimal(p.a_despachar_total or 0)
-            price = self._get_price(p.item_code, pvp_map)
-            
-            # Guardar tipo para el lookup de salidas
-            key = (p.sucursal_id, p.item_code.lower() if p.item_code else "")
-            plan_lookup_tipo[key] = tipo
-            
-            if producto_code not in plan_data[tienda_name][tipo][grupo][categoria]:
-                plan_data[tienda_name][tipo][grupo][categoria][producto_code] = {
-                    'qty': Decimal('0'),
-                    'usd': Decimal('0'),
-                    'code': p.item_code or "",
-                    'name': p.item_name or "",
-                    'group': p.product.group if p.product else "",
-                    'manufacturer': p.product.manufacturer if p.product else "",
-                    'category': p.product.category if p.product else "",
-                    'subcategory': p.product.subcategory if p.product else "",
-                    'size': p.product.size if p.product else "",
-                }
-            plan_data[tienda_name][tipo][grupo][categoria][producto_code]['qty'] += qty
-            plan_data[tienda_name][tipo][grupo][categoria][producto_code]['usd'] += qty * price
-        
-        # Agrupar salidas para jerarquía
-        salida_data = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict))))
-        for s in salida_qs:
-            tienda_name = s.sucursal_destino.name if s.sucursal_destino else "SIN TIENDA"
-            grupo = s.product.group.strip() if s.product and s.product.group else "SIN GRUPO"
-            categoria = s.product.category.strip() if s.product and s.product.category else "SIN CATEGORÍA"
-            producto_code = s.sku if s.sku else "SIN CÓDIGO"
-            qty = Decimal(s.cantidad or 0)
-            price = self._get_price(s.sku, pvp_map)
-            
-            key = (s.sucursal_destino_id, s.sku.lower() if s.sku else "")
-            tipo = plan_lookup_tipo.get(key, "NO PLANIFICADO")
-            
-            if producto_code not in salida_data[tienda_name][tipo][grupo][categoria]:
-                salida_data[tienda_name][tipo][grupo][categoria][producto_code] = {
-                    'qty': Decimal('0'),
-                    'usd': Decimal('0'),
-                    'code': s.sku or "",
-                    'name': s.descripcion or "",
-                    'group': s.product.group if s.product else "",
-                    'manufacturer': s.product.manufacturer if s.product else "",
-                    'category': s.product.category if s.product else "",
-                    'subcategory': s.product.subcategory if s.product else "",
-                    'size': s.product.size if s.product else "",
-                }
-            salida_data[tienda_name][tipo][grupo][categoria][producto_code]['qty'] += qty
-            salida_data[tienda_name][tipo][grupo][categoria][producto_code]['usd'] += qty * price
-        
-        # Construir estructura de resultado
-        result = []
-        all_tiendas = sorted(set(tienda_totals.keys()) | set(plan_data.keys()) | set(salida_data.keys()))
-        
-        for tienda_name in all_tiendas:
-            tienda_plan = plan_data.get(tienda_name, {})
-            tienda_salida = salida_data.get(tienda_name, {})
-            totals = tienda_totals.get(tienda_name, {
-                "plan_qty": Decimal("0"), "plan_usd": Decimal("0"),
-                "salida_plan_qty": Decimal("0"), "salida_plan_usd": Decimal("0"),
-                "salida_noplan_qty": Decimal("0"), "salida_noplan_usd": Decimal("0"),
-            })
-            
-            tipo_order = {"PRIORIDAD": 0, "LANZAMIENTO": 1, "NO PLANIFICADO": 2}
-            all_tipos = sorted(set(tienda_plan.keys()) | set(tienda_salida.keys()), 
-                             key=lambda x: tipo_order.get(x.upper(), 99))
-            
-            tipos_list = []
-            
-            for tipo in all_tipos:
-                tipo_plan = tienda_plan.get(tipo, {})
-                tipo_salida = tienda_salida.get(tipo, {})
-                
-                all_grupos = sorted(set(tipo_plan.keys()) | set(tipo_salida.keys()))
-                
-                grupos_list = []
-                tipo_total_plan_qty = Decimal("0")
-                tipo_total_plan_usd = Decimal("0")
-                tipo_total_salida_qty = Decimal("0")
-                tipo_total_salida_usd = Decimal("0")
-                
-                for grupo in all_grupos:
-                    grupo_plan = tipo_plan.get(grupo, {})
-                    grupo_salida = tipo_salida.get(grupo, {})
-                    
-                    all_categorias = sorted(set(grupo_plan.keys()) | set(grupo_salida.keys()))
-                    
-                    categorias_list = []
-                    grupo_total_plan_qty = Decimal("0")
-                    grupo_total_plan_usd = Decimal("0")
-                    grupo_total_salida_qty = Decimal("0")
-                    grupo_total_salida_usd = Decimal("0")
-                    
-                    for categoria in all_categorias:
-                        categoria_plan = grupo_plan.get(categoria, {})
-                        categoria_salida = grupo_salida.get(categoria, {})
-                        
-                        all_productos = sorted(set(categoria_plan.keys()) | set(categoria_salida.keys()))
-                        
-                        productos_list = []
-                        categoria_total_plan_qty = Decimal("0")
-                        categoria_total_plan_usd = Decimal("0")
-                        categoria_total_salida_qty = Decimal("0")
-                        categoria_total_salida_usd = Decimal("0")
-                        
-                        for producto_code in all_productos:
-                            plan_info = categoria_plan.get(producto_code, {})
-                            salida_info = categoria_salida.get(producto_code, {})
-                            
-                            plan_qty = plan_info.get('qty', Decimal("0")) if plan_info else Decimal("0")
-                            plan_usd = plan_info.get('usd', Decimal("0")) if plan_info else Decimal("0")
-                            salida_qty = salida_info.get('qty', Decimal("0")) if salida_info else Decimal("0")
-                            salida_usd = salida_info.get('usd', Decimal("0")) if salida_info else Decimal("0")
-                            
-                            info = plan_info if plan_info else salida_info
-                            
-                            percent_qty = self._calc_percent(salida_qty, plan_qty)
-                            percent_usd = self._calc_percent(salida_usd, plan_usd)
-                            
-                            productos_list.append({
-                                "code": info.get('code', ''),
-                                "name": info.get('name', ''),
-                                "group": info.get('group', ''),
-                                "manufacturer": info.get('manufacturer', ''),
-                                "category": info.get('category', ''),
-                                "subcategory": info.get('subcategory', ''),
-                                "size": info.get('size', ''),
-                                "plan_qty": plan_qty,
-                                "plan_usd": plan_usd,
-                                "salida_plan_qty": salida_qty,
-                                "salida_plan_usd": salida_usd,
-                                "percent_qty": percent_qty,
-                                "percent_usd": percent_usd,
-                            })
-                            
-                            categoria_total_plan_qty += plan_qty
-                            categoria_total_plan_usd += plan_usd
-                            categoria_total_salida_qty += salida_qty
-                            categoria_total_salida_usd += salida_usd
-                        
-                        productos_list.sort(key=lambda x: x["percent_qty"], reverse=True)
-                        
-                        categorias_list.append({
-                            "name": categoria,
-                            "plan_qty": categoria_total_plan_qty,
-                            "plan_usd": categoria_total_plan_usd,
-                            "salida_plan_qty": categoria_total_salida_qty,
-                            "salida_plan_usd": categoria_total_salida_usd,
-                            "percent_qty": self._calc_percent(categoria_total_salida_qty, categoria_total_plan_qty),
-                            "percent_usd": self._calc_percent(categoria_total_salida_usd, categoria_total_plan_usd),
-                            "productos": productos_list,
-                        })
-                        
-                        grupo_total_plan_qty += categoria_total_plan_qty
-                        grupo_total_plan_usd += categoria_total_plan_usd
-                        grupo_total_salida_qty += categoria_total_salida_qty
-                        grupo_total_salida_usd += categoria_total_salida_usd
-                    
-                    categorias_list.sort(key=lambda x: x["percent_qty"], reverse=True)
-                    
-                    grupos_list.append({
-                        "name": grupo,
-                        "plan_qty": grupo_total_plan_qty,
-                        "plan_usd": grupo_total_plan_usd,
-                        "salida_plan_qty": grupo_total_salida_qty,
-                        "salida_plan_usd": grupo_total_salida_usd,
-                        "percent_qty": self._calc_percent(grupo_total_salida_qty, grupo_total_plan_qty),
-                        "percent_usd": self._calc_percent(grupo_total_salida_usd, grupo_total_plan_usd),
-                        "categorias": categorias_list,
-                    })
-                    
-                    tipo_total_plan_qty += grupo_total_plan_qty
-                    tipo_total_plan_usd += grupo_total_plan_usd
-                    tipo_total_salida_qty += grupo_total_salida_qty
-                    tipo_total_salida_usd += grupo_total_salida_usd
-                
-                grupos_list.sort(key=lambda x: x["percent_qty"], reverse=True)
-                
-                tipos_list.append({
-                    "name": tipo,
-                    "plan_qty": tipo_total_plan_qty,
-                    "plan_usd": tipo_total_plan_usd,
-                    "salida_plan_qty": tipo_total_salida_qty,
-                    "salida_plan_usd": tipo_total_salida_usd,
-                    "percent_qty": self._calc_percent(tipo_total_salida_qty, tipo_total_plan_qty),
-                    "percent_usd": self._calc_percent(tipo_total_salida_usd, tipo_total_plan_usd),
-                    "grupos": grupos_list,
-                })
-            
-            tipo_order = {"PRIORIDAD": 0, "LANZAMIENTO": 1, "NO PLANIFICADO": 2}
-            tipos_list.sort(key=lambda x: tipo_order.get(x["name"].upper(), 99))
-            
-            # Usar totales REALES (incluyendo SIN TIPO) para la tienda
-            total_salida_qty = totals["salida_plan_qty"] + totals["salida_noplan_qty"]
-            total_salida_usd = totals["salida_plan_usd"] + totals["salida_noplan_usd"]
-            
-            result.append({
-                "name": tienda_name,
-                "plan_qty": totals["plan_qty"],
-                "plan_usd": totals["plan_usd"],
-                "salida_plan_qty": totals["salida_plan_qty"],
-                "salida_plan_usd": totals["salida_plan_usd"],
-                "salida_noplan_qty": totals["salida_noplan_qty"],
-                "salida_noplan_usd": totals["salida_noplan_usd"],
-                "total_salida_qty": total_salida_qty,
-                "total_salida_usd": total_salida_usd,
-                "percent_qty": self._calc_percent(totals["salida_plan_qty"], totals["plan_qty"]),
-                "percent_usd": self._calc_percent(totals["salida_plan_usd"], totals["plan_usd"]),
-                "tipos": tipos_list,
-            })
-        
-        result.sort(key=lambda x: x["percent_qty"], reverse=True)
+        result = self._filas_totales(self._totales_tiendas(datos, gerente_filter))
+        for tienda in result:
+            tienda["tipos"] = []
         
         return result
 
-    def _calculate_nacional(self, resumen_tiendas, plan_date, salida_date):
+    def _build_jerarquia_tiendas(self, resumen_tiendas, datos, gerente_filter=None):
+        """
+        Completa cada tienda de `resumen_tiendas` con su jerarquía: Tipo Carga → Grupo → Categoría → Producto
+        (sin SIN TIPO; los totales de la tienda sí lo incluyen)
+        """
+        hojas, info = self._hojas(
+            datos,
+            self._de_gerente(datos.plan, datos, gerente_filter),
+            self._de_gerente(datos.salida, datos, gerente_filter),
+            raiz=lambda h: self._tienda_name(h, datos),
+            tipo_salida=lambda h: datos.tipo_tienda.get((h.sucursal_id, h.sku_key), "NO PLANIFICADO"),
+        )
+        jerarquia = self._jerarquia(hojas, info, self._medidas_tiendas)
+        for tienda in resumen_tiendas:
+            if tienda["name"] in jerarquia:
+                tienda["tipos"] = jerarquia[tienda["name"]][1]
+
+    def _calculate_nacional(self, resumen_tiendas, datos):
         """Calcula totales nacionales incluyendo conteo de registros y tiendas"""
         total = {
             "plan_qty": Decimal("0"),
@@ -805,11 +687,9 @@ class TableroNormalizadoView(View):
         total["percent_usd"] = self._calc_percent(total["salida_plan_usd"], total["plan_usd"])
         total["percent_tiendas"] = self._calc_percent(Decimal(total["tiendas_despachadas"]), Decimal(total["tiendas_planificadas"]))
         
-        # Contar registros totales de planificación y salida
-        if plan_date:
-            total["total_plan_registros"] = PlanificacionNormalizada.objects.filter(plan_month=plan_date).count()
-        if salida_date:
-            total["total_salida_registros"] = SalidaNormalizada.objects.filter(fecha_salida=salida_date).count()
+        # Contar registros totales de planificación y salida (filas normalizadas agregadas en los hechos)
+        total["total_plan_registros"] = sum(h.registros for h in datos.plan)
+        total["total_salida_registros"] = sum(h.registros for h in datos.salida)
         
         return total
 
@@ -819,81 +699,174 @@ class TableroNormalizadoView(View):
             return ((actual / planned) * Decimal("100")).quantize(Decimal("0.01"))
         return Decimal("0")
 
-    def _export_cumplimiento_csv(self, data, plan_date, salida_date):
-        response = HttpResponse(content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = f'attachment; filename="cumplimiento_{plan_date}_{salida_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(["CEDIS", "Tipo Carga", "Categoría", "Producto", "Planificado", "Despachado", "% Cumplimiento"])
-        
-        for cedis in data:
-            for tipo in cedis["tipos"]:
-                for categoria in tipo["categorias"]:
-                    for producto in categoria["productos"]:
-                        writer.writerow([
-                            cedis["name"],
-                            tipo["name"],
-                            categoria["name"],
-                            producto["name"],
-                            str(producto["plan"]),
-                            str(producto["salida"]),
-                            f'{producto["percent"]}%'
-                        ])
+    def _filas(self, export, datos, gerente_filter=None):
+        """
+        Filas planas del export (valores sin formato, en el orden de COLUMNAS[export])
+        para CSV y Excel, directamente de los agregados planos: las hojas de
+        cumplimiento y los totales por CEDIS o tienda. Las hojas se ordenan con
+        _orden nivel por nivel, con los totales de cada prefijo de su clave, igual
+        que los árboles del tablero.
+        """
+        if not datos.plan_date:
+            return
+        if export != "cumplimiento":
+            totales = self._totales_cedis(datos) if export == "cedis" else self._totales_tiendas(datos, gerente_filter)
+            for row in self._filas_totales(totales):
+                yield [
+                    row["name"],
+                    row["plan_qty"],
+                    row["plan_usd"],
+                    row["salida_plan_qty"],
+                    row["salida_plan_usd"],
+                    row["percent_qty"],
+                    row["percent_usd"],
+                    row["salida_noplan_qty"],
+                    row["salida_noplan_usd"],
+                    row["total_salida_qty"],
+                    row["total_salida_usd"],
+                ]
+            return
+        
+        hojas, info = self._hojas_cumplimiento(datos)
+        prefijos = defaultdict(lambda: [0, 0, 0, 0])
+        for clave, medidas in hojas.items():
+            for nivel in range(1, len(NIVELES) + 1):
+                total = prefijos[clave[:nivel]]
+                for i, valor in enumerate(medidas):
+                    total[i] += valor
+        
+        def orden(clave):
+            return tuple(
+                self._orden(nivel, clave[nivel], hojas[clave] if nivel == len(NIVELES) else prefijos[clave[:nivel + 1]])
+                for nivel in range(len(NIVELES) + 1)
+            )
         
-        return response
+        for clave in sorted(hojas, key=orden):
+            medidas = hojas[clave]
+            yield [
+                *clave[:len(NIVELES)],
+                info[clave]["name"],
+                self._cantidad(medidas[0]),
+                self._cantidad(medidas[2]),
+                self._porcentaje(medidas[2], medidas[0]),
+            ]
 
-    def _export_cedis_csv(self, data, plan_date, salida_date):
-        response = HttpResponse(content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = f'attachment; filename="resumen_cedis_{plan_date}_{salida_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            "CEDIS", "Unid. Plan.", "USD Plan.", "Unid. Plan. Despachadas", "USD Plan. Despachados",
-            "% Unid. Plan.", "% USD Plan.", "Unid. NO Plan.", "USD NO Plan.",
-            "Total Unid. Despachadas", "Total USD Despachados"
-        ])
-        
-        for row in data:
-            writer.writerow([
-                row["name"],
-                str(row["plan_qty"]),
-                str(row["plan_usd"]),
-                str(row["salida_plan_qty"]),
-                str(row["salida_plan_usd"]),
-                f'{row["percent_qty"]}%',
-                f'{row["percent_usd"]}%',
-                str(row["salida_noplan_qty"]),
-                str(row["salida_noplan_usd"]),
-                str(row["total_salida_qty"]),
-                str(row["total_salida_usd"]),
-            ])
-        
+    def _export_csv(self, export, filas, plan_date, rango_salida):
+        """CSV en streaming: las filas se escriben por bloques a medida que se generan"""
+        columnas = COLUMNAS[export]
+        writer = csv.writer(_Eco())
+        
+        def bloques():
+            # BOM una sola vez al inicio (Excel reconoce UTF-8)
+            bloque = ["\ufeff", writer.writerow([titulo for titulo, _ in columnas])]
+            for fila in filas:
+                bloque.append(writer.writerow([
+                    f"{valor}%" if formato == "porcentaje" else str(valor)
+                    for valor, (_, formato) in zip(fila, columnas)
+                ]))
+                if len(bloque) >= CSV_FILAS_POR_BLOQUE:
+                    yield "".join(bloque)
+                    bloque = []
+            yield "".join(bloque)
+        
+        response = StreamingHttpResponse(bloques(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = (
+            f'attachment; filename="{self._nombre_archivo(ARCHIVOS[export], plan_date, rango_salida, "csv")}"'
+        )
         return response
 
-    def _export_tiendas_csv(self, data, plan_date, salida_date):
-        response = HttpResponse(content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = f'attachment; filename="resumen_tiendas_{plan_date}_{salida_date}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            "Tienda", "Unid. Plan.", "USD Plan.", "Unid. Plan. Despachadas", "USD Plan. Despachados",
-            "% Unid. Plan.", "% USD Plan.", "Unid. NO Plan.", "USD NO Plan.",
-            "Total Unid. Despachadas", "Total USD Despachados"
-        ])
-        
-        for row in data:
-            writer.writerow([
-                row["name"],
-                str(row["plan_qty"]),
-                str(row["plan_usd"]),
-                str(row["salida_plan_qty"]),
-                str(row["salida_plan_usd"]),
-                f'{row["percent_qty"]}%',
-                f'{row["percent_usd"]}%',
-                str(row["salida_noplan_qty"]),
-                str(row["salida_noplan_usd"]),
-                str(row["total_salida_qty"]),
-                str(row["total_salida_usd"]),
-            ])
-        
-        return response
+    def _nombre_archivo(self, base, plan_date, rango_salida, extension):
+        """Nombre del export con las fechas seleccionadas (sin las que no hay)"""
+        partes = [base, *(str(fecha) for fecha in (plan_date, rango_salida) if fecha)]
+        return f"{'_'.join(partes)}.{extension}"
+
+    def _export_xlsx(self, plan_date, rango_salida, gerente_filter=None):
+        """
+        Excel con una hoja por pestaña, celdas numéricas y de fecha con formato y
+        encabezado fijo. Las filas son las mismas (y del mismo cache) que las de los
+        CSV (ver _filas_export). El libro es write-only (openpyxl vuelca cada fila a
+        disco) y se guarda en un archivo temporal que se envía por bloques.
+        """
+        # Sin hechos de salida no hay rango: las columnas de salidas quedan vacías
+        fechas = [plan_date, *(rango_salida or (None, None))]
+        wb = Workbook(write_only=True)
+        negrita = Font(bold=True)
+        for export, titulo_hoja in HOJAS_XLSX:
+            ws = wb.create_sheet(titulo_hoja)
+            ws.freeze_panes = "A2"
+            columnas = COLUMNAS_FECHAS + COLUMNAS[export]
+            for i, (_, formato) in enumerate(columnas, start=1):
+                ws.column_dimensions[get_column_letter(i)].width = ANCHOS_XLSX[formato]
+            
+            encabezado = []
+            for titulo, _ in columnas:
+                celda = WriteOnlyCell(ws, value=titulo)
+                celda.font = negrita
+                encabezado.append(celda)
+            ws.append(encabezado)
+            
+            for fila in self._filas_export(export, plan_date, rango_salida, gerente_filter):
+                ws.append([
+                    self._celda_xlsx(ws, valor, formato)
+                    for valor, (_, formato) in zip([*fechas, *fila], columnas)
+                ])
+        
+        archivo = tempfile.TemporaryFile()
+        wb.save(archivo)
+        archivo.seek(0)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=self._nombre_archivo("tablero", plan_date, rango_salida, "xlsx"),
+            content_type=XLSX_CONTENT_TYPE,
+        )
+
+    def _celda_xlsx(self, ws, valor, formato):
+        if formato == "texto" or valor is None:
+            return valor
+        if formato == "porcentaje":
+            # Los porcentajes del tablero van de 0 a 100; Excel los quiere de 0 a 1
+            valor = valor / 100
+        celda = WriteOnlyCell(ws, value=valor)
+        celda.number_format = FORMATOS_XLSX[formato]
+        return celda
+
+
+class TableroNivelView(TableroNormalizadoView):
+    """
+    Un nivel de los árboles del tablero (JSON), para desplegarlos bajo demanda.
+
+    `arbol` es cumplimiento (CEDIS → Tipo Carga → Grupo → Categoría → Producto) o
+    tiendas (Tienda → ...); `ruta` (repetible) son los nombres del nodo a abrir desde
+    la raíz. Devuelve sus hijos con totales y porcentajes, sin los niveles de abajo.
+    """
+
+    def get(self, request, *args, **kwargs):
+        arbol = request.GET.get("arbol")
+        ruta = request.GET.getlist("ruta")
+        if arbol not in ARBOLES or len(ruta) > len(NIVELES):
+            return JsonResponse({"error": "Parámetros inválidos"}, status=400)
+        
+        plan_date, rango_salida, _, _, selected_gerente = self._parametros(request)
+        nodos = self._resumen(ARBOLES[arbol], plan_date, rango_salida, selected_gerente)
+        for nivel, nombre in zip(NIVELES, ruta):
+            nodo = next((n for n in nodos if n["name"] == nombre), None)
+            if nodo is None:
+                return JsonResponse({"error": f"No existe: {' / '.join(ruta)}"}, status=404)
+            nodos = nodo[nivel]
+        
+        hijos = NIVELES[len(ruta)] if len(ruta) < len(NIVELES) else None
+        return JsonResponse({
+            "arbol": arbol,
+            "ruta": ruta,
+            "nivel": NIVELES[len(ruta) - 1] if ruta else arbol,
+            "nodos": [self._nodo(n, hijos) for n in nodos],
+        })
+
+    def _nodo(self, nodo, hijos):
+        """El nodo sin sus hijos (solo cuántos tiene)"""
+        if hijos is None:
+            return nodo
+        resumen = {k: v for k, v in nodo.items() if k != hijos}
+        resumen["hijos"] = len(nodo[hijos])
+        return resumen
@@ -0,0 +1,14 @@
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+
+from ..models import Tarea
+from ..services.tareas import status_payload
+
+
+class TareaEstadoView(View):
+    """Estado de una tarea en segundo plano (JSON) para la barra de progreso."""
+
+    def get(self, request, pk, *args, **kwargs):
+        tarea = get_object_or_404(Tarea, pk=pk)
+        return JsonResponse(status_payload(tarea))